@@ -0,0 +1,198 @@
+"""Admission control for CPU-heavy endpoints.
+
+Each limited endpoint (timetable generation and export by default) runs at
+most `concurrency` requests at once; later ones wait in a bounded FIFO
+queue. Generation is also limited to one in-flight run per department: a
+queued request whose department is busy lets requests for other departments
+go first, so one department cannot monopolise the solver.
+
+A request that finds the queue full gets 429, and one that waits longer
+than the queue timeout gets 503, both with a Retry-After estimated from
+recent service times. Limits are per process; under gunicorn multiply by
+the worker count.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from flask import current_app, g, jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+import metrics
+
+class Rejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class _Ticket:
+    """A queued request; compared by identity so equal keys stay distinct"""
+
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+class Limiter:
+    """Concurrency limit with a bounded wait queue and optional per-key exclusivity"""
+
+    def __init__(self, name: str, concurrency: int, max_queue: int, queue_timeout: float,
+                 per_department: bool = False):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.per_department = per_department
+        self._condition = threading.Condition()
+        self._running = 0
+        self._busy_keys = set()
+        self._queue = deque()
+        self._average_seconds = None
+
+    def _can_run(self, key) -> bool:
+        return self._running < self.concurrency and (key is None or key not in self._busy_keys)
+
+    def _next_eligible(self):
+        """First queued ticket that could run now, skipping busy departments"""
+        if self._running >= self.concurrency:
+            return None
+        for ticket in self._queue:
+            if ticket.key is None or ticket.key not in self._busy_keys:
+                return ticket
+        return None
+
+    def _admit(self, key):
+        self._running += 1
+        if key is not None:
+            self._busy_keys.add(key)
+        metrics.ADMISSION_IN_FLIGHT.set(self._running, endpoint=self.name)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to free up for a new request"""
+        average = self._average_seconds or 1.0
+        waves = (len(self._queue) + self._running) / self.concurrency
+        return max(1, math.ceil(average * max(waves, 1)))
+
+    def acquire(self, key=None):
+        """Block until admitted; raises Rejected when the queue is full or the wait times out"""
+        key = key if self.per_department else None
+        with self._condition:
+            if not self._queue and self._can_run(key):
+                self._admit(key)
+                return
+            if len(self._queue) >= self.max_queue:
+                raise Rejected('queue_full', self.retry_after())
+
+            ticket = _Ticket(key)
+            self._queue.append(ticket)
+            metrics.ADMISSION_QUEUED.set(len(self._queue), endpoint=self.name)
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self._next_eligible() is not ticket:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise Rejected('timeout', self.retry_after())
+                    self._condition.wait(remaining)
+                self._admit(key)
+            finally:
+                self._queue.remove(ticket)
+                metrics.ADMISSION_QUEUED.set(len(self._queue), endpoint=self.name)
+                # Whoever is next may be eligible now that this ticket left the queue
+                self._condition.notify_all()
+
+    def release(self, key=None, elapsed: Optional[float] = None):
+        key = key if self.per_department else None
+        with self._condition:
+            self._running -= 1
+            self._busy_keys.discard(key)
+            if elapsed is not None:
+                self._average_seconds = (elapsed if self._average_seconds is None
+                                         else 0.8 * self._average_seconds + 0.2 * elapsed)
+            metrics.ADMISSION_IN_FLIGHT.set(self._running, endpoint=self.name)
+            self._condition.notify_all()
+
+    def info(self) -> Dict:
+        with self._condition:
+            return {'concurrency': self.concurrency, 'running': self._running, 'queued': len(self._queue),
+                    'max_queue': self.max_queue, 'per_department': self.per_department}
+
+def default_limits(environ=os.environ) -> Dict:
+    """Limits per endpoint, from GENERATE_* and EXPORT_* environment variables
+
+    Queued requests hold a server thread while they wait, so the defaults
+    (running plus queued across both endpoints) stay below the four threads
+    of a gunicorn worker, leaving one for cheap routes.
+    """
+    timeout = float(environ.get('ADMISSION_QUEUE_TIMEOUT', '30'))
+    return {
+        'api.generate_timetable': {
+            'concurrency': int(environ.get('GENERATE_CONCURRENCY', '1')),
+            'max_queue': int(environ.get('GENERATE_QUEUE', '1')),
+            'queue_timeout': timeout,
+            'per_department': True
+        },
+        'api.export_timetable': {
+            'concurrency': int(environ.get('EXPORT_CONCURRENCY', '1')),
+            'max_queue': int(environ.get('EXPORT_QUEUE', '0')),
+            'queue_timeout': timeout,
+            'per_department': False
+        }
+    }
+
+def _department_key():
+    data = request.get_json(silent=True) or {}
+    try:
+        return int(data.get('department_id'))
+    except (TypeError, ValueError):
+        return None
+
+def _admit_request():
+    limiter = current_app.extensions['admission'].get(request.endpoint)
+    if limiter is None:
+        return None
+    # Unauthenticated requests are left to the view's 401 instead of taking a queue slot
+    try:
+        verify_jwt_in_request(optional=True)
+    except Exception:
+        return None
+    if get_jwt_identity() is None:
+        return None
+
+    key = _department_key()
+    start = time.perf_counter()
+    try:
+        limiter.acquire(key)
+    except Rejected as e:
+        metrics.ADMISSION_REJECTED.inc(endpoint=limiter.name, reason=e.reason)
+        if e.reason == 'queue_full':
+            response = jsonify({'error': 'Too many requests; try again later', 'retry_after': e.retry_after})
+            response.status_code = 429
+        else:
+            response = jsonify({'error': 'Timed out waiting for capacity; try again later',
+                                'retry_after': e.retry_after})
+            response.status_code = 503
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    admitted = time.perf_counter()
+    metrics.ADMISSION_WAIT_SECONDS.observe(admitted - start, endpoint=limiter.name)
+    g._admission = (limiter, key, admitted)
+    return None
+
+def _release_request(exc=None):
+    admission = g.pop('_admission', None)
+    if admission is not None:
+        limiter, key, admitted = admission
+        limiter.release(key, time.perf_counter() - admitted)
+
+def init_app(app):
+    """Install admission hooks for ADMISSION_LIMITS (endpoint -> limiter settings)"""
+    if not app.config.get('ADMISSION_ENABLED', True):
+        return
+    limits = app.config.get('ADMISSION_LIMITS') or default_limits()
+    app.extensions['admission'] = {endpoint: Limiter(endpoint, **settings) for endpoint, settings in limits.items()}
+    app.before_request(_admit_request)
+    app.teardown_request(_release_request)
@@ -1,164 +1,517 @@
 
-import sqlite3
 import json
 import random
-from typing import Dict, List, Tuple
-import requests
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
 import os
 from datetime import datetime
+import db
+import demand
+import department_cache
+import metrics
+import occupancy
+import schedules
+import solver_checkpoint
+import substitutes
+from timetable_slots import DAYS, TIME_SLOTS
+
+class CancellationToken:
+    """Cooperative cancellation flag shared between a caller and a running solve"""
 
-class TimetableGenerator:
     def __init__(self):
-        self.days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-        self.time_slots = [
-            '9:00-10:00', '10:00-11:00', '11:15-12:15', 
-            '12:15-1:15', '2:15-3:15', '3:15-4:15', '4:30-5:30'
-        ]
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+
+class TimetableGenerator:
+    # How many assignments are placed between budget/cancellation checks
+    STOP_CHECK_INTERVAL = 32
+    # Place lectures of the most loaded staff first in every pass (random order otherwise)
+    HARDEST_FIRST = True
+
+    def __init__(self, db_path: Optional[str] = None, checkpoint_dir: Optional[str] = None,
+                 checkpoint_interval: float = solver_checkpoint.DEFAULT_INTERVAL, seed: Optional[int] = None):
+        self.days = list(DAYS)
+        self.time_slots = list(TIME_SLOTS)
         self.groq_api_key = os.getenv('GROQ_API_KEY')
+        self.db_path = db_path
+        # Solver randomness comes from this instance so its state can be checkpointed
+        self.rng = random.Random(seed)
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_interval = checkpoint_interval
+        self.solve_stats = {}
+        self.unplaced_assignments = []
+        self._progress = None
         
-    def generate_timetable(self, department_id: int) -> Dict:
-        """Generate optimized timetable for a department"""
+    def generate_timetable(self, department_id: int, time_budget: Optional[float] = None,
+                           cancel_token: Optional[CancellationToken] = None, progress=None,
+                           refine: bool = False, dry_run: bool = False, resume: bool = True) -> Dict:
+        """Generate optimized timetable for a department
+
+        time_budget is a wall-clock limit in seconds. When it expires, or when
+        cancel_token is cancelled, the best timetable found so far is returned
+        and flagged as partial. The budget never cuts the first pass short, so
+        there is always a complete pass to return. Cancelled runs are not
+        saved, and a partial run is saved only if it places at least as many
+        lectures as the department's saved timetable.
+
+        progress, if given, is called as progress(event, **data) with 'phase',
+        'progress' and 'best' events while the solve runs.
+
+        refine asks the configured LLM (GROQ_API_KEY) to place lectures the
+        solver left unplaced; only suggestions passing the conflict check apply.
+
+        dry_run solves without saving and adds a diff against the saved
+        timetable (see timetable_diff).
+
+        With a checkpoint_dir the solver state is checkpointed every
+        checkpoint_interval seconds, and a checkpoint left by an interrupted
+        solve of the department is resumed unless resume is False.
+        """
+        self._progress = progress
         try:
-            conn = sqlite3.connect('timetable.db')
+            started = time.monotonic()
+            deadline = started + time_budget if time_budget is not None else None
+
+            load_started = time.perf_counter()
+            self._emit('phase', phase='load')
+            conn = db.connect(self.db_path)
             cursor = conn.cursor()
             
-            # Get department data
-            cursor.execute('SELECT name FROM departments WHERE id = ?', (department_id,))
-            dept_data = cursor.fetchone()
-            if not dept_data:
+            # Department, staff, subjects and classrooms come from the resident cache
+            model = department_cache.get_model(cursor, department_id)
+            if model is None:
                 return {'error': 'Department not found'}
             
-            # Get staff and their subjects
+            # Entries locked by manual edits are kept as they are
             cursor.execute('''
-                SELECT u.id, u.name, u.staff_role, u.subjects_selected
-                FROM users u
-                WHERE u.department_id = ? AND u.role = 'staff' AND u.subjects_locked = 1
+                SELECT id, day, time_slot, subject_id, staff_id, classroom_id
+                FROM timetables WHERE department_id = ? AND locked = 1
             ''', (department_id,))
-            staff_data = cursor.fetchall()
-            
-            # Get subjects
-            cursor.execute('SELECT id, name, code FROM subjects WHERE department_id = ?', 
-                          (department_id,))
-            subjects_data = cursor.fetchall()
-            
-            # Get classrooms
-            cursor.execute('SELECT id, name, capacity FROM classrooms WHERE department_id = ?', 
-                          (department_id,))
-            classrooms_data = cursor.fetchall()
+            locked_data = cursor.fetchall()
             
             conn.close()
             
-            if not staff_data or not subjects_data or not classrooms_data:
+            staff_subjects = model.locked_staff()
+            if not staff_subjects or not model.subjects or not model.classrooms:
                 return {'error': 'Insufficient data for timetable generation'}
             
             # Process data
-            staff_subjects = {}
-            for staff in staff_data:
-                if staff[3]:  # subjects_selected
-                    subject_ids = [int(s) for s in staff[3].split(',')]
-                    staff_subjects[staff[0]] = {
-                        'name': staff[1],
-                        'role': staff[2],
-                        'subjects': subject_ids
-                    }
-            
-            subjects_dict = {s[0]: {'name': s[1], 'code': s[2]} for s in subjects_data}
-            classrooms_dict = {c[0]: {'name': c[1], 'capacity': c[2]} for c in classrooms_data}
+            subjects_dict = {s.id: {'name': s.name, 'code': s.code, 'credits': s.credits,
+                                    'subject_type': s.subject_type} for s in model.subjects}
+            classrooms_dict = {c.id: {'name': c.name, 'capacity': c.capacity} for c in model.classrooms}
+            locked_entries = self._locked_entries(locked_data, staff_subjects, subjects_dict, classrooms_dict)
+            metrics.SOLVER_PHASE_SECONDS.observe(time.perf_counter() - load_started, phase='load')
+            
+            checkpointer = None
+            if self.checkpoint_dir:
+                checkpointer = solver_checkpoint.Checkpointer.for_department(
+                    self.checkpoint_dir, department_id, db.database_path(self.db_path), self.checkpoint_interval)
+                if not resume:
+                    checkpointer.discard_all()
             
             # Generate timetable using AI optimization
-            timetable = self._optimize_timetable(staff_subjects, subjects_dict, classrooms_dict)
+            timetable = self._optimize_timetable(staff_subjects, subjects_dict, classrooms_dict,
+                                                 deadline=deadline, cancel_token=cancel_token,
+                                                 locked_entries=locked_entries, checkpointer=checkpointer)
+            
+            refinement = None
+            if refine and self.solve_stats['stop_reason'] != 'cancelled':
+                timetable, refinement = self._refine_timetable(timetable, classrooms_dict, deadline)
             
-            # Save timetable to database
-            self._save_timetable(department_id, timetable)
+            # Save timetable to database, or compare it with the saved one on a dry run
+            diff = None
+            if dry_run:
+                with metrics.SOLVER_PHASE_SECONDS.time(phase='diff'):
+                    diff = self._diff_with_saved(department_id, timetable)
+            saved = self.solve_stats['stop_reason'] != 'cancelled' and not dry_run
+            if saved and self.solve_stats['partial']:
+                saved = len(timetable) >= self._saved_entry_count(department_id)
+            if saved:
+                self._emit('phase', phase='save')
+                with metrics.SOLVER_PHASE_SECONDS.time(phase='save'):
+                    self._save_timetable(department_id, timetable)
+            if not self.solve_stats['partial']:
+                metrics.SOLVER_UNPLACED.inc(self.solve_stats['unplaced'])
+                metrics.SOLVER_LAST_UNPLACED.set(self.solve_stats['unplaced'], department_id=department_id)
+            # The run ended normally, so there is nothing to resume
+            if checkpointer is not None:
+                checkpointer.discard()
             
             return {
                 'success': True,
                 'timetable': timetable,
-                'department': dept_data[0],
-                'generated_at': datetime.now().isoformat()
+                'department': model.name,
+                'generated_at': datetime.now().isoformat(),
+                'partial': self.solve_stats['partial'],
+                'stop_reason': self.solve_stats['stop_reason'],
+                'unplaced_count': self.solve_stats['unplaced'],
+                'saved': saved,
+                'refinement': refinement,
+                'dry_run': dry_run,
+                'diff': diff,
+                'resumed': self.solve_stats['resumed'],
+                'elapsed_seconds': round(time.monotonic() - started, 3)
             }
             
         except Exception as e:
             return {'error': str(e)}
     
-    def _optimize_timetable(self, staff_subjects: Dict, subjects_dict: Dict, classrooms_dict: Dict) -> List:
-        """AI-powered timetable optimization"""
-        timetable = []
-        used_slots = set()  # (day, time_slot, classroom_id)
-        staff_schedule = {}  # staff_id: [(day, time_slot)]
-        
-        # Create assignments for each staff-subject combination
+    def _optimize_timetable(self, staff_subjects: Dict, subjects_dict: Dict, classrooms_dict: Dict,
+                            deadline: Optional[float] = None,
+                            cancel_token: Optional[CancellationToken] = None,
+                            locked_entries: Optional[List] = None,
+                            checkpointer: Optional[solver_checkpoint.Checkpointer] = None) -> List:
+        """AI-powered timetable optimization
+
+        Without a deadline a single placement pass is made. With a deadline the
+        solver keeps restarting from fresh shuffles until every lecture is placed
+        or the budget runs out, returning the best timetable seen so far.
+
+        locked_entries stay where they are: their slots are taken before
+        placement starts and each one stands in for one of its lectures.
+
+        Lecture counts come from the credit-based demand vector (see demand),
+        and each pass places the lectures of the most loaded staff first,
+        shuffling only among equally loaded ones.
+
+        With a checkpointer the state is saved between placements whenever
+        it is due, and a checkpoint for the same inputs is resumed from
+        the exact pass position and RNG state it was taken at.
+        """
+        locked_entries = locked_entries or []
+        self._emit('phase', phase='build_assignments')
+        with metrics.SOLVER_PHASE_SECONDS.time(phase='build_assignments'):
+            assignments = self._without_locked(self._build_assignments(staff_subjects, subjects_dict),
+                                               locked_entries)
+        locked_slots = {(e['day'], e['time_slot'], e['classroom_id']) for e in locked_entries}
+        locked_staff_slots = {(e['staff_id'], e['day'], e['time_slot']) for e in locked_entries}
+        self._emit('phase', phase='place', total=len(assignments))
+        place_started = time.perf_counter()
+        classroom_ids = list(classrooms_dict.keys())
+        difficulty = [assignment['difficulty'] for assignment in assignments]
+
+        def should_stop() -> Optional[str]:
+            if cancel_token is not None and cancel_token.cancelled:
+                return 'cancelled'
+            # The budget only applies once a pass has completed
+            if deadline is not None and passes and time.monotonic() >= deadline:
+                return 'time_budget'
+            return None
+
+        best = None
+        best_from = []  # assignment index of each entry in best
+        best_unplaced = list(range(len(assignments)))  # assignment indices
+        passes = 0
+        stop_reason = 'completed'
+        current = None  # (order, position, placed, placed_from, unplaced) of a pass to continue
+
+        saved = None
+        if checkpointer is not None:
+            saved = checkpointer.load(solver_checkpoint.fingerprint(assignments, classroom_ids, locked_entries,
+                                                                    db.database_path(self.db_path)))
+        if saved is not None:
+            self.rng.setstate(solver_checkpoint.restore_rng_state(saved['rng']))
+            passes = saved['passes']
+            if saved['best'] is not None:
+                best, best_from = self._decode_placements(saved['best'], assignments, classrooms_dict)
+                best_unplaced = saved['best_unplaced']
+            placed, placed_from = self._decode_placements(saved['pass']['placed'], assignments, classrooms_dict)
+            current = (saved['pass']['order'], saved['pass']['position'], placed, placed_from,
+                       saved['pass']['unplaced'])
+            self._emit('resumed', passes=passes, position=current[1], total=len(assignments))
+
+        def checkpoint(order, position, placed, placed_from, unplaced):
+            if not checkpointer.due():
+                return
+            checkpointer.save({
+                'rng': solver_checkpoint.rng_state(self.rng.getstate()),
+                'passes': passes,
+                'best': None if best is None else self._encode_placements(best, best_from),
+                'best_unplaced': best_unplaced,
+                'pass': {'order': order, 'position': position, 'unplaced': unplaced,
+                         'placed': self._encode_placements(placed, placed_from)}
+            })
+
+        while True:
+            if current is None:
+                # Shuffle for randomization; the stable sort keeps it among equal difficulties
+                order = list(range(len(assignments)))
+                self.rng.shuffle(order)
+                if self.HARDEST_FIRST:
+                    order.sort(key=difficulty.__getitem__, reverse=True)
+                current = (order, 0, [], [], [])
+
+            placed, placed_from, unplaced, interrupted = self._place_assignments(
+                assignments, *current, classrooms_dict, classroom_ids, should_stop, locked_slots,
+                locked_staff_slots, checkpoint if checkpointer is not None else None)
+            current = None
+            passes += 1
+
+            # Keep the best solution seen so far
+            if best is None or len(placed) > len(best):
+                best = placed
+                best_from = placed_from
+                best_unplaced = unplaced
+                self._emit('best', passes=passes, placed=len(best), unplaced=len(best_unplaced),
+                           score=round(len(best) / len(assignments), 4) if assignments else 1.0)
+
+            if interrupted:
+                stop_reason = interrupted
+                break
+            if not best_unplaced or deadline is None:
+                break
+            stop_reason = should_stop()
+            if stop_reason:
+                break
+            stop_reason = 'completed'
+
+        metrics.SOLVER_PHASE_SECONDS.observe(time.perf_counter() - place_started, phase='place')
+
+        self.unplaced_assignments = [assignments[index] for index in best_unplaced]
+        for assignment in self.unplaced_assignments if stop_reason == 'completed' else []:
+            print(f"Could not assign: {assignment['subject_name']} to {assignment['staff_name']}")
+
+        self.solve_stats = {
+            'partial': stop_reason != 'completed',
+            'stop_reason': stop_reason,
+            'passes': passes,
+            'placed': len(best) + len(locked_entries),
+            'unplaced': len(best_unplaced),
+            'locked': len(locked_entries),
+            'resumed': saved is not None,
+            'checkpoint_writes': checkpointer.writes if checkpointer is not None else 0,
+            'checkpoint_seconds': checkpointer.write_seconds if checkpointer is not None else 0.0
+        }
+
+        return sorted(best + locked_entries, key=lambda x: (self.days.index(x['day']), self.time_slots.index(x['time_slot'])))
+
+    def _encode_placements(self, placed: List, placed_from: List) -> List[int]:
+        """Flat [assignment index, day index, slot index, classroom id, ...] for a checkpoint"""
+        day_index = {day: i for i, day in enumerate(self.days)}
+        slot_index = {slot: i for i, slot in enumerate(self.time_slots)}
+        flat = []
+        for entry, assignment_index in zip(placed, placed_from):
+            flat.extend((assignment_index, day_index[entry['day']], slot_index[entry['time_slot']],
+                         entry['classroom_id']))
+        return flat
+
+    def _decode_placements(self, flat: List[int], assignments: List, classrooms_dict: Dict) -> Tuple[List, List]:
+        placed, placed_from = [], []
+        for i in range(0, len(flat), 4):
+            assignment_index, day, time_slot, classroom_id = flat[i:i + 4]
+            placed.append(self._entry(assignments[assignment_index], self.days[day], self.time_slots[time_slot],
+                                      classroom_id, classrooms_dict))
+            placed_from.append(assignment_index)
+        return placed, placed_from
+
+    def _refine_timetable(self, timetable: List, classrooms_dict: Dict,
+                          deadline: Optional[float]) -> Tuple[List, Dict]:
+        """Optional LLM pass over the lectures the solver could not place"""
+        from llm_refine import LLMRefiner
+
+        refiner = LLMRefiner(api_key=self.groq_api_key)
+        if not refiner.enabled:
+            return timetable, {'skipped': 'GROQ_API_KEY is not set'}
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return timetable, {'skipped': 'time budget exhausted'}
+            refiner.timeout = min(refiner.timeout, remaining)
+
+        self._emit('phase', phase='refine', unplaced=len(self.unplaced_assignments))
+        with metrics.SOLVER_PHASE_SECONDS.time(phase='refine'):
+            timetable, self.unplaced_assignments, stats = refiner.refine(
+                timetable, self.unplaced_assignments, self.days, self.time_slots, classrooms_dict)
+
+        self.solve_stats['unplaced'] = len(self.unplaced_assignments)
+        self.solve_stats['placed'] = len(timetable)
+        timetable = sorted(timetable, key=lambda x: (self.days.index(x['day']), self.time_slots.index(x['time_slot'])))
+        return timetable, stats
+
+    def _saved_entry_count(self, department_id: int) -> int:
+        conn = db.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT COUNT(*) FROM timetables WHERE department_id = ?', (department_id,))
+            return cursor.fetchone()[0]
+        finally:
+            conn.close()
+
+    def _diff_with_saved(self, department_id: int, timetable: List) -> Dict:
+        from timetable_diff import diff_timetables, saved_entries
+
+        self._emit('phase', phase='diff')
+        conn = db.connect(self.db_path)
+        try:
+            saved = saved_entries(conn.cursor(), department_id)
+        finally:
+            conn.close()
+        return diff_timetables(saved, timetable)
+
+    def _emit(self, event: str, **data):
+        if self._progress is not None:
+            self._progress(event, **data)
+
+    def _build_assignments(self, staff_subjects: Dict, subjects_dict: Dict) -> List:
+        """One assignment per weekly hour of the demand vector
+
+        difficulty is the staff member's total weekly hours: the more of
+        the week a staff member must teach, the fewer slots each of their
+        lectures can take.
+        """
+        vector = demand.demand_vector(staff_subjects, subjects_dict)
+        totals = demand.staff_totals(vector)
         assignments = []
-        for staff_id, staff_info in staff_subjects.items():
-            for subject_id in staff_info['subjects']:
-                # Each subject gets 3-4 slots per week based on credits
-                slots_needed = 3 if staff_info['role'] == 'assistant_professor' else 4
-                for _ in range(slots_needed):
-                    assignments.append({
-                        'staff_id': staff_id,
-                        'staff_name': staff_info['name'],
-                        'subject_id': subject_id,
-                        'subject_name': subjects_dict[subject_id]['name'],
-                        'subject_code': subjects_dict[subject_id]['code']
-                    })
-        
-        # Shuffle for randomization
-        random.shuffle(assignments)
-        
-        # Assign slots using constraint satisfaction
+        for staff_id, subject_id, hours in vector:
+            for _ in range(hours):
+                assignments.append({
+                    'staff_id': staff_id,
+                    'staff_name': staff_subjects[staff_id]['name'],
+                    'subject_id': subject_id,
+                    'subject_name': subjects_dict[subject_id]['name'],
+                    'subject_code': subjects_dict[subject_id]['code'],
+                    'difficulty': totals[staff_id]
+                })
+        return assignments
+
+    def _locked_entries(self, locked_data: List, staff_subjects: Dict, subjects_dict: Dict,
+                        classrooms_dict: Dict) -> List:
+        """Timetable entries for locked rows, skipping ones whose subject or room is gone"""
+        entries = []
+        for entry_id, day, time_slot, subject_id, staff_id, classroom_id in locked_data:
+            if subject_id not in subjects_dict or classroom_id not in classrooms_dict:
+                continue
+            entries.append({
+                'id': entry_id,
+                'day': day,
+                'time_slot': time_slot,
+                'subject_id': subject_id,
+                'subject_name': subjects_dict[subject_id]['name'],
+                'subject_code': subjects_dict[subject_id]['code'],
+                'staff_id': staff_id,
+                'staff_name': staff_subjects.get(staff_id, {}).get('name'),
+                'classroom_id': classroom_id,
+                'classroom_name': classrooms_dict[classroom_id]['name'],
+                'locked': True
+            })
+        return entries
+
+    def _without_locked(self, assignments: List, locked_entries: List) -> List:
+        """Drop one assignment per locked entry of the same staff and subject"""
+        covered = {}
+        for entry in locked_entries:
+            key = (entry['staff_id'], entry['subject_id'])
+            covered[key] = covered.get(key, 0) + 1
+        remaining = []
         for assignment in assignments:
+            key = (assignment['staff_id'], assignment['subject_id'])
+            if covered.get(key):
+                covered[key] -= 1
+            else:
+                remaining.append(assignment)
+        return remaining
+
+    def _entry(self, assignment: Dict, day: str, time_slot: str, classroom_id: int, classrooms_dict: Dict) -> Dict:
+        return {
+            'day': day,
+            'time_slot': time_slot,
+            'subject_id': assignment['subject_id'],
+            'subject_name': assignment['subject_name'],
+            'subject_code': assignment['subject_code'],
+            'staff_id': assignment['staff_id'],
+            'staff_name': assignment['staff_name'],
+            'classroom_id': classroom_id,
+            'classroom_name': classrooms_dict[classroom_id]['name']
+        }
+
+    def _place_assignments(self, assignments: List, order: List[int], start: int, timetable: List,
+                           placed_from: List, unplaced: List, classrooms_dict: Dict, classroom_ids: List,
+                           should_stop, locked_slots: Optional[set] = None,
+                           locked_staff_slots: Optional[set] = None,
+                           checkpoint=None) -> Tuple[List, List, List, Optional[str]]:
+        """Run (or continue) one placement pass over assignments in the given order
+
+        Placement starts at order[start] on top of the entries already in
+        timetable. Returns (placed, assignment index of each placed entry,
+        unplaced assignment indices, stop reason if interrupted).
+        checkpoint(order, position, placed, placed_from, unplaced), if given,
+        is offered the pass state between placements.
+        """
+        used_slots = set(locked_slots or ())  # (day, time_slot, classroom_id)
+        staff_slots = set(locked_staff_slots or ())  # (staff_id, day, time_slot)
+        for entry in timetable:
+            used_slots.add((entry['day'], entry['time_slot'], entry['classroom_id']))
+            staff_slots.add((entry['staff_id'], entry['day'], entry['time_slot']))
+        total_attempts = 0
+        rng = self.rng
+
+        # Assign slots using constraint satisfaction
+        for position in range(start, len(order)):
+            if position % self.STOP_CHECK_INTERVAL == 0:
+                if self._progress is not None:
+                    self._progress('progress', placed=len(timetable), unplaced=len(unplaced),
+                                   remaining=len(order) - position)
+                reason = should_stop()
+                if reason:
+                    unplaced.extend(order[position:])
+                    metrics.SOLVER_PLACEMENT_ATTEMPTS.inc(total_attempts)
+                    return timetable, placed_from, unplaced, reason
+                if checkpoint is not None:
+                    checkpoint(order, position, timetable, placed_from, unplaced)
+
+            assignment = assignments[order[position]]
             assigned = False
             attempts = 0
             max_attempts = 50
-            
+
             while not assigned and attempts < max_attempts:
-                day = random.choice(self.days)
-                time_slot = random.choice(self.time_slots)
-                classroom_id = random.choice(list(classrooms_dict.keys()))
-                
+                day = rng.choice(self.days)
+                time_slot = rng.choice(self.time_slots)
+                classroom_id = rng.choice(classroom_ids)
+
                 slot_key = (day, time_slot, classroom_id)
                 staff_slot_key = (assignment['staff_id'], day, time_slot)
-                
+
                 # Check constraints
-                if (slot_key not in used_slots and 
-                    staff_slot_key not in [(s[0], s[1], s[2]) for s in staff_schedule.get(assignment['staff_id'], [])]):
-                    
+                if slot_key not in used_slots and staff_slot_key not in staff_slots:
+
                     # Add to timetable
-                    timetable.append({
-                        'day': day,
-                        'time_slot': time_slot,
-                        'subject_id': assignment['subject_id'],
-                        'subject_name': assignment['subject_name'],
-                        'subject_code': assignment['subject_code'],
-                        'staff_id': assignment['staff_id'],
-                        'staff_name': assignment['staff_name'],
-                        'classroom_id': classroom_id,
-                        'classroom_name': classrooms_dict[classroom_id]['name']
-                    })
-                    
+                    timetable.append(self._entry(assignment, day, time_slot, classroom_id, classrooms_dict))
+                    placed_from.append(order[position])
+
                     used_slots.add(slot_key)
-                    if assignment['staff_id'] not in staff_schedule:
-                        staff_schedule[assignment['staff_id']] = []
-                    staff_schedule[assignment['staff_id']].append((assignment['staff_id'], day, time_slot))
+                    staff_slots.add(staff_slot_key)
                     assigned = True
-                
+
                 attempts += 1
-            
+
+            total_attempts += attempts
             if not assigned:
-                print(f"Could not assign: {assignment['subject_name']} to {assignment['staff_name']}")
-        
-        return sorted(timetable, key=lambda x: (self.days.index(x['day']), self.time_slots.index(x['time_slot'])))
-    
+                unplaced.append(order[position])
+
+        metrics.SOLVER_PLACEMENT_ATTEMPTS.inc(total_attempts)
+        return timetable, placed_from, unplaced, None
+
     def _save_timetable(self, department_id: int, timetable: List):
         """Save generated timetable to database"""
-        conn = sqlite3.connect('timetable.db')
+        conn = db.connect(self.db_path)
         cursor = conn.cursor()
         
-        # Clear existing timetable for department
-        cursor.execute('DELETE FROM timetables WHERE department_id = ?', (department_id,))
+        # Clear existing timetable for department, keeping locked entries
+        cursor.execute('DELETE FROM timetables WHERE department_id = ? AND locked = 0', (department_id,))
         
         # Insert new timetable
         for entry in timetable:
+            if entry.get('locked'):
+                continue
             cursor.execute('''
                 INSERT INTO timetables (department_id, day, time_slot, subject_id, staff_id, classroom_id)
                 VALUES (?, ?, ?, ?, ?, ?)
@@ -171,16 +524,21 @@ class TimetableGenerator:
                 entry['classroom_id']
             ))
         
+        schedules.refresh(cursor, department_id)
+        occupancy.bump_version(cursor, department_id)
         conn.commit()
         conn.close()
+        occupancy.invalidate(department_id)
+        substitutes.invalidate(department_id)
     
     def export_to_excel(self, department_id: int, file_path: str):
         """Export timetable to Excel format"""
+        started = time.perf_counter()
         try:
             import openpyxl
             from openpyxl.styles import Font, Alignment, PatternFill
             
-            conn = sqlite3.connect('timetable.db')
+            conn = db.connect(self.db_path)
             cursor = conn.cursor()
             
             # Get timetable data
@@ -230,8 +588,10 @@ class TimetableGenerator:
                 ws.column_dimensions[column_letter].width = adjusted_width
             
             wb.save(file_path)
+            metrics.EXPORT_SECONDS.observe(time.perf_counter() - started, status='success')
             return True
             
         except Exception as e:
             print(f"Excel export error: {e}")
+            metrics.EXPORT_SECONDS.observe(time.perf_counter() - started, status='error')
             return False
@@ -0,0 +1,149 @@
+"""Vectorized room and staff analytics over a saved timetable.
+
+A department's (or the campus's) timetable is loaded once into NumPy
+occupancy tensors: lectures per day x slot x room and per day x slot x
+staff member. Room utilization, teaching hours per day, idle gaps and the
+slot heatmaps are then reductions over those tensors rather than loops over
+entries. Reports are cached per scope until the scope's timetable or
+reference data version changes, i.e. until the next save or edit.
+"""
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+
+import room_index
+import timetable_slots
+
+CAMPUS = room_index.CAMPUS
+
+_reports: Dict[Optional[int], tuple] = {}  # scope -> (version, report)
+_reports_lock = threading.Lock()
+
+def _dense(ids: np.ndarray, known: np.ndarray) -> np.ndarray:
+    """Positions of ids in the sorted array known, -1 for ids not in it"""
+    if not len(known):
+        return np.full(len(ids), -1)
+    positions = np.clip(np.searchsorted(known, ids), 0, len(known) - 1)
+    return np.where(known[positions] == ids, positions, -1)
+
+def occupancy_tensors(entries, staff_ids, room_ids):
+    """Lecture counts per (day, slot, staff) and (day, slot, room)
+
+    entries is a sequence of (day, time_slot, staff_id, classroom_id);
+    staff_ids and room_ids are sorted id arrays fixing the last axis.
+    """
+    days, slots = len(timetable_slots.DAYS), len(timetable_slots.TIME_SLOTS)
+    day_index = {day: i for i, day in enumerate(timetable_slots.DAYS)}
+    slot_index = {slot: i for i, slot in enumerate(timetable_slots.TIME_SLOTS)}
+    count = len(entries)
+    day_column = np.fromiter((day_index.get(entry[0], -1) for entry in entries), dtype=np.int64, count=count)
+    slot_column = np.fromiter((slot_index.get(entry[1], -1) for entry in entries), dtype=np.int64, count=count)
+    staff_column = _dense(np.fromiter((entry[2] for entry in entries), dtype=np.int64, count=count), staff_ids)
+    room_column = _dense(np.fromiter((entry[3] for entry in entries), dtype=np.int64, count=count), room_ids)
+    placed = (day_column >= 0) & (slot_column >= 0)
+
+    def tensor(column, size):
+        keep = placed & (column >= 0)
+        flat = (day_column[keep] * slots + slot_column[keep]) * size + column[keep]
+        return np.bincount(flat, minlength=days * slots * size).reshape(days, slots, size)
+
+    return tensor(staff_column, len(staff_ids)), tensor(room_column, len(room_ids))
+
+def idle_slots(busy: np.ndarray) -> np.ndarray:
+    """Free slots between the first and last lecture of each (day, owner) in a day x slot x owner mask"""
+    slots = busy.shape[1]
+    taught = busy.sum(axis=1)
+    first = busy.argmax(axis=1)
+    last = slots - 1 - busy[:, ::-1, :].argmax(axis=1)
+    return np.where(taught > 0, last - first + 1 - taught, 0)
+
+def build_report(entries, staff, rooms) -> Dict:
+    """All analytics for one scope
+
+    staff is a list of (id, name) and rooms of (id, name, capacity).
+    """
+    staff = sorted(staff)
+    rooms = sorted(rooms)
+    staff_ids = np.array([row[0] for row in staff], dtype=np.int64)
+    room_ids = np.array([row[0] for row in rooms], dtype=np.int64)
+    staff_lectures, room_lectures = occupancy_tensors(entries, staff_ids, room_ids)
+    days, slots = timetable_slots.DAYS, timetable_slots.TIME_SLOTS
+    cells = len(days) * len(slots)
+
+    room_busy = room_lectures > 0
+    room_occupied = room_busy.sum(axis=(0, 1))
+    room_count = max(len(rooms), 1)
+    rooms_report = {
+        'summary': {
+            'rooms': len(rooms),
+            'mean_utilization': round(float(room_occupied.mean() / cells) if len(rooms) else 0.0, 4),
+            'by_day': dict(zip(days, np.round(room_busy.sum(axis=(1, 2)) / (len(slots) * room_count), 4).tolist())),
+            'by_slot': dict(zip(slots, np.round(room_busy.sum(axis=(0, 2)) / (len(days) * room_count), 4).tolist())),
+            'double_booked_slots': int((room_lectures > 1).sum())
+        },
+        'rooms': [{
+            'id': room_id, 'name': name, 'capacity': capacity, 'occupied_slots': occupied,
+            'utilization': round(occupied / cells, 4)
+        } for (room_id, name, capacity), occupied in zip(rooms, room_occupied.tolist())]
+    }
+
+    staff_busy = staff_lectures > 0
+    hours = staff_lectures.sum(axis=1)  # day x staff
+    gaps = idle_slots(staff_busy)
+    teaching_days = hours > 0
+    hours_histogram = np.bincount(hours[teaching_days], minlength=1)
+    gaps_histogram = np.bincount(gaps[teaching_days], minlength=1)
+    staff_report = {
+        'summary': {
+            'staff': len(staff),
+            'mean_weekly_hours': round(float(hours.sum(axis=0).mean()) if len(staff) else 0.0, 2),
+            'max_daily_hours': int(hours.max()) if hours.size else 0,
+            'daily_hours_histogram': {str(n): count for n, count in enumerate(hours_histogram.tolist()) if count},
+            'clashing_slots': int((staff_lectures > 1).sum())
+        },
+        'staff': [{
+            'id': staff_id, 'name': name, 'weekly_hours': sum(per_day),
+            'hours_per_day': dict(zip(days, per_day)), 'idle_slots': idle
+        } for (staff_id, name), per_day, idle in zip(staff, hours.T.tolist(), gaps.sum(axis=0).tolist())]
+    }
+
+    gaps_report = {
+        'staff_days': int(teaching_days.sum()),
+        'mean_idle_slots': round(float(gaps[teaching_days].mean()) if teaching_days.any() else 0.0, 3),
+        'idle_slots_histogram': {str(n): count for n, count in enumerate(gaps_histogram.tolist()) if count},
+        'by_day': dict(zip(days, gaps.sum(axis=1).tolist()))
+    }
+
+    heatmap = {
+        'days': days,
+        'time_slots': slots,
+        'rooms_in_use': room_busy.sum(axis=2).tolist(),
+        'room_utilization': np.round(room_busy.sum(axis=2) / room_count, 4).tolist(),
+        'staff_teaching': staff_busy.sum(axis=2).tolist()
+    }
+    return {'rooms': rooms_report, 'staff': staff_report, 'gaps': gaps_report, 'heatmap': heatmap}
+
+def load_report(cursor, department_id: Optional[int] = None) -> Optional[Dict]:
+    """Cached report for a department or CAMPUS, rebuilt after the next save; None if the department is missing"""
+    version = room_index.scope_version(cursor, department_id)
+    if version is None:
+        return None
+    with _reports_lock:
+        cached = _reports.get(department_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    where = '' if department_id is CAMPUS else ' WHERE department_id = ?'
+    params = () if department_id is CAMPUS else (department_id,)
+    cursor.execute('SELECT day, time_slot, staff_id, classroom_id FROM timetables' + where, params)
+    entries = cursor.fetchall()
+    cursor.execute("SELECT id, name FROM users WHERE role = 'staff'"
+                   + ('' if department_id is CAMPUS else ' AND department_id = ?'), params)
+    staff = cursor.fetchall()
+    cursor.execute('SELECT id, name, capacity FROM classrooms' + where, params)
+    rooms = cursor.fetchall()
+    report = build_report(entries, staff, rooms)
+    with _reports_lock:
+        _reports[department_id] = (version, report)
+    return report
@@ -1,53 +1,59 @@
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-import sqlite3
-from ai_timetable import TimetableGenerator
+import math
+import threading
+import db
+import demand
+import department_cache
+import occupancy
+import progress
+import schedules
+import semester_calendar
+import substitutes
 import os
 
 api = Blueprint('api', __name__)
 
+# Cancellation tokens of the solves running in this process, keyed by department
+_active_solves = {}
+_active_solves_lock = threading.Lock()
+
+# Largest array accepted by the batch endpoints
+BATCH_MAX_ITEMS = 5000
+
+def _user_department_model(cursor, user_id):
+    """(user found, cached model of the user's department or None) in one lookup"""
+    cursor.execute('''
+        SELECT u.department_id, d.name, d.data_version
+        FROM users u
+        LEFT JOIN departments d ON u.department_id = d.id
+        WHERE u.id = ?
+    ''', (user_id,))
+    row = cursor.fetchone()
+    if not row:
+        return False, None
+    if row[1] is None:
+        return True, None
+    return True, department_cache.get_model(cursor, row[0], row[1], row[2])
+
 # Staff management routes
 @api.route('/api/staff', methods=['GET'])
 @jwt_required()
 def get_staff():
     try:
         current_user_id = get_jwt_identity()
-        conn = sqlite3.connect('timetable.db')
+        conn = db.connect()
         cursor = conn.cursor()
         
-        # Get current user's department
-        cursor.execute('SELECT department_id, role FROM users WHERE id = ?', (current_user_id,))
-        user_data = cursor.fetchone()
-        
-        if not user_data:
-            return jsonify({'error': 'User not found'}), 404
-        
-        department_id = user_data[0]
-        
-        # Get staff in the same department
-        cursor.execute('''
-            SELECT u.id, u.name, u.email, u.staff_role, u.subjects_selected, u.subjects_locked
-            FROM users u
-            WHERE u.department_id = ? AND u.role = 'staff'
-            ORDER BY u.name
-        ''', (department_id,))
-        
-        staff_data = cursor.fetchall()
+        # Staff in the current user's department
+        found, model = _user_department_model(cursor, current_user_id)
         conn.close()
         
-        staff_list = []
-        for staff in staff_data:
-            staff_list.append({
-                'id': str(staff[0]),
-                'name': staff[1],
-                'email': staff[2],
-                'staff_role': staff[3],
-                'subjects_selected': staff[4].split(',') if staff[4] else [],
-                'subjects_locked': bool(staff[5])
-            })
+        if not found:
+            return jsonify({'error': 'User not found'}), 404
         
-        return jsonify(staff_list), 200
+        return jsonify(model.staff_payload if model else []), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -57,39 +63,17 @@ def get_staff():
 def get_subjects():
     try:
         current_user_id = get_jwt_identity()
-        conn = sqlite3.connect('timetable.db')
+        conn = db.connect()
         cursor = conn.cursor()
         
-        # Get current user's department
-        cursor.execute('SELECT department_id FROM users WHERE id = ?', (current_user_id,))
-        user_data = cursor.fetchone()
-        
-        if not user_data:
-            return jsonify({'error': 'User not found'}), 404
-        
-        department_id = user_data[0]
-        
-        # Get subjects for the department
-        cursor.execute('''
-            SELECT id, name, code, credits
-            FROM subjects
-            WHERE department_id = ?
-            ORDER BY name
-        ''', (department_id,))
-        
-        subjects_data = cursor.fetchall()
+        # Subjects of the current user's department
+        found, model = _user_department_model(cursor, current_user_id)
         conn.close()
         
-        subjects_list = []
-        for subject in subjects_data:
-            subjects_list.append({
-                'id': str(subject[0]),
-                'name': subject[1],
-                'code': subject[2],
-                'credits': subject[3]
-            })
+        if not found:
+            return jsonify({'error': 'User not found'}), 404
         
-        return jsonify(subjects_list), 200
+        return jsonify(model.subjects_payload if model else []), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -103,8 +87,11 @@ def create_subject():
         
         if not data.get('name') or not data.get('code'):
             return jsonify({'error': 'Name and code are required'}), 400
+        subject_type = data.get('subject_type') or demand.DEFAULT_SUBJECT_TYPE
+        if subject_type not in demand.SUBJECT_TYPES:
+            return jsonify({'error': f"subject_type must be one of {', '.join(demand.SUBJECT_TYPES)}"}), 400
         
-        conn = sqlite3.connect('timetable.db')
+        conn = db.connect()
         cursor = conn.cursor()
         
         # Get current user's department
@@ -117,11 +104,13 @@ def create_subject():
         department_id = user_data[0]
         
         cursor.execute('''
-            INSERT INTO subjects (name, code, department_id, credits)
-            VALUES (?, ?, ?, ?)
-        ''', (data['name'], data['code'], department_id, data.get('credits', 3)))
+            INSERT INTO subjects (name, code, department_id, credits, enrollment, cohort, subject_type)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (data['name'], data['code'], department_id, data.get('credits', 3), data.get('enrollment'),
+              data.get('cohort'), subject_type))
         
         subject_id = cursor.lastrowid
+        department_cache.bump_data_version(cursor, department_id)
         conn.commit()
         conn.close()
         
@@ -129,8 +118,120 @@ def create_subject():
             'id': str(subject_id),
             'name': data['name'],
             'code': data['code'],
-            'credits': data.get('credits', 3)
+            'credits': data.get('credits', 3),
+            'enrollment': data.get('enrollment'),
+            'cohort': data.get('cohort'),
+            'subject_type': subject_type
+        }), 201
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _optional_int(value, field, minimum=0):
+    if value is None or value == '':
+        return None
+    value = int(value)
+    if value < minimum:
+        raise ValueError(f'{field} must be at least {minimum}')
+    return value
+
+def _subject_row(item, department_id):
+    if not item.get('name') or not item.get('code'):
+        raise ValueError('Name and code are required')
+    credits = _optional_int(item.get('credits', 3), 'credits', 1)
+    subject_type = item.get('subject_type') or demand.DEFAULT_SUBJECT_TYPE
+    if subject_type not in demand.SUBJECT_TYPES:
+        raise ValueError(f"subject_type must be one of {', '.join(demand.SUBJECT_TYPES)}")
+    return (item['name'], item['code'], department_id, 3 if credits is None else credits,
+            _optional_int(item.get('enrollment'), 'enrollment'), item.get('cohort') or None, subject_type)
+
+def _classroom_row(item, department_id):
+    if not item.get('name') or not item.get('capacity'):
+        raise ValueError('Name and capacity are required')
+    return (item['name'], _optional_int(item['capacity'], 'capacity', 1), department_id)
+
+def _batch_rows(items, build_row, department_id):
+    """Validate a whole batch; returns (rows, per-item errors)"""
+    rows, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError('Each item must be an object')
+            rows.append(build_row(item, department_id))
+        except (TypeError, ValueError) as e:
+            errors.append({'index': index, 'error': str(e)})
+    return rows, errors
+
+def _batch_insert(cursor, table, columns, rows):
+    """Insert rows with one executemany; returns their new ids in order
+
+    Runs inside a write transaction and the tables use AUTOINCREMENT, so the
+    new ids are exactly those above the previous maximum.
+    """
+    cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}')
+    previous_max = cursor.fetchone()[0]
+    placeholders = ', '.join('?' for _ in columns)
+    cursor.executemany(f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({placeholders})', rows)
+    cursor.execute(f'SELECT id FROM {table} WHERE id > ? ORDER BY id', (previous_max,))
+    return [row[0] for row in cursor.fetchall()]
+
+def _create_batch(key, table, columns, build_row, to_result):
+    """Shared body of the department-scoped batch create routes"""
+    data = request.get_json(silent=True) or {}
+    items = data.get(key)
+    
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': f'{key} must be a non-empty array'}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({'error': f'At most {BATCH_MAX_ITEMS} {key} per request'}), 400
+    
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT department_id FROM users WHERE id = ?', (get_jwt_identity(),))
+        user_data = cursor.fetchone()
+        
+        if not user_data:
+            return jsonify({'error': 'User not found'}), 404
+        
+        department_id = user_data[0]
+        rows, errors = _batch_rows(items, build_row, department_id)
+        if errors:
+            # Nothing is written unless every item is valid
+            return jsonify({'error': f'{len(errors)} invalid {key}', 'errors': errors}), 400
+        
+        cursor.execute('BEGIN IMMEDIATE')
+        ids = _batch_insert(cursor, table, columns, rows)
+        department_cache.bump_data_version(cursor, department_id)
+        conn.commit()
+        
+        return jsonify({
+            'created': len(ids),
+            'results': [{'index': index, 'status': 'created', **to_result(row_id, row)}
+                        for index, (row_id, row) in enumerate(zip(ids, rows))]
         }), 201
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+@api.route('/api/subjects/batch', methods=['POST'])
+@jwt_required()
+def create_subjects_batch():
+    """Create many subjects in the user's department in one transaction"""
+    try:
+        return _create_batch('subjects', 'subjects', ('name', 'code', 'department_id', 'credits', 'enrollment',
+                                                          'cohort', 'subject_type'),
+                             _subject_row, lambda subject_id, row: {
+                                 'id': str(subject_id),
+                                 'name': row[0],
+                                 'code': row[1],
+                                 'credits': row[3],
+                                 'enrollment': row[4],
+                                 'cohort': row[5],
+                                 'subject_type': row[6]
+                             })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -145,11 +246,11 @@ def select_subjects():
         if not data.get('subject_ids'):
             return jsonify({'error': 'Subject IDs are required'}), 400
         
-        conn = sqlite3.connect('timetable.db')
+        conn = db.connect()
         cursor = conn.cursor()
         
         # Get current user data
-        cursor.execute('SELECT staff_role, subjects_locked FROM users WHERE id = ?', (current_user_id,))
+        cursor.execute('SELECT staff_role, subjects_locked, department_id FROM users WHERE id = ?', (current_user_id,))
         user_data = cursor.fetchone()
         
         if not user_data:
@@ -171,6 +272,7 @@ def select_subjects():
             SET subjects_selected = ?, subjects_locked = 1
             WHERE id = ?
         ''', (subjects_str, current_user_id))
+        department_cache.bump_data_version(cursor, user_data[2])
         
         conn.commit()
         conn.close()
@@ -189,15 +291,569 @@ def generate_timetable():
         
         if not department_id:
             return jsonify({'error': 'Department ID is required'}), 400
-        
-        generator = TimetableGenerator()
-        result = generator.generate_timetable(int(department_id))
+        try:
+            department_id = int(department_id)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Department ID must be an integer'}), 400
+        
+        time_budget = data.get('time_budget')
+        if time_budget is not None:
+            try:
+                time_budget = float(time_budget)
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Time budget must be a number'}), 400
+            if not (math.isfinite(time_budget) and time_budget > 0):
+                return jsonify({'error': 'Time budget must be a positive number of seconds'}), 400
+        
+        # The solver is imported on first use to keep worker start-up light
+        from ai_timetable import TimetableGenerator, CancellationToken
+        import timetable_format
+        
+        response_format = data.get('format') or request.args.get('format', 'rows')
+        if response_format not in timetable_format.FORMATS:
+            return jsonify({'error': f'Unknown format: {response_format}'}), 400
+        
+        token = CancellationToken()
+        with _active_solves_lock:
+            _active_solves[department_id] = token
+        
+        reporter = progress.start_run(department_id, database=db.database_path())
+        try:
+            generator = TimetableGenerator(checkpoint_dir=current_app.config.get('CHECKPOINT_DIR'),
+                                           checkpoint_interval=current_app.config.get('CHECKPOINT_INTERVAL', 5.0))
+            result = generator.generate_timetable(department_id, time_budget=time_budget,
+                                                  cancel_token=token, progress=reporter,
+                                                  refine=bool(data.get('refine')),
+                                                  dry_run=bool(data.get('dry_run')),
+                                                  resume=data.get('resume', True) is not False)
+        except Exception as e:
+            reporter('failed', error=str(e))
+            raise
+        finally:
+            with _active_solves_lock:
+                if _active_solves.get(department_id) is token:
+                    del _active_solves[department_id]
         
         if 'error' in result:
+            reporter('failed', error=result['error'])
             return jsonify(result), 400
         
+        reporter('done', **{key: result[key] for key in (
+            'partial', 'stop_reason', 'unplaced_count', 'saved', 'dry_run', 'elapsed_seconds')},
+            placed=len(result['timetable']))
+        result['timetable'] = timetable_format.encode(result['timetable'], response_format)
+        return jsonify(result), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/timetable/generate/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_timetable_generation():
+    """Server-Sent Events for a department's generation run
+
+    EventSource cannot send headers, so the token may be passed as ?jwt=.
+    """
+    department_id = request.args.get('department_id', type=int)
+    if not department_id:
+        return jsonify({'error': 'Department ID is required'}), 400
+    
+    return Response(stream_with_context(progress.stream(department_id, database=db.database_path())),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@api.route('/api/timetable/validate', methods=['POST'])
+@jwt_required()
+def validate_timetable():
+    """Check a saved (or proposed) timetable for clashes, capacity and missing lectures
+
+    Without department_id the whole campus is validated. Passing entries
+    validates that proposed timetable instead of the saved one.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        department_id = data.get('department_id')
+        department_id = int(department_id) if department_id else None
+        
+        from validation import entries_from_dicts, load_reference_data, validate_entries, validate_saved_timetable
+        
+        conn = db.connect()
+        if data.get('entries') is not None:
+            reference = load_reference_data(conn.cursor(), department_id)
+            result = validate_entries(entries_from_dicts(data['entries']), reference['capacities'],
+                                      reference['enrollments'], reference['expected'])
+        else:
+            result = validate_saved_timetable(conn, department_id)
+        conn.close()
+        
         return jsonify(result), 200
         
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid timetable entries: {e}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/exams/schedule', methods=['POST'])
+@jwt_required()
+def schedule_exams():
+    """Pack one exam per subject into as few slots as possible
+
+    Subjects sharing a staff member or a cohort never share a slot, and each
+    exam gets rooms seating its enrollment. Without department_id the whole
+    campus is scheduled against every classroom.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        department_id = data.get('department_id')
+        department_id = int(department_id) if department_id else None
+        max_slots = _optional_int(data.get('max_slots'), 'max_slots', 1)
+        
+        from exam_scheduler import schedule_saved_subjects
+        
+        conn = db.connect()
+        try:
+            result = schedule_saved_subjects(conn.cursor(), department_id, max_slots)
+        finally:
+            conn.close()
+        
+        return jsonify(result), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _analytics_response(section):
+    """One section of the cached analytics report for ?department_id= or the whole campus"""
+    try:
+        department_id = request.args.get('department_id', type=int)
+        
+        import analytics
+        
+        conn = db.connect()
+        try:
+            report = analytics.load_report(conn.cursor(), department_id or analytics.CAMPUS)
+        finally:
+            conn.close()
+        
+        if report is None:
+            return jsonify({'error': 'Department not found'}), 404
+        
+        return jsonify({'department_id': department_id, **report[section]}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/analytics/rooms', methods=['GET'])
+@jwt_required()
+def get_room_analytics():
+    """Room utilization overall, per room, per day and per slot"""
+    return _analytics_response('rooms')
+
+@api.route('/api/analytics/staff', methods=['GET'])
+@jwt_required()
+def get_staff_analytics():
+    """Teaching hours per staff member and day"""
+    return _analytics_response('staff')
+
+@api.route('/api/analytics/gaps', methods=['GET'])
+@jwt_required()
+def get_gap_analytics():
+    """Distribution of idle slots between a staff member's lectures on a day"""
+    return _analytics_response('gaps')
+
+@api.route('/api/analytics/heatmap', methods=['GET'])
+@jwt_required()
+def get_heatmap_analytics():
+    """Rooms in use and staff teaching per day and slot"""
+    return _analytics_response('heatmap')
+
+@api.route('/api/timetable/cancel', methods=['POST'])
+@jwt_required()
+def cancel_timetable_generation():
+    try:
+        data = request.get_json()
+        department_id = data.get('department_id')
+        
+        if not department_id:
+            return jsonify({'error': 'Department ID is required'}), 400
+        
+        with _active_solves_lock:
+            token = _active_solves.get(int(department_id))
+        
+        if token is None:
+            return jsonify({'error': 'No generation running for this department'}), 404
+        
+        token.cancel()
+        return jsonify({'message': 'Cancellation requested'}), 202
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/timetable', methods=['GET'])
+@jwt_required()
+def get_timetable():
+    """Saved timetable of a department with entry ids and lock state
+
+    ?format=columnar returns the compact encoding from timetable_format.
+    """
+    try:
+        department_id = request.args.get('department_id')
+        response_format = request.args.get('format', 'rows')
+        
+        if not department_id:
+            return jsonify({'error': 'Department ID is required'}), 400
+        
+        import timetable_format
+        if response_format not in timetable_format.FORMATS:
+            return jsonify({'error': f'Unknown format: {response_format}'}), 400
+        
+        conn = db.connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT t.id, t.day, t.time_slot, t.subject_id, s.name, s.code, t.staff_id, u.name,
+                   t.classroom_id, c.name, t.locked
+            FROM timetables t
+            JOIN subjects s ON t.subject_id = s.id
+            JOIN users u ON t.staff_id = u.id
+            JOIN classrooms c ON t.classroom_id = c.id
+            WHERE t.department_id = ?
+            ORDER BY t.id
+        ''', (int(department_id),))
+        rows = cursor.fetchall()
+        version = occupancy.current_version(cursor, int(department_id))
+        conn.close()
+        
+        return jsonify({
+            'department_id': int(department_id),
+            'version': version,
+            'timetable': timetable_format.encode([{
+                'id': row[0],
+                'day': row[1],
+                'time_slot': row[2],
+                'subject_id': row[3],
+                'subject_name': row[4],
+                'subject_code': row[5],
+                'staff_id': row[6],
+                'staff_name': row[7],
+                'classroom_id': row[8],
+                'classroom_name': row[9],
+                'locked': bool(row[10])
+            } for row in rows], response_format)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _edit_response(edit):
+    """Run an occupancy edit and map EditError to its status code"""
+    conn = db.connect()
+    try:
+        return jsonify(edit(conn)), 200
+    except occupancy.EditError as e:
+        return jsonify({'error': str(e), **e.details}), e.status
+    finally:
+        conn.close()
+
+@api.route('/api/timetable/entries/<int:entry_id>/move', methods=['POST'])
+@jwt_required()
+def move_timetable_entry(entry_id):
+    """Move one entry to another day, slot and classroom if nothing clashes"""
+    try:
+        data = request.get_json() or {}
+        
+        for field in ('day', 'time_slot', 'classroom_id'):
+            if data.get(field) in (None, ''):
+                return jsonify({'error': f'{field} is required'}), 400
+        
+        from timetable_slots import DAYS, TIME_SLOTS
+        if data['day'] not in DAYS or data['time_slot'] not in TIME_SLOTS:
+            return jsonify({'error': 'Unknown day or time slot'}), 400
+        
+        return _edit_response(lambda conn: occupancy.move_entry(
+            conn, entry_id, data['day'], data['time_slot'], int(data['classroom_id'])))
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/timetable/entries/swap', methods=['POST'])
+@jwt_required()
+def swap_timetable_entries():
+    """Exchange the day, slot and classroom of two entries of one department"""
+    try:
+        data = request.get_json() or {}
+        entry_id = data.get('entry_id')
+        other_entry_id = data.get('other_entry_id')
+        
+        if not entry_id or not other_entry_id:
+            return jsonify({'error': 'entry_id and other_entry_id are required'}), 400
+        if int(entry_id) == int(other_entry_id):
+            return jsonify({'error': 'Cannot swap an entry with itself'}), 400
+        
+        return _edit_response(lambda conn: occupancy.swap_entries(conn, int(entry_id), int(other_entry_id)))
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/timetable/entries/<int:entry_id>/lock', methods=['POST'])
+@jwt_required()
+def lock_timetable_entry(entry_id):
+    """Pin an entry so edits and regeneration leave it in place"""
+    try:
+        data = request.get_json(silent=True) or {}
+        locked = bool(data.get('locked', True))
+        
+        return _edit_response(lambda conn: occupancy.lock_entry(conn, entry_id, locked))
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/timetable/entries/<int:entry_id>/substitutes', methods=['GET'])
+@jwt_required()
+def get_entry_substitutes(entry_id):
+    """Staff who can teach the entry's subject and are free at its slot, least loaded first"""
+    try:
+        conn = db.connect()
+        try:
+            result = substitutes.find_substitutes(conn.cursor(), entry_id)
+        finally:
+            conn.close()
+        
+        if result is None:
+            return jsonify({'error': 'Timetable entry not found'}), 404
+        
+        return jsonify(result), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _schedule_response(read, owner_id):
+    """Serve a stored schedule document as-is, without decoding it"""
+    conn = db.connect()
+    try:
+        document = read(conn, owner_id)
+    finally:
+        conn.close()
+    if document is None:
+        return jsonify({'error': 'No timetable has been saved for this schedule yet'}), 404
+    return Response(document, mimetype='application/json')
+
+@api.route('/api/schedules/me', methods=['GET'])
+@jwt_required()
+def get_my_schedule():
+    """Weekly schedule of the current staff member"""
+    try:
+        return _schedule_response(schedules.staff_schedule, int(get_jwt_identity()))
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/schedules/staff/<int:staff_id>', methods=['GET'])
+@jwt_required()
+def get_staff_schedule(staff_id):
+    try:
+        return _schedule_response(schedules.staff_schedule, staff_id)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/schedules/rooms/<int:classroom_id>', methods=['GET'])
+@jwt_required()
+def get_room_schedule(classroom_id):
+    try:
+        return _schedule_response(schedules.room_schedule, classroom_id)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/semesters', methods=['GET'])
+@jwt_required()
+def get_semesters():
+    try:
+        conn = db.connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, name, start_date, end_date FROM semesters ORDER BY start_date')
+        semesters = cursor.fetchall()
+        conn.close()
+        
+        return jsonify([{
+            'id': semester[0],
+            'name': semester[1],
+            'start_date': semester[2],
+            'end_date': semester[3]
+        } for semester in semesters]), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/semesters', methods=['POST'])
+@jwt_required()
+def create_semester():
+    try:
+        data = request.get_json() or {}
+        if not data.get('name'):
+            return jsonify({'error': 'Name is required'}), 400
+        start = semester_calendar.parse_date(data.get('start_date'), 'start_date')
+        end = semester_calendar.parse_date(data.get('end_date'), 'end_date')
+        if end < start:
+            return jsonify({'error': 'end_date must not be before start_date'}), 400
+        
+        conn = db.connect()
+        cursor = conn.cursor()
+        cursor.execute('INSERT INTO semesters (name, start_date, end_date) VALUES (?, ?, ?)',
+                       (data['name'], start.isoformat(), end.isoformat()))
+        semester_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        
+        return jsonify({
+            'id': semester_id,
+            'name': data['name'],
+            'start_date': start.isoformat(),
+            'end_date': end.isoformat()
+        }), 201
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/semesters/<int:semester_id>/exceptions', methods=['GET'])
+@jwt_required()
+def get_calendar_exceptions(semester_id):
+    try:
+        conn = db.connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, kind, start_date, end_date, department_id, timetable_entry_id, reason
+            FROM calendar_exceptions
+            WHERE semester_id = ?
+            ORDER BY start_date, id
+        ''', (semester_id,))
+        exceptions = cursor.fetchall()
+        conn.close()
+        
+        return jsonify([{
+            'id': exception[0],
+            'kind': exception[1],
+            'start_date': exception[2],
+            'end_date': exception[3],
+            'department_id': exception[4],
+            'timetable_entry_id': exception[5],
+            'reason': exception[6]
+        } for exception in exceptions]), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/semesters/<int:semester_id>/exceptions', methods=['POST'])
+@jwt_required()
+def create_calendar_exception(semester_id):
+    """Add a holiday, exam week (campus-wide or for department_id) or a cancellation of one entry"""
+    try:
+        data = request.get_json() or {}
+        conn = db.connect()
+        try:
+            cursor = conn.cursor()
+            semester = semester_calendar.get_semester(cursor, semester_id)
+            if semester is None:
+                return jsonify({'error': 'Semester not found'}), 404
+            
+            row = semester_calendar.validate_exception(data, semester)
+            cursor.execute('''
+                INSERT INTO calendar_exceptions
+                    (semester_id, kind, start_date, end_date, department_id, timetable_entry_id, reason)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (semester_id, *row))
+            exception_id = cursor.lastrowid
+            conn.commit()
+        finally:
+            conn.close()
+        
+        kind, start_date, end_date, department_id, entry_id, reason = row
+        return jsonify({
+            'id': exception_id,
+            'kind': kind,
+            'start_date': start_date,
+            'end_date': end_date,
+            'department_id': department_id,
+            'timetable_entry_id': entry_id,
+            'reason': reason
+        }), 201
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/semesters/<int:semester_id>/exceptions/<int:exception_id>', methods=['DELETE'])
+@jwt_required()
+def delete_calendar_exception(semester_id, exception_id):
+    try:
+        conn = db.connect()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM calendar_exceptions WHERE id = ? AND semester_id = ?',
+                       (exception_id, semester_id))
+        deleted = cursor.rowcount
+        conn.commit()
+        conn.close()
+        
+        if not deleted:
+            return jsonify({'error': 'Calendar exception not found'}), 404
+        
+        return jsonify({'message': 'Calendar exception deleted'}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _occurrence_stream(semester_id, encode, mimetype, headers=None):
+    """Stream a semester's occurrences filtered by the query string, without materializing them"""
+    args = request.args
+    start = semester_calendar.parse_date(args['from'], 'from') if args.get('from') else None
+    end = semester_calendar.parse_date(args['to'], 'to') if args.get('to') else None
+    filters = {
+        'department_id': _optional_int(args.get('department_id'), 'department_id', 1),
+        'staff_id': _optional_int(args.get('staff_id'), 'staff_id', 1),
+        'classroom_id': _optional_int(args.get('classroom_id'), 'classroom_id', 1)
+    }
+    
+    conn = db.connect()
+    try:
+        semester = semester_calendar.get_semester(conn.cursor(), semester_id)
+    finally:
+        conn.close()
+    if semester is None:
+        return jsonify({'error': 'Semester not found'}), 404
+    
+    occurrences = semester_calendar.occurrences(db.database_path(), semester, start, end, **filters)
+    return Response(encode(semester, occurrences), mimetype=mimetype, headers=headers)
+
+@api.route('/api/semesters/<int:semester_id>/occurrences', methods=['GET'])
+@jwt_required()
+def get_semester_occurrences(semester_id):
+    """Dated lectures between ?from= and ?to=, optionally for one department, staff member or room"""
+    try:
+        return _occurrence_stream(semester_id, lambda semester, occurrences: semester_calendar.json_array(occurrences),
+                                  'application/json')
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/semesters/<int:semester_id>/calendar.ics', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def get_semester_ics(semester_id):
+    """iCalendar feed of the semester's lectures
+
+    Calendar apps cannot send headers, so the token may be passed as ?jwt=.
+    """
+    try:
+        return _occurrence_stream(semester_id, semester_calendar.ics_feed, 'text/calendar',
+                                  {'Content-Disposition': f'inline; filename=semester-{semester_id}.ics'})
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -211,6 +867,8 @@ def export_timetable():
         if not department_id:
             return jsonify({'error': 'Department ID is required'}), 400
         
+        from ai_timetable import TimetableGenerator
+        
         generator = TimetableGenerator()
         file_path = f'timetable_dept_{department_id}.xlsx'
         
@@ -232,37 +890,86 @@ def export_timetable():
 def get_classrooms():
     try:
         current_user_id = get_jwt_identity()
-        conn = sqlite3.connect('timetable.db')
+        conn = db.connect()
         cursor = conn.cursor()
         
-        # Get current user's department
-        cursor.execute('SELECT department_id FROM users WHERE id = ?', (current_user_id,))
-        user_data = cursor.fetchone()
+        # Classrooms of the current user's department
+        found, model = _user_department_model(cursor, current_user_id)
+        conn.close()
         
-        if not user_data:
+        if not found:
             return jsonify({'error': 'User not found'}), 404
         
-        department_id = user_data[0]
-        
-        cursor.execute('''
-            SELECT id, name, capacity
-            FROM classrooms
-            WHERE department_id = ?
-            ORDER BY name
-        ''', (department_id,))
-        
-        classrooms_data = cursor.fetchall()
-        conn.close()
+        return jsonify(model.classrooms_payload if model else []), 200
         
-        classrooms_list = []
-        for classroom in classrooms_data:
-            classrooms_list.append({
-                'id': str(classroom[0]),
-                'name': classroom[1],
-                'capacity': classroom[2]
-            })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/classrooms/free', methods=['GET'])
+@jwt_required()
+def get_free_classrooms():
+    """Classrooms free at a day and slot (or run of length slots), smallest adequate room first
+
+    Searches the user's department unless department_id is given, or the
+    whole campus with scope=campus.
+    """
+    try:
+        day = request.args.get('day')
+        time_slot = request.args.get('slot')
+        if not day or not time_slot:
+            return jsonify({'error': 'day and slot are required'}), 400
+        length = _optional_int(request.args.get('length'), 'length', 1) or 1
+        min_capacity = _optional_int(request.args.get('min_capacity'), 'min_capacity') or 0
+        campus = request.args.get('scope') == 'campus'
+        
+        import room_index
+        
+        conn = db.connect()
+        try:
+            cursor = conn.cursor()
+            department_id = request.args.get('department_id')
+            if campus:
+                department_id = room_index.CAMPUS
+            elif department_id:
+                department_id = int(department_id)
+            else:
+                cursor.execute('SELECT department_id FROM users WHERE id = ?', (get_jwt_identity(),))
+                row = cursor.fetchone()
+                if not row or row[0] is None:
+                    return jsonify({'error': 'department_id is required'}), 400
+                department_id = row[0]
+            rooms = room_index.find_free_rooms(cursor, department_id, day, time_slot, length, min_capacity)
+        finally:
+            conn.close()
+        
+        if rooms is None:
+            return jsonify({'error': 'Department not found'}), 404
         
-        return jsonify(classrooms_list), 200
+        return jsonify({
+            'day': day,
+            'time_slots': room_index.slot_range(time_slot, length),
+            'min_capacity': min_capacity,
+            'scope': 'campus' if campus else 'department',
+            'department_id': None if campus else department_id,
+            'classrooms': rooms
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/classrooms/batch', methods=['POST'])
+@jwt_required()
+def create_classrooms_batch():
+    """Create many classrooms in the user's department in one transaction"""
+    try:
+        return _create_batch('classrooms', 'classrooms', ('name', 'capacity', 'department_id'),
+                             _classroom_row, lambda classroom_id, row: {
+                                 'id': str(classroom_id),
+                                 'name': row[0],
+                                 'capacity': row[1]
+                             })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -277,7 +984,7 @@ def create_classroom():
         if not data.get('name') or not data.get('capacity'):
             return jsonify({'error': 'Name and capacity are required'}), 400
         
-        conn = sqlite3.connect('timetable.db')
+        conn = db.connect()
         cursor = conn.cursor()
         
         # Get current user's department
@@ -295,6 +1002,7 @@ def create_classroom():
         ''', (data['name'], int(data['capacity']), department_id))
         
         classroom_id = cursor.lastrowid
+        department_cache.bump_data_version(cursor, department_id)
         conn.commit()
         conn.close()
         
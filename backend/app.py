@@ -1,29 +1,15 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
-import sqlite3
-from datetime import timedelta
-import os
-from dotenv import load_dotenv
-from api_routes import api
-from ai_timetable import TimetableGenerator
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, create_access_token
+import db
+import department_cache
+import passwords
 
-load_dotenv()
-
-app = Flask(__name__)
-app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
-
-jwt = JWTManager(app)
-CORS(app, origins=["http://localhost:5173", "http://localhost:3000"])
-
-# Register API routes
-app.register_blueprint(api)
+# Core auth and department routes; registered by factory.create_app for the basic feature set
+core = Blueprint('core', __name__)
 
 # Database initialization
-def init_db():
-    conn = sqlite3.connect('timetable.db')
+def init_db(database=None):
+    conn = db.connect(database)
     cursor = conn.cursor()
     
     # Users table
@@ -43,12 +29,21 @@ def init_db():
         )
     ''')
     
+    create_shared_tables(cursor)
+    
+    conn.commit()
+    conn.close()
+
+def create_shared_tables(cursor):
+    """Tables used by both feature sets"""
     # Departments table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS departments (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
             code TEXT UNIQUE NOT NULL,
+            timetable_version INTEGER DEFAULT 0,
+            data_version INTEGER DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
@@ -61,6 +56,9 @@ def init_db():
             code TEXT NOT NULL,
             department_id INTEGER NOT NULL,
             credits INTEGER DEFAULT 3,
+            enrollment INTEGER,
+            cohort TEXT,
+            subject_type TEXT DEFAULT 'theory',
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (department_id) REFERENCES departments (id)
         )
@@ -88,6 +86,7 @@ def init_db():
             subject_id INTEGER NOT NULL,
             staff_id INTEGER NOT NULL,
             classroom_id INTEGER NOT NULL,
+            locked BOOLEAN DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (department_id) REFERENCES departments (id),
             FOREIGN KEY (subject_id) REFERENCES subjects (id),
@@ -95,12 +94,97 @@ def init_db():
             FOREIGN KEY (classroom_id) REFERENCES classrooms (id)
         )
     ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_timetables_department ON timetables (department_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_timetables_staff ON timetables (staff_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_timetables_classroom ON timetables (classroom_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_timetables_day_slot ON timetables (day, time_slot)')
     
-    conn.commit()
-    conn.close()
+    # Semesters and their calendar exceptions, expanded into dated occurrences
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS semesters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS calendar_exceptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            semester_id INTEGER NOT NULL,
+            kind TEXT NOT NULL CHECK (kind IN ('holiday', 'exam_week', 'cancellation')),
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            department_id INTEGER,
+            timetable_entry_id INTEGER,
+            reason TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (semester_id) REFERENCES semesters (id),
+            FOREIGN KEY (department_id) REFERENCES departments (id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_calendar_exceptions_semester ON calendar_exceptions (semester_id)')
+    
+    # Events of each department's latest generation run, read by SSE viewers on other workers
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS generation_progress (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            department_id INTEGER NOT NULL,
+            run_id TEXT NOT NULL,
+            event TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_generation_progress_department ON generation_progress (department_id, id)')
+    
+    # Weekly schedule documents per staff member and per room, rewritten with the timetable
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'staff_schedules'")
+    backfill_schedules = cursor.fetchone() is None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS staff_schedules (
+            staff_id INTEGER PRIMARY KEY,
+            department_id INTEGER NOT NULL,
+            data_version INTEGER NOT NULL,
+            document TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS room_schedules (
+            classroom_id INTEGER PRIMARY KEY,
+            department_id INTEGER NOT NULL,
+            data_version INTEGER NOT NULL,
+            document TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_staff_schedules_department ON staff_schedules (department_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_room_schedules_department ON room_schedules (department_id)')
+    
+    # Columns added after the first release
+    add_missing_columns(cursor, 'subjects', [('enrollment', 'INTEGER'), ('cohort', 'TEXT'),
+                                             ('subject_type', "TEXT DEFAULT 'theory'")])
+    add_missing_columns(cursor, 'departments', [('timetable_version', 'INTEGER DEFAULT 0'),
+                                                ('data_version', 'INTEGER DEFAULT 0')])
+    add_missing_columns(cursor, 'timetables', [('locked', 'BOOLEAN DEFAULT 0')])
+    
+    if backfill_schedules:
+        # Databases saved before the schedule tables existed
+        import schedules
+        cursor.execute('SELECT DISTINCT department_id FROM timetables')
+        for (department_id,) in cursor.fetchall():
+            schedules.refresh(cursor, department_id)
+
+def add_missing_columns(cursor, table, columns):
+    """Add columns introduced after a table was first created"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    existing = {row[1] for row in cursor.fetchall()}
+    for name, definition in columns:
+        if name not in existing:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
 
 # Authentication routes
-@app.route('/api/auth/register', methods=['POST'])
+@core.route('/api/auth/register', methods=['POST'])
 def register():
     try:
         data = request.get_json()
@@ -122,7 +206,7 @@ def register():
         if data['role'] == 'staff' and not data.get('staff_role'):
             return jsonify({'error': 'Staff role is required for staff members'}), 400
         
-        conn = sqlite3.connect('timetable.db')
+        conn = db.connect()
         cursor = conn.cursor()
         
         # Check if email already exists
@@ -131,7 +215,7 @@ def register():
             return jsonify({'error': 'Email already registered'}), 409
         
         # Hash password
-        password_hash = generate_password_hash(data['password'])
+        password_hash = passwords.hash_password(data['password'])
         
         # Insert user
         cursor.execute('''
@@ -147,6 +231,8 @@ def register():
         ))
         
         user_id = cursor.lastrowid
+        if data['role'] == 'staff':
+            department_cache.bump_data_version(cursor, data.get('department_id'))
         conn.commit()
         
         # Get user data for response
@@ -186,7 +272,7 @@ def register():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/auth/login', methods=['POST'])      
+@core.route('/api/auth/login', methods=['POST'])      
 def login():
     try:
         data = request.get_json()
@@ -198,7 +284,7 @@ def login():
         if not data['email'].endswith('@srmist.edu.in'):
             return jsonify({'error': 'Only @srmist.edu.in emails are allowed'}), 400
         
-        conn = sqlite3.connect('timetable.db')
+        conn = db.connect()
         cursor = conn.cursor()
         
         # Get user data
@@ -213,9 +299,17 @@ def login():
         user_data = cursor.fetchone()
         conn.close()
         
-        if not user_data or not check_password_hash(user_data[3], data['password']):
+        if not user_data or not passwords.verify_password(user_data[3], data['password']):
             return jsonify({'error': 'Invalid email or password'}), 401
         
+        # Upgrade hashes made with outdated cost parameters
+        new_hash = passwords.upgraded_hash(user_data[3], data['password'])
+        if new_hash:
+            conn = db.connect()
+            conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (new_hash, user_data[0]))
+            conn.commit()
+            conn.close()
+        
         user = {
             'id': str(user_data[0]),
             'name': user_data[1],
@@ -235,15 +329,17 @@ def login():
             'token': access_token
         }), 200
         
+    except passwords.PasswordPoolBusy:
+        return jsonify({'error': 'Too many login attempts in progress, please retry'}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Department management routes
-@app.route('/api/departments', methods=['GET'])
+@core.route('/api/departments', methods=['GET'])
 @jwt_required()
 def get_departments():
     try:
-        conn = sqlite3.connect('timetable.db')
+        conn = db.connect()
         cursor = conn.cursor()
         
         cursor.execute('SELECT id, name, code FROM departments ORDER BY name')
@@ -259,7 +355,7 @@ def get_departments():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/departments', methods=['POST'])
+@core.route('/api/departments', methods=['POST'])
 @jwt_required()
 def create_department():
     try:
@@ -268,7 +364,7 @@ def create_department():
         if not data.get('name') or not data.get('code'):
             return jsonify({'error': 'Name and code are required'}), 400
         
-        conn = sqlite3.connect('timetable.db')
+        conn = db.connect()
         cursor = conn.cursor()
         
         cursor.execute('INSERT INTO departments (name, code) VALUES (?, ?)', 
@@ -287,10 +383,12 @@ def create_department():
         return jsonify({'error': str(e)}), 500
 
 # Health check route
-@app.route('/api/health', methods=['GET'])
+@core.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy', 'message': 'SRM Timetable AI Backend is running'}), 200
 
 if __name__ == '__main__':
-    init_db()
-    app.run(debug=True, port=5000)
+    from factory import create_app, init_schema
+    app = create_app({'FEATURE_SET': 'basic'})
+    init_schema(app)
+    app.run(debug=app.config['DEBUG'], port=5000)
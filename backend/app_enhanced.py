@@ -1,33 +1,23 @@
 
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
-import sqlite3
-import secrets
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, create_access_token, get_jwt_identity
 import string
-from datetime import timedelta
-import os
-from dotenv import load_dotenv
-from ai_timetable import TimetableGenerator
 import logging
+import db
+import department_cache
+import passwords
+from app import create_shared_tables
 
-load_dotenv()
-
-app = Flask(__name__)
-app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', secrets.token_urlsafe(32))
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
-
-jwt = JWTManager(app)
-CORS(app, origins=["http://localhost:5173", "http://localhost:3000", "http://localhost:8080"])
+# Enhanced auth, user and department routes; registered by factory.create_app for the enhanced feature set
+enhanced = Blueprint('enhanced', __name__)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Database initialization with enhanced schema
-def init_enhanced_db():
-    conn = sqlite3.connect('timetable_enhanced.db')
+def init_enhanced_db(database=None):
+    conn = db.connect(database)
     cursor = conn.cursor()
     
     # Users table with additional fields
@@ -53,20 +43,13 @@ def init_enhanced_db():
         )
     ''')
     
-    # Departments table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS departments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            code TEXT UNIQUE NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+    # Departments, subjects, classrooms and timetables
+    create_shared_tables(cursor)
     
     # Insert default main admin if not exists
     cursor.execute('SELECT id FROM users WHERE email = ?', ('srmtt@srmist.edu.in',))
     if not cursor.fetchone():
-        password_hash = generate_password_hash('mcs2024')
+        password_hash = passwords.hash_password('mcs2024')
         cursor.execute('''
             INSERT INTO users (name, email, password_hash, username, employee_id, role)
             VALUES (?, ?, ?, ?, ?, ?)
@@ -76,12 +59,12 @@ def init_enhanced_db():
     conn.close()
 
 # Health check route
-@app.route('/api/health', methods=['GET'])
+@enhanced.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy', 'message': 'SRM Timetable AI Backend is running'}), 200
 
 # Authentication routes
-@app.route('/api/auth/login', methods=['POST'])
+@enhanced.route('/api/auth/login', methods=['POST'])
 def login():
     try:
         data = request.get_json()
@@ -91,7 +74,7 @@ def login():
         if not email or not password:
             return jsonify({'error': 'Email and password are required'}), 400
         
-        conn = sqlite3.connect('timetable_enhanced.db')
+        conn = db.connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -106,9 +89,18 @@ def login():
         user_data = cursor.fetchone()
         conn.close()
         
-        if not user_data or not check_password_hash(user_data[3], password):
+        if not user_data or not passwords.verify_password(user_data[3], password):
             return jsonify({'error': 'Invalid email or password'}), 401
         
+        # Upgrade hashes made with outdated cost parameters
+        new_hash = passwords.upgraded_hash(user_data[3], password)
+        if new_hash:
+            conn = db.connect()
+            conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (new_hash, user_data[0]))
+            conn.commit()
+            conn.close()
+            logger.info(f"Upgraded password hash for {email}")
+        
         user = {
             'id': str(user_data[0]),
             'name': user_data[1],
@@ -135,16 +127,19 @@ def login():
             }
         }), 200
         
+    except passwords.PasswordPoolBusy:
+        logger.warning(f"Login queue full, rejected {email}")
+        return jsonify({'error': 'Too many login attempts in progress, please retry'}), 503, {'Retry-After': '1'}
     except Exception as e:
         logger.error(f"Login error: {str(e)}")
         return jsonify({'error': 'Login failed'}), 500
 
-@app.route('/api/auth/verify', methods=['GET'])
+@enhanced.route('/api/auth/verify', methods=['GET'])
 @jwt_required()
 def verify_token():
     try:
         current_user_id = get_jwt_identity()
-        conn = sqlite3.connect('timetable_enhanced.db')
+        conn = db.connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -182,13 +177,49 @@ def verify_token():
         logger.error(f"Token verification error: {str(e)}")
         return jsonify({'error': 'Token verification failed'}), 401
 
-@app.route('/api/auth/logout', methods=['POST'])
+@enhanced.route('/api/auth/logout', methods=['POST'])
 @jwt_required()
 def logout():
     return jsonify({'success': True, 'message': 'Logged out successfully'}), 200
 
 # User Management routes
-@app.route('/api/users/<user_id>', methods=['PUT'])
+USER_UPDATE_FIELDS = ['name', 'email', 'role', 'department_id', 'staff_role', 'subjects_selected', 'subjects_locked']
+USER_BATCH_MAX_ITEMS = 5000
+USER_ROLES = ('main_admin', 'dept_admin', 'staff')
+STAFF_ROLES = ('assistant_professor', 'professor', 'hod')
+
+def _user_update_values(item, fields):
+    """Column values for a batch update item; raises ValueError if a field is invalid"""
+    values = []
+    for field in fields:
+        value = item[field]
+        if field in ('name', 'email'):
+            if not isinstance(value, str) or not value.strip():
+                raise ValueError(f'{field} must be a non-empty string')
+            value = value.strip()
+            if field == 'email' and '@' not in value:
+                raise ValueError('email is not a valid address')
+        elif field == 'role' and value not in USER_ROLES:
+            raise ValueError(f"role must be one of {', '.join(USER_ROLES)}")
+        elif field == 'staff_role' and value is not None and value not in STAFF_ROLES:
+            raise ValueError(f"staff_role must be one of {', '.join(STAFF_ROLES)}")
+        elif field == 'department_id' and value is not None:
+            if isinstance(value, bool) or not str(value).isdigit():
+                raise ValueError('department_id must be a department id')
+            value = int(value)
+        elif field == 'subjects_selected':
+            if isinstance(value, list):
+                value = ','.join(map(str, value))
+            elif value is not None and not isinstance(value, str):
+                raise ValueError('subjects_selected must be a list of subject ids')
+        elif field == 'subjects_locked':
+            if value not in (True, False, 0, 1):
+                raise ValueError('subjects_locked must be a boolean')
+            value = 1 if value else 0
+        values.append(value)
+    return values
+
+@enhanced.route('/api/users/<user_id>', methods=['PUT'])
 @jwt_required()
 def update_user(user_id):
     try:
@@ -196,7 +227,7 @@ def update_user(user_id):
         data = request.get_json()
         
         # Check if user exists and user has permission to update
-        conn = sqlite3.connect('timetable_enhanced.db')
+        conn = db.connect()
         cursor = conn.cursor()
         
         # Verify current user has admin role or is updating their own profile
@@ -210,9 +241,7 @@ def update_user(user_id):
         update_fields = []
         update_values = []
         
-        allowed_fields = ['name', 'email', 'role', 'department_id', 'staff_role', 'subjects_selected', 'subjects_locked']
-        
-        for field in allowed_fields:
+        for field in USER_UPDATE_FIELDS:
             if field in data:
                 if field == 'subjects_selected' and isinstance(data[field], list):
                     update_fields.append(f"{field} = ?")
@@ -226,6 +255,10 @@ def update_user(user_id):
         
         update_values.append(user_id)
         
+        # Staff lists are cached per department; invalidate the old and new one
+        cursor.execute('SELECT department_id FROM users WHERE id = ?', (user_id,))
+        previous = cursor.fetchone()
+        
         cursor.execute(f'''
             UPDATE users 
             SET {', '.join(update_fields)}
@@ -235,6 +268,10 @@ def update_user(user_id):
         if cursor.rowcount == 0:
             return jsonify({'error': 'User not found or no changes made'}), 404
         
+        department_cache.bump_data_version(cursor, previous[0] if previous else None)
+        if data.get('department_id') and (not previous or str(data['department_id']) != str(previous[0])):
+            department_cache.bump_data_version(cursor, data['department_id'])
+        
         # Get updated user data
         cursor.execute('''
             SELECT u.id, u.name, u.email, u.role, u.department_id, 
@@ -272,12 +309,139 @@ def update_user(user_id):
         logger.error(f"Update user error: {str(e)}")
         return jsonify({'error': 'Failed to update user'}), 500
 
+@enhanced.route('/api/users/batch', methods=['PUT'])
+@jwt_required()
+def update_users_batch():
+    """Update many users in one transaction (main admin only)
+
+    Expects {"users": [{"id": ..., <fields>}]}. The batch is validated as a
+    whole and nothing is written if any item is invalid.
+    """
+    try:
+        current_user_id = get_jwt_identity()
+        data = request.get_json(silent=True) or {}
+        items = data.get('users')
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'users must be a non-empty array'}), 400
+        if len(items) > USER_BATCH_MAX_ITEMS:
+            return jsonify({'error': f'At most {USER_BATCH_MAX_ITEMS} users per request'}), 400
+        
+        conn = db.connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT role FROM users WHERE id = ?', (current_user_id,))
+        current_user_role = cursor.fetchone()
+        
+        if not current_user_role or current_user_role[0] != 'main_admin':
+            conn.close()
+            return jsonify({'error': 'Permission denied'}), 403
+        
+        # Validate every item; updates sharing a field set share one statement
+        errors = []
+        groups = {}
+        seen = set()
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or not str(item.get('id', '')).isdigit():
+                errors.append({'index': index, 'error': 'A numeric id is required'})
+                continue
+            user_id = int(item['id'])
+            if user_id in seen:
+                errors.append({'index': index, 'error': 'User appears more than once'})
+                continue
+            seen.add(user_id)
+            fields = tuple(field for field in USER_UPDATE_FIELDS if field in item)
+            if not fields:
+                errors.append({'index': index, 'error': 'No valid fields to update'})
+                continue
+            try:
+                values = _user_update_values(item, fields)
+            except ValueError as e:
+                errors.append({'index': index, 'error': str(e)})
+                continue
+            groups.setdefault(fields, []).append((index, user_id, values))
+        
+        previous_departments = {}
+        if seen:
+            placeholders = ', '.join('?' for _ in seen)
+            cursor.execute(f'SELECT id, department_id FROM users WHERE is_active = 1 AND id IN ({placeholders})',
+                           list(seen))
+            previous_departments = dict(cursor.fetchall())
+        
+        # Departments must exist and emails stay unique, within the batch and against other users
+        department_ids = {values[fields.index('department_id')] for fields, updates in groups.items()
+                          if 'department_id' in fields for _, _, values in updates} - {None}
+        existing_departments = set()
+        if department_ids:
+            placeholders = ', '.join('?' for _ in department_ids)
+            cursor.execute(f'SELECT id FROM departments WHERE id IN ({placeholders})', list(department_ids))
+            existing_departments = {row[0] for row in cursor.fetchall()}
+        emails = {}
+        for fields, updates in groups.items():
+            if 'email' in fields:
+                for index, user_id, values in updates:
+                    emails.setdefault(values[fields.index('email')].lower(), []).append((index, user_id))
+        email_owners = {}
+        if emails:
+            placeholders = ', '.join('?' for _ in emails)
+            cursor.execute(f'SELECT LOWER(email), id FROM users WHERE LOWER(email) IN ({placeholders})', list(emails))
+            email_owners = dict(cursor.fetchall())
+        
+        for fields, updates in groups.items():
+            for index, user_id, values in updates:
+                if user_id not in previous_departments:
+                    errors.append({'index': index, 'error': 'User not found'})
+                elif ('department_id' in fields and values[fields.index('department_id')] is not None
+                      and values[fields.index('department_id')] not in existing_departments):
+                    errors.append({'index': index, 'error': 'Department not found'})
+                elif 'email' in fields:
+                    email = values[fields.index('email')].lower()
+                    if len(emails[email]) > 1:
+                        errors.append({'index': index, 'error': 'Email appears more than once'})
+                    elif email_owners.get(email, user_id) != user_id:
+                        errors.append({'index': index, 'error': 'Email is already in use'})
+        
+        if errors:
+            conn.close()
+            return jsonify({'error': f'{len(errors)} invalid users',
+                            'errors': sorted(errors, key=lambda e: e['index'])}), 400
+        
+        results = []
+        affected_departments = set(previous_departments.values())
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            for fields, updates in groups.items():
+                assignments = ', '.join(f'{field} = ?' for field in fields)
+                cursor.executemany(f'UPDATE users SET {assignments} WHERE id = ? AND is_active = 1',
+                                   [values + [user_id] for _, user_id, values in updates])
+                for index, user_id, values in updates:
+                    if 'department_id' in fields:
+                        affected_departments.add(values[fields.index('department_id')])
+                    results.append({'index': index, 'id': str(user_id), 'status': 'updated',
+                                    'fields': list(fields)})
+            # Staff lists are cached per department
+            for department_id in affected_departments:
+                department_cache.bump_data_version(cursor, department_id)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        
+        return jsonify({'success': True, 'updated': len(results),
+                        'results': sorted(results, key=lambda r: r['index'])}), 200
+        
+    except Exception as e:
+        logger.error(f"Batch update users error: {str(e)}")
+        return jsonify({'error': 'Failed to update users'}), 500
+
 # Department Management
-@app.route('/api/departments', methods=['GET'])
+@enhanced.route('/api/departments', methods=['GET'])
 @jwt_required()
 def get_departments():
     try:
-        conn = sqlite3.connect('timetable_enhanced.db')
+        conn = db.connect()
         cursor = conn.cursor()
         
         cursor.execute('SELECT id, name, code FROM departments ORDER BY name')
@@ -297,7 +461,7 @@ def get_departments():
         logger.error(f"Get departments error: {str(e)}")
         return jsonify({'error': 'Failed to fetch departments'}), 500
 
-@app.route('/api/departments', methods=['POST'])
+@enhanced.route('/api/departments', methods=['POST'])
 @jwt_required()
 def create_department():
     try:
@@ -305,7 +469,7 @@ def create_department():
         data = request.get_json()
         
         # Verify main admin
-        conn = sqlite3.connect('timetable_enhanced.db')
+        conn = db.connect()
         cursor = conn.cursor()
         cursor.execute('SELECT role FROM users WHERE id = ?', (current_user_id,))
         user_role = cursor.fetchone()
@@ -336,5 +500,7 @@ def create_department():
         return jsonify({'error': 'Failed to create department'}), 500
 
 if __name__ == '__main__':
-    init_enhanced_db()
-    app.run(debug=True, port=5000, host='0.0.0.0')
+    from factory import create_app, init_schema
+    app = create_app({'FEATURE_SET': 'enhanced'})
+    init_schema(app)
+    app.run(debug=app.config['DEBUG'], port=5000, host='0.0.0.0')
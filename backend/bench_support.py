@@ -0,0 +1,65 @@
+"""Helpers shared by the benchmarks and the load test.
+
+Seeds throwaway synthetic campuses, serves apps on local threaded servers
+and summarizes latency samples.
+"""
+import logging
+import os
+import statistics
+import tempfile
+import threading
+
+def percentiles(samples):
+    """Summarize a list of durations in seconds as milliseconds"""
+    ordered = sorted(samples)
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+    return {
+        'count': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': pick(0.50),
+        'p95_ms': pick(0.95),
+        'p99_ms': pick(0.99)
+    }
+
+def campus_app(feature_set='basic', config=None, **seed_kwargs):
+    """Create an app on a fresh synthetic campus database"""
+    import seed_data
+    from factory import create_app, init_schema
+
+    database = os.path.join(tempfile.mkdtemp(prefix='srm-bench-'), 'timetable.db')
+    flask_app = create_app({'FEATURE_SET': feature_set, 'DATABASE': database, **(config or {})})
+    init_schema(flask_app)
+    campus = seed_data.seed_synthetic_campus(database, **seed_kwargs)
+    return flask_app, campus
+
+def login(client, email, password='staff123'):
+    response = client.post('/api/auth/login', json={'email': email, 'password': password})
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+def serve(flask_app, pool_size=None):
+    """Run an app on a threaded local server; returns (server, base_url)
+
+    With pool_size, requests are handled by a fixed pool of threads, like a
+    gunicorn gthread worker, instead of a thread per request.
+    """
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, flask_app, threaded=pool_size is None)
+    if pool_size is not None:
+        from concurrent.futures import ThreadPoolExecutor
+
+        pool = ThreadPoolExecutor(pool_size)
+
+        def handle(request, client_address):
+            try:
+                server.finish_request(request, client_address)
+            except Exception:
+                server.handle_error(request, client_address)
+            finally:
+                server.shutdown_request(request)
+
+        server.process_request = lambda request, client_address: pool.submit(handle, request, client_address)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
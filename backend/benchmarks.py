@@ -0,0 +1,1163 @@
+"""Benchmarks for the backend hot paths.
+
+Run from the backend directory: python benchmarks.py [name ...]
+Each benchmark seeds a throwaway synthetic campus in a temp directory and
+prints its results as JSON.
+"""
+import contextlib
+import io
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from bench_support import campus_app, login, percentiles, serve
+
+BENCHMARKS = {}
+
+def benchmark(func):
+    BENCHMARKS[func.__name__[len('bench_'):]] = func
+    return func
+
+def _time_requests(client, path, headers, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        client.get(path, headers=headers)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+@benchmark
+def bench_metrics(repeat=2000):
+    """Cost of the metrics layer: raw observations and hot list routes"""
+    import metrics
+
+    histogram = metrics.Histogram('bench_histogram_seconds', 'benchmark only', ('route',))
+    start = time.perf_counter()
+    for i in range(100000):
+        histogram.observe(0.003, route='/api/staff')
+    observe_ns = (time.perf_counter() - start) / 100000 * 1e9
+
+    flask_app, campus = campus_app(departments=2)
+    client = flask_app.test_client()
+    headers = login(client, campus['staff_emails'][0])
+
+    routes = {}
+    for path in ['/api/staff', '/api/subjects', '/api/classrooms']:
+        metrics.set_enabled(False)
+        baseline = percentiles(_time_requests(client, path, headers, repeat))
+        metrics.set_enabled(True)
+        instrumented = percentiles(_time_requests(client, path, headers, repeat))
+        routes[path] = {
+            'disabled': baseline,
+            'enabled': instrumented,
+            'overhead_us': round((instrumented['mean_ms'] - baseline['mean_ms']) * 1000, 1)
+        }
+    return {'histogram_observe_ns': round(observe_ns), 'routes': routes}
+
+@benchmark
+def bench_login_storm(duration=5.0, storm_threads=16):
+    """p99 of a non-auth route while many staff log in at once
+
+    Compares no storm, inline verification (PASSWORD_WORKERS=0) and the
+    bounded verification pool.
+    """
+    import requests
+    import passwords
+
+    flask_app, campus = campus_app(departments=4)
+    server, base_url = serve(flask_app)
+    emails = campus['staff_emails']
+    token = requests.post(f'{base_url}/api/auth/login',
+                          json={'email': emails[0], 'password': 'staff123'}).json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    def run(storm):
+        stop = threading.Event()
+        logins = []
+
+        def storm_worker(offset):
+            session = requests.Session()
+            i = offset
+            while not stop.is_set():
+                response = session.post(f'{base_url}/api/auth/login',
+                                        json={'email': emails[i % len(emails)], 'password': 'staff123'})
+                logins.append(response.status_code)
+                i += storm_threads
+
+        workers = [threading.Thread(target=storm_worker, args=(n,)) for n in range(storm_threads if storm else 0)]
+        for worker in workers:
+            worker.start()
+
+        session = requests.Session()
+        samples = []
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            session.get(f'{base_url}/api/subjects', headers=headers)
+            samples.append(time.perf_counter() - start)
+            time.sleep(0.02)
+
+        stop.set()
+        for worker in workers:
+            worker.join()
+        return {
+            'subjects_route': percentiles(samples),
+            'logins_per_second': round(logins.count(200) / duration, 1),
+            'logins_rejected': len(logins) - logins.count(200)
+        }
+
+    results = {'no_storm': run(storm=False)}
+    workers = passwords.WORKERS
+    passwords.configure(workers=0)
+    results['inline_verification'] = run(storm=True)
+    passwords.configure(workers=workers)
+    results[f'pool_{workers}_workers'] = run(storm=True)
+    server.shutdown()
+    return results
+
+@benchmark
+def bench_cold_start(runs=5):
+    """Worker cold start: time and peak RSS to build an app in a fresh interpreter
+
+    'lazy' is what a worker pays now; 'eager' additionally imports the solver,
+    requests and openpyxl up front, as the old app modules did. The schema
+    is created beforehand in a temporary database, as the gunicorn master
+    does, so it is not counted.
+    """
+    import shutil
+    import subprocess
+    from factory import init_schema
+
+    script = (
+        'import resource, time\n'
+        'start = time.perf_counter()\n'
+        'from factory import create_app\n'
+        'create_app({"FEATURE_SET": %r, "DATABASE": %r})\n'
+        '%s'
+        'print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n'
+    )
+    eager = 'import ai_timetable, requests, openpyxl\n'
+    results = {}
+    directory = tempfile.mkdtemp(prefix='srm-bench-')
+    for feature_set in ('basic', 'enhanced'):
+        database = os.path.join(directory, f'{feature_set}.db')
+        init_schema({'FEATURE_SET': feature_set, 'DATABASE': database})
+        for mode, extra in (('lazy', ''), ('eager', eager)):
+            times, rss = [], []
+            for _ in range(runs):
+                output = subprocess.run([sys.executable, '-c', script % (feature_set, database, extra)],
+                                        capture_output=True, text=True, check=True,
+                                        cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+                times.append(float(output[0]))
+                rss.append(int(output[1]))
+            results[f'{feature_set}_{mode}'] = {
+                'startup_ms': round(statistics.median(times) * 1000, 1),
+                'max_rss_mb': round(statistics.median(rss) / 1024, 1)
+            }
+    shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+def _campus_timetable(entries=100000, departments=50, seed=7):
+    """Write a synthetic campus-sized timetable straight into a fresh database
+
+    Rooms are filled slot by slot and staff drawn at random, so the result
+    has a realistic sprinkling of staff clashes. Returns the database path.
+    """
+    import random
+    import sqlite3
+    import seed_data
+    from timetable_slots import DAYS, TIME_SLOTS
+    from factory import create_app, init_schema
+
+    rng = random.Random(seed)
+    database = os.path.join(tempfile.mkdtemp(prefix='srm-bench-'), 'timetable.db')
+    init_schema(create_app({'DATABASE': database}))
+    slots = [(day, slot) for day in DAYS for slot in TIME_SLOTS]
+    rooms = entries // len(slots) + 1
+    staff_per_department = max(1, entries // 6 // departments)
+    seed_data.seed_synthetic_campus(database, departments=departments, staff_per_department=staff_per_department,
+                                    subjects_per_department=40, classrooms_per_department=rooms // departments + 1)
+
+    conn = sqlite3.connect(database)
+    classrooms = conn.execute('SELECT id, department_id FROM classrooms').fetchall()
+    staff = {}
+    for staff_id, department_id, selected in conn.execute(
+            "SELECT id, department_id, subjects_selected FROM users WHERE role = 'staff'"):
+        staff.setdefault(department_id, []).append((staff_id, [int(s) for s in selected.split(',')]))
+    rows = []
+    for i in range(entries):
+        classroom_id, department_id = classrooms[i // len(slots)]
+        staff_id, subjects = rng.choice(staff[department_id])
+        day, slot = slots[i % len(slots)]
+        rows.append((department_id, day, slot, rng.choice(subjects), staff_id, classroom_id))
+    conn.executemany('''
+        INSERT INTO timetables (department_id, day, time_slot, subject_id, staff_id, classroom_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    conn.close()
+    return database
+
+@benchmark
+def bench_validate(entries=100000):
+    """Campus-wide validation of a 100k-entry timetable"""
+    import db
+    import validation
+
+    database = _campus_timetable(entries)
+    conn = db.connect(database)
+    cursor = conn.cursor()
+
+    start = time.perf_counter()
+    reference = validation.load_reference_data(cursor)
+    rows = validation.load_entries(cursor)
+    loaded = time.perf_counter()
+    result = validation.validate_entries(rows, reference['capacities'], reference['enrollments'],
+                                         reference['expected'])
+    finished = time.perf_counter()
+    conn.close()
+    return {
+        'entries': result['entry_count'],
+        'conflicts': len(result['conflicts']),
+        'missing_lectures': len(result['missing_lectures']),
+        'load_ms': round((loaded - start) * 1000, 1),
+        'validate_ms': round((finished - loaded) * 1000, 1),
+        'total_ms': round((finished - start) * 1000, 1)
+    }
+
+@benchmark
+def bench_model_cache(repeat=300, generations=10):
+    """Department data loads with the resident model cache warm vs. cleared each call"""
+    import db
+    import department_cache
+    from ai_timetable import TimetableGenerator
+
+    flask_app, campus = campus_app(departments=4, staff_per_department=200, subjects_per_department=100,
+                                    classrooms_per_department=60)
+    client = flask_app.test_client()
+    headers = login(client, campus['staff_emails'][0])
+    department_id = campus['department_ids'][0]
+    database = flask_app.config['DATABASE']
+
+    def load_samples(cold):
+        conn = db.connect(database)
+        cursor = conn.cursor()
+        samples = []
+        for _ in range(repeat):
+            if cold:
+                department_cache.clear()
+            start = time.perf_counter()
+            department_cache.get_model(cursor, department_id)
+            samples.append(time.perf_counter() - start)
+        conn.close()
+        return percentiles(samples)
+
+    def route_samples(path, cold):
+        samples = []
+        for _ in range(repeat):
+            if cold:
+                department_cache.clear()
+            start = time.perf_counter()
+            client.get(path, headers=headers)
+            samples.append(time.perf_counter() - start)
+        return percentiles(samples)
+
+    def generation_samples(cold):
+        samples = []
+        for _ in range(generations):
+            if cold:
+                department_cache.clear()
+            generator = TimetableGenerator(database)
+            start = time.perf_counter()
+            generator.generate_timetable(department_id)
+            samples.append(time.perf_counter() - start)
+        return percentiles(samples)
+
+    results = {'model_load': {'cold': load_samples(True), 'warm': load_samples(False)}}
+    for path in ['/api/staff', '/api/subjects', '/api/classrooms']:
+        results[path] = {'cold': route_samples(path, True), 'warm': route_samples(path, False)}
+    results['generate'] = {'cold': generation_samples(True), 'warm': generation_samples(False)}
+    results['cache'] = department_cache.cache_info()
+    return results
+
+@benchmark
+def bench_batch_create(count=1000):
+    """Creating subjects one request at a time vs. one batch request, over HTTP"""
+    import requests
+
+    flask_app, campus = campus_app(departments=1)
+    server, base_url = serve(flask_app)
+    session = requests.Session()
+    token = session.post(f'{base_url}/api/auth/login',
+                         json={'email': campus['staff_emails'][0], 'password': 'staff123'}).json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    subjects = [{'name': f'Subject {i}', 'code': f'BENCH{i}', 'credits': 3, 'enrollment': 60}
+                for i in range(count)]
+
+    start = time.perf_counter()
+    for subject in subjects:
+        session.post(f'{base_url}/api/subjects', json=subject, headers=headers).raise_for_status()
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    response = session.post(f'{base_url}/api/subjects/batch', json={'subjects': subjects}, headers=headers)
+    response.raise_for_status()
+    batch = time.perf_counter() - start
+    server.shutdown()
+
+    return {
+        'subjects': count,
+        'single_requests_ms': round(single * 1000, 1),
+        'batch_request_ms': round(batch * 1000, 1),
+        'speedup': round(single / batch, 1),
+        'created': response.json()['created']
+    }
+
+@benchmark
+def bench_response_encoding(entries=20000, repeat=20):
+    """A 20k-entry timetable response: serialization time and bytes on the wire
+
+    Also checks that both encoders produce the same payload, for the
+    timetable and for values that need the provider's fallbacks.
+    """
+    import dataclasses
+    import decimal
+    import uuid
+    from datetime import date, datetime, timezone
+    import http_encoding
+    from factory import create_app
+
+    @dataclasses.dataclass
+    class Slot:
+        day: str
+        time_slot: str
+
+    special = {'generated_at': datetime(2024, 7, 1, 9, 30, tzinfo=timezone.utc), 'date': date(2024, 7, 1),
+               'credits': decimal.Decimal('3.5'), 'id': uuid.UUID(int=7), 'slot': Slot('Monday', '9:00-10:00'),
+               'name': 'Ré', 'by_id': {2: 'b', 10: 'a'}}
+    database = _campus_timetable(entries, departments=1)
+    results = {}
+    payloads = {}
+    for encoder in ('stdlib', 'orjson'):
+        flask_app = create_app({'DATABASE': database, 'JSON_ENCODER': encoder})
+        client = flask_app.test_client()
+        headers = login(client, 'campus.admin@srmist.edu.in')
+        payload = client.get('/api/timetable?department_id=1', headers=headers).get_json()
+
+        samples = []
+        with flask_app.app_context():
+            for _ in range(repeat):
+                start = time.perf_counter()
+                body = flask_app.json.response(payload).get_data()
+                samples.append(time.perf_counter() - start)
+            payloads[encoder] = [json.loads(body), json.loads(flask_app.json.response(special).get_data())]
+        wire = {}
+        for accept in ('identity', 'gzip', 'deflate'):
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                response = client.get('/api/timetable?department_id=1',
+                                      headers={**headers, 'Accept-Encoding': accept})
+                timings.append(time.perf_counter() - start)
+            wire[accept] = {'bytes': len(response.get_data()), 'request_p50_ms': percentiles(timings)['p50_ms']}
+        results[encoder] = {'serialize': percentiles(samples), 'raw_bytes': len(body), 'wire': wire}
+    if payloads['stdlib'] != payloads['orjson']:
+        raise AssertionError(f"Encoders disagree: {payloads['stdlib'][1]} != {payloads['orjson'][1]}")
+    results['encoders_agree'] = True
+
+    for level in (1, 6):
+        compress_samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            compressed = http_encoding.compress(body, 'gzip', level)
+            compress_samples.append(time.perf_counter() - start)
+        results[f'gzip_level_{level}'] = {**percentiles(compress_samples), 'bytes': len(compressed)}
+    return results
+
+_NODE_PARSE_SCRIPT = """
+const fs = require('fs');
+const [rowsText, columnarText, repeat] = [fs.readFileSync(process.argv[1], 'utf8'),
+                                         fs.readFileSync(process.argv[2], 'utf8'), Number(process.argv[3])];
+// Same loop as decodeColumnarTimetable in src/services/backendApi.ts
+function decode(p) {
+  const e = p.entries, rows = new Array(p.count);
+  for (let i = 0; i < p.count; i++) {
+    const s = e.staff[i], sub = e.subject[i], r = e.classroom[i];
+    rows[i] = {day: p.days[e.day[i]], time_slot: p.time_slots[e.slot[i]], subject_id: p.subjects.id[sub],
+               subject_name: p.subjects.name[sub], subject_code: p.subjects.code[sub], staff_id: p.staff.id[s],
+               staff_name: p.staff.name[s], classroom_id: p.classrooms.id[r], classroom_name: p.classrooms.name[r]};
+    if (e.id) rows[i].id = e.id[i];
+    if (e.locked) rows[i].locked = e.locked[i] === 1;
+  }
+  return rows;
+}
+function time(fn) {
+  const samples = [];
+  for (let i = 0; i < repeat; i++) { const t = process.hrtime.bigint(); fn(); samples.push(Number(process.hrtime.bigint() - t) / 1e6); }
+  return samples.sort((a, b) => a - b)[Math.floor(repeat / 2)];
+}
+console.log(JSON.stringify({rows_parse_ms: time(() => JSON.parse(rowsText)),
+                            columnar_parse_and_decode_ms: time(() => decode(JSON.parse(columnarText)))}));
+"""
+
+@benchmark
+def bench_columnar(entries=20000, repeat=20):
+    """Row vs. columnar timetable payloads: bytes, gzip bytes and client parse time
+
+    Client parse time is measured with node when it is on the PATH.
+    """
+    import gzip
+    import shutil
+    import subprocess
+    import timetable_format
+    from factory import create_app
+
+    database = _campus_timetable(entries, departments=1)
+    flask_app = create_app({'DATABASE': database})
+    client = flask_app.test_client()
+    headers = login(client, 'campus.admin@srmist.edu.in')
+    bodies = {fmt: client.get(f'/api/timetable?department_id=1&format={fmt}', headers=headers).get_data()
+              for fmt in timetable_format.FORMATS}
+
+    rows = json.loads(bodies['rows'])['timetable']
+    start = time.perf_counter()
+    for _ in range(repeat):
+        timetable_format.to_columnar(rows)
+    encode_ms = (time.perf_counter() - start) / repeat * 1000
+
+    results = {fmt: {'bytes': len(body), 'gzip_bytes': len(gzip.compress(body, 1))} for fmt, body in bodies.items()}
+    results['columnar_encode_ms'] = round(encode_ms, 2)
+    node = shutil.which('node')
+    if node:
+        directory = tempfile.mkdtemp(prefix='srm-bench-')
+        paths = []
+        for fmt in timetable_format.FORMATS:
+            path = os.path.join(directory, f'{fmt}.json')
+            with open(path, 'w') as f:
+                f.write(json.dumps(json.loads(bodies[fmt])['timetable']))
+            paths.append(path)
+        output = subprocess.run([node, '-e', _NODE_PARSE_SCRIPT, *paths, str(repeat)],
+                                capture_output=True, text=True, check=True).stdout
+        results['client'] = json.loads(output)
+    return results
+
+@benchmark
+def bench_diff(entries=100000, changed=0.1):
+    """Diff a campus-size saved timetable against a proposal with 10% of lectures moved"""
+    import random
+    import db
+    import timetable_diff
+    from timetable_slots import DAYS, TIME_SLOTS
+
+    database = _campus_timetable(entries)
+    conn = db.connect(database)
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, day, time_slot, subject_id, staff_id, classroom_id FROM timetables')
+    saved = [{'id': row[0], 'day': row[1], 'time_slot': row[2], 'subject_id': row[3], 'staff_id': row[4],
+              'classroom_id': row[5]} for row in cursor.fetchall()]
+    conn.close()
+
+    rng = random.Random(3)
+    proposed = [dict(entry) for entry in saved]
+    for entry in rng.sample(proposed, int(len(proposed) * changed)):
+        entry['day'], entry['time_slot'] = rng.choice(DAYS), rng.choice(TIME_SLOTS)
+    rng.shuffle(proposed)
+
+    start = time.perf_counter()
+    result = timetable_diff.diff_timetables(saved, proposed)
+    elapsed = time.perf_counter() - start
+    return {'entries': entries, 'diff_ms': round(elapsed * 1000, 1), **result['summary']}
+
+@benchmark
+def bench_edits(entries=20000, departments=20, edits_per_thread=200, threads=8):
+    """Latency of concurrent move edits spread across departments
+
+    'indexed' keeps each department's occupancy index warm between edits;
+    'rebuild' drops it before every edit, i.e. re-reading the department's
+    timetable for each conflict check.
+    """
+    import random
+    import db
+    import occupancy
+    from timetable_slots import DAYS, TIME_SLOTS
+
+    database = _campus_timetable(entries * 2, departments)
+    conn = db.connect(database)
+    conn.execute('PRAGMA journal_mode=WAL')
+    # Leave half of each department's room slots free so moves can succeed
+    conn.execute('DELETE FROM timetables WHERE id % 2 = 0')
+    conn.commit()
+    by_department = {}
+    for entry_id, department_id in conn.execute('SELECT id, department_id FROM timetables'):
+        by_department.setdefault(department_id, []).append(entry_id)
+    rooms = {}
+    for classroom_id, department_id in conn.execute('SELECT id, department_id FROM classrooms'):
+        rooms.setdefault(department_id, []).append(classroom_id)
+    conn.close()
+    department_ids = sorted(by_department)
+
+    def run(rebuild):
+        samples = []
+        outcomes = {'moved': 0, 'conflict': 0}
+        lock = threading.Lock()
+
+        def worker(n):
+            rng = random.Random(n)
+            worker_conn = db.connect(database)
+            worker_conn.execute('PRAGMA busy_timeout = 5000')
+            for i in range(edits_per_thread):
+                department_id = department_ids[(n + i * threads) % len(department_ids)]
+                if rebuild:
+                    occupancy.invalidate(department_id)
+                start = time.perf_counter()
+                try:
+                    occupancy.move_entry(worker_conn, rng.choice(by_department[department_id]), rng.choice(DAYS),
+                                         rng.choice(TIME_SLOTS), rng.choice(rooms[department_id]))
+                    outcome = 'moved'
+                except occupancy.EditError:
+                    outcome = 'conflict'
+                elapsed = time.perf_counter() - start
+                with lock:
+                    samples.append(elapsed)
+                    outcomes[outcome] += 1
+            worker_conn.close()
+
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        for worker_thread in workers:
+            worker_thread.start()
+        for worker_thread in workers:
+            worker_thread.join()
+        return {**percentiles(samples), **outcomes}
+
+    run(rebuild=False)  # warm the indexes
+    return {'entries': entries, 'departments': departments, 'threads': threads,
+            'indexed': run(rebuild=False), 'rebuild': run(rebuild=True)}
+
+@benchmark
+def bench_exams(departments=100, subjects_per_department=30, cohort_size=6, repeat=5):
+    """Campus-wide exam scheduling: conflict graph build, DSATUR colouring and room packing"""
+    import random
+    import db
+    import exam_scheduler
+
+    flask_app, campus = campus_app(departments=departments, subjects_per_department=subjects_per_department)
+    conn = db.connect(flask_app.config['DATABASE'])
+    cursor = conn.cursor()
+    rng = random.Random(5)
+    cursor.execute('SELECT id FROM subjects ORDER BY id')
+    # Consecutive subjects form a cohort, so every student group sits cohort_size exams
+    cursor.executemany('UPDATE subjects SET enrollment = ?, cohort = ? WHERE id = ?', [
+        (rng.choice([25, 40, 60, 120, 180]), f'C{i // cohort_size}', subject_id)
+        for i, (subject_id,) in enumerate(cursor.fetchall())
+    ])
+    conn.commit()
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = exam_scheduler.schedule_saved_subjects(cursor, None)
+        samples.append(time.perf_counter() - start)
+    conn.close()
+    return {'departments': departments, **result['stats'], 'slot_count': result['slot_count'],
+            'lower_bound': result['lower_bound'], 'unscheduled': len(result['unscheduled']),
+            **percentiles(samples)}
+
+@benchmark
+def bench_substitutes(entries=20000, departments=10, repeat=2000):
+    """Substitute lookups from the warm bitset index vs. rebuilding it per query"""
+    import random
+    import db
+    import substitutes
+
+    database = _campus_timetable(entries, departments)
+    conn = db.connect(database)
+    cursor = conn.cursor()
+    cursor.execute('SELECT id FROM timetables')
+    entry_ids = [row[0] for row in cursor.fetchall()]
+    rng = random.Random(4)
+
+    def run(rebuild):
+        samples, found = [], 0
+        for _ in range(repeat):
+            entry_id = rng.choice(entry_ids)
+            if rebuild:
+                with substitutes._indexes_lock:
+                    substitutes._indexes.clear()
+            start = time.perf_counter()
+            result = substitutes.find_substitutes(cursor, entry_id)
+            samples.append(time.perf_counter() - start)
+            found += len(result['substitutes'])
+        return {**percentiles(samples), 'mean_substitutes': round(found / repeat, 1)}
+
+    run(rebuild=False)  # warm the indexes
+    results = {'entries': entries, 'departments': departments, 'indexed': run(rebuild=False),
+               'rebuild': run(rebuild=True)}
+    conn.close()
+    return results
+
+@benchmark
+def bench_free_rooms(entries=100000, departments=50, repeat=500):
+    """Campus-wide free-room queries from the slot bitmap vs. a NOT IN query per request"""
+    import random
+    import db
+    import room_index
+    from timetable_slots import DAYS, TIME_SLOTS
+
+    database = _campus_timetable(entries, departments)
+    conn = db.connect(database)
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM timetables WHERE id % 4 = 0')  # leave some rooms free
+    conn.commit()
+    rng = random.Random(6)
+    queries = [(rng.choice(DAYS), rng.choice(TIME_SLOTS[:-1]), rng.choice([1, 2]), rng.choice([0, 40, 60, 100]))
+               for _ in range(repeat)]
+
+    start = time.perf_counter()
+    room_index.get_index(cursor, room_index.CAMPUS)
+    build_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    indexed, scanned = [], []
+    for day, time_slot, length, min_capacity in queries:
+        start = time.perf_counter()
+        room_index.find_free_rooms(cursor, room_index.CAMPUS, day, time_slot, length, min_capacity)
+        indexed.append(time.perf_counter() - start)
+
+        time_slots = room_index.slot_range(time_slot, length)
+        start = time.perf_counter()
+        cursor.execute(f"""
+            SELECT c.id, c.name, c.capacity, c.department_id FROM classrooms c
+            WHERE c.capacity >= ? AND c.id NOT IN (
+                SELECT classroom_id FROM timetables
+                WHERE day = ? AND time_slot IN ({', '.join('?' for _ in time_slots)}))
+            ORDER BY c.capacity, c.id
+        """, (min_capacity, day, *time_slots))
+        cursor.fetchall()
+        scanned.append(time.perf_counter() - start)
+    conn.close()
+    return {'entries': entries, 'build_ms': build_ms, 'indexed': percentiles(indexed),
+            'sql': percentiles(scanned)}
+
+@benchmark
+def bench_schedules(staff=5000, departments=50, lectures_per_staff=6, threads=16):
+    """"My week" reads for every staff member at once: stored document vs. joining per request
+
+    Each of `threads` workers reads its share of the staff concurrently on its
+    own connection; 'join' runs the timetables/subjects/users/classrooms join
+    and builds the document, 'materialized' is the primary-key lookup.
+    """
+    import db
+    import schedules
+
+    database = _campus_timetable(staff * lectures_per_staff, departments)
+    conn = db.connect(database)
+    cursor = conn.cursor()
+    cursor.execute('SELECT id FROM departments')
+    department_ids = [row[0] for row in cursor.fetchall()]
+    start = time.perf_counter()
+    for department_id in department_ids:
+        schedules.refresh(cursor, department_id)
+    conn.commit()
+    refresh_ms = round((time.perf_counter() - start) * 1000 / len(department_ids), 1)
+    cursor.execute("SELECT id, department_id FROM users WHERE role = 'staff'")
+    staff_rows = cursor.fetchall()
+    conn.close()
+
+    def join_read(worker_conn, staff_id, department_id):
+        worker_cursor = worker_conn.cursor()
+        worker_cursor.execute("SELECT name FROM users WHERE id = ?", (staff_id,))
+        name = worker_cursor.fetchone()[0]
+        lectures = schedules._lectures(worker_cursor, department_id, 'staff_id', [staff_id])[staff_id]
+        return json.dumps({'staff_id': staff_id, 'name': name, 'department_id': department_id, 'lectures': lectures})
+
+    def materialized_read(worker_conn, staff_id, department_id):
+        return schedules.staff_schedule(worker_conn, staff_id)
+
+    def run(read):
+        samples = []
+        lock = threading.Lock()
+
+        def worker(n):
+            worker_conn = db.connect(database)
+            local = []
+            for staff_id, department_id in staff_rows[n::threads]:
+                start = time.perf_counter()
+                read(worker_conn, staff_id, department_id)
+                local.append(time.perf_counter() - start)
+            worker_conn.close()
+            with lock:
+                samples.extend(local)
+
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        start = time.perf_counter()
+        for worker_thread in workers:
+            worker_thread.start()
+        for worker_thread in workers:
+            worker_thread.join()
+        elapsed = time.perf_counter() - start
+        return {**percentiles(samples), 'wall_s': round(elapsed, 2),
+                'reads_per_s': round(len(samples) / elapsed, 1)}
+
+    return {'staff': len(staff_rows), 'threads': threads, 'refresh_ms_per_department': refresh_ms,
+            'join': run(join_read), 'materialized': run(materialized_read)}
+
+@benchmark
+def bench_admission(duration=10.0, generators=12, departments=6, time_budget=1.0, pool_size=4):
+    """Cheap-route latency while generate requests saturate the server, with and without admission control
+
+    The server has a fixed pool of pool_size threads, like one gunicorn worker.
+    """
+    import requests
+
+    def run(enabled):
+        flask_app, campus = campus_app(config={'ADMISSION_ENABLED': enabled}, departments=departments,
+                                        staff_per_department=200, subjects_per_department=100,
+                                        classrooms_per_department=60)
+        server, base_url = serve(flask_app, pool_size)
+        token = requests.post(base_url + '/api/auth/login', json={
+            'email': 'campus.admin@srmist.edu.in', 'password': 'staff123'}).json()['token']
+        headers = {'Authorization': f'Bearer {token}'}
+        stop = threading.Event()
+        statuses = {}
+        lock = threading.Lock()
+
+        def generate(n):
+            session = requests.Session()
+            department_ids = campus['department_ids']
+            i = n
+            while not stop.is_set():
+                response = session.post(base_url + '/api/timetable/generate', headers=headers, json={
+                    'department_id': department_ids[i % len(department_ids)], 'time_budget': time_budget})
+                i += 1
+                with lock:
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                if response.status_code in (429, 503):
+                    stop.wait(min(float(response.headers.get('Retry-After', 1)), 1.0))
+
+        workers = [threading.Thread(target=generate, args=(n,)) for n in range(generators)]
+        for worker_thread in workers:
+            worker_thread.start()
+        time.sleep(1.0)  # let the generate requests pile up
+
+        session = requests.Session()
+        samples = []
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            session.get(base_url + '/api/staff', headers=headers)
+            samples.append(time.perf_counter() - start)
+            time.sleep(0.05)
+        stop.set()
+        for worker_thread in workers:
+            worker_thread.join()
+        server.shutdown()
+        return {'staff_route': percentiles(samples),
+                'generate_statuses': {str(code): count for code, count in sorted(statuses.items())}}
+
+    logging.getLogger('app_enhanced').setLevel(logging.WARNING)
+    return {'generators': generators, 'unlimited': run(False), 'admission': run(True)}
+
+@benchmark
+def bench_analytics(entries=100000, departments=50):
+    """Campus analytics from NumPy occupancy tensors vs. the same metrics with dict loops"""
+    import analytics
+    import db
+    from timetable_slots import DAYS, TIME_SLOTS
+
+    database = _campus_timetable(entries, departments)
+    conn = db.connect(database)
+    cursor = conn.cursor()
+
+    start = time.perf_counter()
+    cursor.execute('SELECT day, time_slot, staff_id, classroom_id FROM timetables')
+    rows = cursor.fetchall()
+    cursor.execute("SELECT id, name FROM users WHERE role = 'staff'")
+    staff = cursor.fetchall()
+    cursor.execute('SELECT id, name, capacity FROM classrooms')
+    rooms = cursor.fetchall()
+    load_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    analytics.build_report(rows, staff, rooms)
+    numpy_ms = (time.perf_counter() - start) * 1000
+
+    # Baseline: room occupancy, staff hours per day and idle gaps with plain dicts
+    start = time.perf_counter()
+    slot_index = {slot: i for i, slot in enumerate(TIME_SLOTS)}
+    room_cells, staff_slots = {}, {}
+    for day, time_slot, staff_id, classroom_id in rows:
+        room_cells.setdefault(classroom_id, set()).add((day, time_slot))
+        staff_slots.setdefault((staff_id, day), set()).add(slot_index[time_slot])
+    utilization = {room[0]: len(room_cells.get(room[0], ())) / (len(DAYS) * len(TIME_SLOTS)) for room in rooms}
+    hours, gaps = {}, {}
+    for (staff_id, day), taught in staff_slots.items():
+        hours[(staff_id, day)] = len(taught)
+        gaps[(staff_id, day)] = max(taught) - min(taught) + 1 - len(taught)
+    python_ms = (time.perf_counter() - start) * 1000
+
+    analytics.load_report(cursor, analytics.CAMPUS)
+    start = time.perf_counter()
+    analytics.load_report(cursor, analytics.CAMPUS)
+    cached_ms = (time.perf_counter() - start) * 1000
+    conn.close()
+    return {'entries': len(rows), 'staff': len(staff), 'rooms': len(rooms), 'load_ms': round(load_ms, 1),
+            'numpy_report_ms': round(numpy_ms, 1), 'python_core_metrics_ms': round(python_ms, 1),
+            'cached_ms': round(cached_ms, 3)}
+
+@benchmark
+def bench_calendar(entries=20000, departments=20, weeks=20):
+    """Campus-wide semester expansion: streamed occurrences and ICS vs. a materialized list
+
+    Peak traced memory of the streamed expansion should not grow with the
+    number of weeks; the materialized list grows with every occurrence.
+    """
+    import datetime
+    import gc
+    import tracemalloc
+    import semester_calendar
+
+    database = _campus_timetable(entries, departments)
+    start_date = datetime.date(2026, 7, 6)  # a Monday
+
+    def semester(span):
+        end_date = start_date + datetime.timedelta(weeks=span) - datetime.timedelta(days=1)
+        return {'id': 1, 'name': 'Bench', 'start_date': start_date.isoformat(), 'end_date': end_date.isoformat()}
+
+    def peak_mib(run):
+        gc.collect()
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return round(peak / 2 ** 20, 2)
+
+    def drain(chunks):
+        count = 0
+        for _ in chunks:
+            count += 1
+        return count
+
+    streamed = {}
+    for span in (2, weeks):
+        streamed[f'{span}_weeks_peak_mib'] = peak_mib(
+            lambda: drain(semester_calendar.json_array(semester_calendar.occurrences(database, semester(span)))))
+    materialized_peak = peak_mib(lambda: list(semester_calendar.occurrences(database, semester(weeks))))
+
+    start = time.perf_counter()
+    count = sum(1 for _ in semester_calendar.occurrences(database, semester(weeks)))
+    expand_s = time.perf_counter() - start
+    start = time.perf_counter()
+    drain(semester_calendar.json_array(semester_calendar.occurrences(database, semester(weeks))))
+    json_s = time.perf_counter() - start
+    start = time.perf_counter()
+    drain(semester_calendar.ics_feed(semester(weeks), semester_calendar.occurrences(database, semester(weeks))))
+    ics_s = time.perf_counter() - start
+    return {'entries': entries, 'weeks': weeks, 'occurrences': count, 'streamed': streamed,
+            'materialized_peak_mib': materialized_peak,
+            'occurrences_per_s': round(count / expand_s), 'json_s': round(json_s, 2), 'ics_s': round(ics_s, 2)}
+
+@benchmark
+def bench_checkpoint(staff=2000, subjects=2000, classrooms=120, time_budget=6.0, interval=1.0):
+    """Solver throughput with and without periodic checkpoints, the cost of one write, and resuming
+
+    The department needs more lectures than it has room slots, so every pass
+    leaves some unplaced and the solve runs for its whole budget. Both runs
+    use the same seed and budget; the checkpointed one writes every
+    `interval` seconds (the default in production is 5). A single pass is
+    then killed midway and resumed, and must continue from its last
+    checkpoint to the same timetable as an uninterrupted pass.
+    """
+    import shutil
+    import department_cache
+    import solver_checkpoint
+    from ai_timetable import TimetableGenerator
+
+    flask_app, campus = campus_app(departments=1, staff_per_department=staff, subjects_per_department=subjects,
+                                   classrooms_per_department=classrooms)
+    database = flask_app.config['DATABASE']
+    department_id = campus['department_ids'][0]
+    department_cache.clear()
+    directory = tempfile.mkdtemp(prefix='srm-checkpoints-')
+
+    def solve(checkpoint_dir, **kwargs):
+        generator = TimetableGenerator(database, checkpoint_dir=checkpoint_dir, checkpoint_interval=interval,
+                                       seed=1)
+        with contextlib.redirect_stdout(io.StringIO()):
+            return generator, generator.generate_timetable(department_id, time_budget=time_budget, dry_run=True,
+                                                           **kwargs)
+
+    plain, plain_result = solve(None)
+    checkpointed, checkpointed_result = solve(directory)
+    writes = checkpointed.solve_stats['checkpoint_writes']
+    if not checkpointed_result['partial'] or writes == 0:
+        raise AssertionError(f'The solve finished early with {writes} checkpoint writes')
+
+    # Time writes directly, with a state the size of a finished solve
+    checkpointer = solver_checkpoint.Checkpointer.for_department(directory, department_id, database, interval=0)
+    checkpointer.load('bench')
+    flat = [value for entry in checkpointed_result['timetable'] for value in (0, 0, 0, entry['classroom_id'])]
+    state = {'rng': solver_checkpoint.rng_state(checkpointed.rng.getstate()), 'passes': 1, 'best': flat,
+             'best_unplaced': [], 'pass': {'order': list(range(len(flat) // 4)), 'position': 0,
+                                           'placed': flat, 'unplaced': []}}
+    samples = []
+    for _ in range(50):
+        start = time.perf_counter()
+        checkpointer.save(state)
+        samples.append(time.perf_counter() - start)
+    checkpointer.discard_all()
+
+    # Kill a single pass halfway, checkpointing at every stop check, then resume it with another seed
+    class Killed(Exception):
+        pass
+
+    def key(timetable):
+        return [(e['day'], e['time_slot'], e['staff_id'], e['subject_id'], e['classroom_id']) for e in timetable]
+
+    def run_once(seed, **kwargs):
+        generator = TimetableGenerator(database, checkpoint_dir=directory, checkpoint_interval=0, seed=seed)
+        with contextlib.redirect_stdout(io.StringIO()):
+            return generator.generate_timetable(department_id, dry_run=True, **kwargs)
+
+    uninterrupted = TimetableGenerator(database, seed=1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = uninterrupted.generate_timetable(department_id, dry_run=True)
+    total = len(expected['timetable']) + expected['unplaced_count']
+    checks = []  # (placed, position) at each stop check of the killed pass
+
+    def kill_halfway(event, **data):
+        if event == 'progress':
+            checks.append((data['placed'], total - data['remaining']))
+            if data['remaining'] <= total // 2:
+                raise Killed()
+
+    killed = run_once(1, progress=kill_halfway)
+    if 'error' not in killed or len(checks) < 2:
+        raise AssertionError('The pass was not killed midway')
+    # The checkpoint at the kill point is never written: the kill comes first
+    saved_placed, saved_position = checks[-2]
+    resumed_events = []
+    resumed = run_once(99, progress=lambda event, **data: resumed_events.append(data) if event == 'resumed' else None)
+    if resumed_events != [{'passes': 0, 'position': saved_position, 'total': total}]:
+        raise AssertionError(f'Resumed at {resumed_events}, expected position {saved_position} of pass 0')
+    if not resumed['resumed'] or key(resumed['timetable']) != key(expected['timetable']):
+        raise AssertionError('The resumed pass did not finish like the uninterrupted one')
+    leftover = os.listdir(directory)
+    if leftover:
+        raise AssertionError(f'Checkpoints left after the resumed run: {leftover}')
+    shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        'assignments': plain_result['unplaced_count'] + len(plain_result['timetable']),
+        'room_slots': classrooms * len(plain.days) * len(plain.time_slots),
+        'time_budget_s': time_budget,
+        'without_checkpoints': {'passes': plain.solve_stats['passes'], 'placed': len(plain_result['timetable'])},
+        'with_checkpoints': {'passes': checkpointed.solve_stats['passes'],
+                             'placed': len(checkpointed_result['timetable']), 'writes': writes,
+                             'write_ms_mean': round(checkpointed.solve_stats['checkpoint_seconds'] * 1000
+                                                    / max(writes, 1), 2)},
+        'write': {**percentiles(samples), 'bytes': checkpointer.last_size},
+        'overhead_at_5s_interval_pct': round(sorted(samples)[len(samples) // 2] / 5.0 * 100, 3),
+        'kill_and_resume': {'killed_at_position': checks[-1][1], 'resumed_at_position': saved_position,
+                            'placed_at_checkpoint': saved_placed, 'placed': len(resumed['timetable']),
+                            'matches_uninterrupted': True}
+    }
+
+@benchmark
+def bench_demand(seeds=5):
+    """Fill rate and solve time: role-based lecture counts vs. the credit demand model
+
+    Single passes per department (as without a time budget), averaged over
+    `seeds` solver seeds. On the default synthetic campus, and on one with
+    few rooms per department, every staff member teaches a few hours and
+    the order of placement makes no difference. On loaded_staff six staff
+    per department are the sole teachers of twelve subjects each (about 33
+    of the 35 weekly slots) and rooms are just short of the demand; there
+    placing the most loaded staff first raises the fill rate.
+    """
+    import sqlite3
+    import department_cache
+    from ai_timetable import TimetableGenerator
+
+    class RoleBased(TimetableGenerator):
+        """The previous model: 3 lectures per subject for assistant professors, 4 otherwise, in random order"""
+        HARDEST_FIRST = False
+
+        def _build_assignments(self, staff_subjects, subjects_dict):
+            return [{'staff_id': staff_id, 'staff_name': info['name'], 'subject_id': subject_id,
+                     'subject_name': subjects_dict[subject_id]['name'],
+                     'subject_code': subjects_dict[subject_id]['code'], 'difficulty': 0}
+                    for staff_id, info in staff_subjects.items() for subject_id in info['subjects']
+                    for _ in range(3 if info['role'] == 'assistant_professor' else 4)]
+
+    class CreditRandomOrder(TimetableGenerator):
+        HARDEST_FIRST = False
+
+    def load_staff(database, department_ids, loaded=6, subjects_each=12):
+        """Give the first `loaded` staff of each department subjects_each subjects of their own, the rest one"""
+        conn = sqlite3.connect(database)
+        for department_id in department_ids:
+            subjects = iter(row[0] for row in conn.execute(
+                'SELECT id FROM subjects WHERE department_id = ? ORDER BY id', (department_id,)))
+            staff = [row[0] for row in conn.execute(
+                "SELECT id FROM users WHERE role = 'staff' AND department_id = ? ORDER BY id", (department_id,))]
+            conn.executemany('UPDATE users SET subjects_selected = ? WHERE id = ?', [
+                (','.join(str(next(subjects)) for _ in range(subjects_each if i < loaded else 1)), staff_id)
+                for i, staff_id in enumerate(staff)])
+        conn.commit()
+        conn.close()
+
+    datasets = {
+        'default': ({'departments': 5}, None),
+        'tight_rooms': ({'departments': 5, 'staff_per_department': 60, 'classrooms_per_department': 3}, None),
+        'loaded_staff': ({'departments': 5, 'staff_per_department': 20, 'subjects_per_department': 120,
+                          'classrooms_per_department': 7}, load_staff)
+    }
+    results = {}
+    for dataset, (seed_kwargs, prepare) in datasets.items():
+        # Every dataset reuses department ids 1..n at data_version 0
+        department_cache.clear()
+        flask_app, campus = campus_app(**seed_kwargs)
+        database = flask_app.config['DATABASE']
+        if prepare is not None:
+            prepare(database, campus['department_ids'])
+        results[dataset] = {}
+        for label, generator_class in (('role_based', RoleBased), ('credit_random_order', CreditRandomOrder),
+                                       ('credit_hardest_first', TimetableGenerator)):
+            fill, seconds, demanded = [], [], 0
+            for seed in range(seeds):
+                for department_id in campus['department_ids']:
+                    generator = generator_class(database, seed=seed)
+                    start = time.perf_counter()
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        result = generator.generate_timetable(department_id, dry_run=True)
+                    seconds.append(time.perf_counter() - start)
+                    lectures = len(result['timetable']) + result['unplaced_count']
+                    fill.append(len(result['timetable']) / lectures if lectures else 1.0)
+                    demanded += lectures
+            results[dataset][label] = {
+                'lectures_per_department': round(demanded / seeds / len(campus['department_ids']), 1),
+                'fill_rate': round(statistics.mean(fill), 4),
+                'solve_ms_p50': round(statistics.median(seconds) * 1000, 2)
+            }
+        results[dataset]['hardest_first_fill_gain'] = round(
+            results[dataset]['credit_hardest_first']['fill_rate']
+            - results[dataset]['credit_random_order']['fill_rate'], 4)
+    return results
+
+@benchmark
+def bench_llm_refine(unplaced=200, classrooms=40, latency=0.05, max_concurrency=4, max_prompt_chars=2000):
+    """LLM refinement against a local stub of the chat completions API
+
+    The stub answers after `latency` seconds, placing each lecture of the
+    prompt in the first listed free room at a slot its staff is not busy.
+    A cold run shows the concurrent batches sharing pooled keep-alive
+    connections; a second run of the same inputs must be served from the
+    response cache without any request reaching the stub.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    import llm_refine
+    from timetable_slots import DAYS, TIME_SLOTS
+
+    seen = {'requests': 0, 'connections': set(), 'prompt_chars': []}
+    seen_lock = threading.Lock()
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, so pooled connections are reused
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            prompt = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['messages'][1]['content']
+            with seen_lock:
+                seen['requests'] += 1
+                seen['connections'].add(self.client_address)
+                seen['prompt_chars'].append(len(prompt))
+            lines = prompt.split('\n')
+            free = {}
+            for line in lines:
+                if line.startswith('FREE '):
+                    slot, rooms = line[len('FREE '):].split(':')
+                    free[slot] = rooms.split(',')
+            moves = []
+            for line in lines:
+                if line.startswith('L') and line != 'LECTURES':
+                    fields = dict(field.split('=') for field in line.split()[1:])
+                    busy = set(fields['busy'].split(','))
+                    lecture = int(line.split()[0][1:])
+                    # Start at a different slot per lecture so concurrent batches rarely collide
+                    candidates = list(free.items())
+                    offset = lecture % len(candidates) if candidates else 0
+                    for slot, rooms in candidates[offset:] + candidates[:offset]:
+                        if slot not in busy and rooms:
+                            day, time_slot = slot.split('.')
+                            moves.append({'lecture': lecture, 'day': int(day),
+                                          'slot': int(time_slot), 'room': int(rooms.pop(0))})
+                            break
+            time.sleep(latency)
+            body = json.dumps({'choices': [{'message': {'content': json.dumps({'moves': moves})}}]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # Five of every six slots of each room are taken (by one resident teacher per room), and the
+    # staff of the unplaced lectures already teach in every other slot
+    classrooms_dict = {room_id: {'name': f'Room {room_id}'} for room_id in range(1, classrooms + 1)}
+    slots = [(day, time_slot) for day in DAYS for time_slot in TIME_SLOTS]
+    timetable = [{'day': day, 'time_slot': time_slot, 'staff_id': 100000 + room_id, 'classroom_id': room_id}
+                 for room_id in classrooms_dict for index, (day, time_slot) in enumerate(slots)
+                 if (index + room_id) % 6]
+    lectures = [{'staff_id': index, 'staff_name': f'Staff {index}', 'subject_id': index,
+                 'subject_name': f'Subject {index}', 'subject_code': f'S{index}'} for index in range(unplaced)]
+    # Their other lectures are in rooms outside this refinement (negative ids)
+    timetable += [{'day': day, 'time_slot': time_slot, 'staff_id': lecture['staff_id'],
+                   'classroom_id': -1 - lecture['staff_id']}
+                  for lecture in lectures for day, time_slot in slots[lecture['staff_id'] % 2::2]]
+
+    refiner = llm_refine.LLMRefiner(api_key='stub',
+                                    api_url=f'http://127.0.0.1:{server.server_port}/v1/chat/completions',
+                                    max_concurrency=max_concurrency, max_prompt_chars=max_prompt_chars)
+    llm_refine.clear_cache()
+    results = {}
+    try:
+        for run in ('cold', 'cached'):
+            requests_before = seen['requests']
+            start = time.perf_counter()
+            refined, remaining, stats = refiner.refine(timetable, lectures, DAYS, TIME_SLOTS, classrooms_dict)
+            elapsed = time.perf_counter() - start
+            rooms = [(e['day'], e['time_slot'], e['classroom_id']) for e in refined]
+            staff = [(e['staff_id'], e['day'], e['time_slot']) for e in refined]
+            results[run] = {**stats, 'remaining': len(remaining), 'stub_requests': seen['requests'] - requests_before,
+                            'seconds': round(elapsed, 3),
+                            'conflicts': len(rooms) - len(set(rooms)) + len(staff) - len(set(staff))}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    batches = results['cold']['requests'] + results['cold']['cached'] + results['cold']['failed']
+    results['connections'] = len(seen['connections'])
+    results['serial_seconds'] = round(batches * latency, 3)
+    results['max_prompt_chars'] = max(seen['prompt_chars'])
+    if results['connections'] > max_concurrency:
+        raise AssertionError(f"{results['connections']} connections for {max_concurrency} concurrent requests")
+    if results['cached']['stub_requests'] or results['cached']['cached'] != batches:
+        raise AssertionError(f"Repeated refinement was not served from the cache: {results['cached']}")
+    if results['max_prompt_chars'] > max_prompt_chars:
+        raise AssertionError(f"Prompt of {results['max_prompt_chars']} chars exceeds {max_prompt_chars}")
+    if results['cold']['conflicts'] or results['cached']['conflicts']:
+        raise AssertionError('Refinement applied a conflicting move')
+    return results
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(json.dumps({name: BENCHMARKS[name]()}, indent=2))
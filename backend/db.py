@@ -0,0 +1,204 @@
+"""SQLite connection helper shared by the routes and the generator.
+
+Connections are instrumented: every statement is counted in metrics and,
+while a trace is active (one per request), recorded with its duration and
+row count. Statements slower than SLOW_QUERY_MS are logged together with
+their EXPLAIN QUERY PLAN.
+"""
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from flask import current_app, g, has_app_context, request
+
+import metrics
+
+DEFAULT_DATABASE = 'timetable.db'
+
+logger = logging.getLogger(__name__)
+
+slow_query_ms = float(os.getenv('SLOW_QUERY_MS', '100'))
+
+_current_trace = ContextVar('query_trace', default=None)
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a request or block runs more statements than its budget"""
+
+class QueryRecord:
+    __slots__ = ('sql', 'duration', 'rows')
+
+    def __init__(self, sql: str, duration: float, rows: int):
+        self.sql = sql
+        self.duration = duration
+        self.rows = rows
+
+    def to_dict(self):
+        return {'sql': ' '.join(self.sql.split()), 'duration_ms': round(self.duration * 1000, 3), 'rows': self.rows}
+
+class QueryTrace:
+    """Statements executed during one request or traced block"""
+
+    def __init__(self, label: str = ''):
+        self.label = label
+        self.queries: List[QueryRecord] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    @property
+    def total_duration(self) -> float:
+        return sum(q.duration for q in self.queries)
+
+    def summary(self):
+        return {
+            'label': self.label,
+            'count': self.count,
+            'duration_ms': round(self.total_duration * 1000, 3),
+            'queries': [q.to_dict() for q in self.queries]
+        }
+
+def _explain(connection, sql, parameters) -> str:
+    try:
+        plain = sqlite3.Cursor(connection)
+        plain.execute('EXPLAIN QUERY PLAN ' + sql, parameters)
+        return '; '.join(row[-1] for row in plain.fetchall())
+    except sqlite3.Error as e:
+        return f'unavailable ({e})'
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that records statement counts, latency and row counts"""
+
+    _record = None
+
+    def _finish(self, sql, parameters, duration):
+        metrics.observe_query(sql, duration)
+
+        trace = _current_trace.get()
+        if trace is not None:
+            # DML reports affected rows now; SELECT rows are counted as they are fetched
+            self._record = QueryRecord(sql, duration, max(self.rowcount, 0))
+            trace.queries.append(self._record)
+
+        if duration * 1000 >= slow_query_ms:
+            plan = _explain(self.connection, sql, parameters) if not isinstance(parameters, list) else 'n/a'
+            logger.warning('Slow query (%.1f ms): %s | plan: %s', duration * 1000, ' '.join(sql.split()), plan)
+
+    def execute(self, sql, parameters=()):
+        self._record = None
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._finish(sql, parameters, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._record = None
+        seq_of_parameters = list(seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._finish(sql, seq_of_parameters, time.perf_counter() - start)
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None and self._record is not None:
+            self._record.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self._record is not None:
+            self._record.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        if self._record is not None:
+            self._record.rows += len(rows)
+        return rows
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def database_path(database: str = None) -> str:
+    """Resolve the database file: explicit path, then app config, then default"""
+    if database:
+        return database
+    if has_app_context():
+        return current_app.config.get('DATABASE', DEFAULT_DATABASE)
+    return DEFAULT_DATABASE
+
+def connect(database: str = None) -> sqlite3.Connection:
+    """Open an instrumented connection"""
+    return sqlite3.connect(database_path(database), factory=InstrumentedConnection)
+
+def current_trace() -> Optional[QueryTrace]:
+    return _current_trace.get()
+
+@contextmanager
+def trace_queries(label: str = '', budget: Optional[int] = None):
+    """Trace the statements run inside the block, optionally enforcing a budget
+
+    Useful in tests to catch N+1 regressions:
+
+        with db.trace_queries(budget=3):
+            client.get('/api/staff', headers=headers)
+    """
+    trace = QueryTrace(label)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+    if budget is not None and trace.count > budget:
+        raise QueryBudgetExceeded(f'{label or "block"} ran {trace.count} queries, budget is {budget}')
+
+def _start_request_trace():
+    g._query_trace_token = _current_trace.set(QueryTrace(f'{request.method} {request.path}'))
+
+def _finish_request_trace(response):
+    token = g.pop('_query_trace_token', None)
+    if token is None:
+        return response
+    trace = _current_trace.get()
+    _current_trace.reset(token)
+
+    config = current_app.config
+    if config.get('QUERY_TRACE_HEADERS'):
+        response.headers['X-Query-Count'] = str(trace.count)
+        response.headers['X-Query-Time-Ms'] = f'{trace.total_duration * 1000:.3f}'
+
+    rule = request.url_rule.rule if request.url_rule is not None else None
+    budget = config.get('QUERY_BUDGETS', {}).get(rule, config.get('QUERY_BUDGET'))
+    if budget is not None and trace.count > budget:
+        message = f'{trace.label} ran {trace.count} queries, budget is {budget}'
+        if config.get('QUERY_BUDGET_RAISE'):
+            raise QueryBudgetExceeded(message)
+        logger.warning('Query budget exceeded: %s', message)
+    return response
+
+def init_app(app):
+    """Trace the statements of every request on a Flask app
+
+    Config keys: SLOW_QUERY_MS (log threshold), QUERY_BUDGET (default
+    statements per request), QUERY_BUDGETS (per-route overrides keyed by URL
+    rule), QUERY_BUDGET_RAISE (raise instead of logging, for tests) and
+    QUERY_TRACE_HEADERS (add X-Query-Count / X-Query-Time-Ms headers).
+    """
+    global slow_query_ms
+    slow_query_ms = float(app.config.get('SLOW_QUERY_MS', slow_query_ms))
+    app.before_request(_start_request_trace)
+    app.after_request(_finish_request_trace)
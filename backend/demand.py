@@ -0,0 +1,68 @@
+"""Weekly teaching demand derived from subject credits.
+
+Each subject needs weekly contact hours set by its credits and type: a
+theory credit is one lecture hour, with one hour of a 4+ credit theory
+subject taught as a tutorial; a lab credit is two lab hours; an integrated
+(theory_lab) subject has credits - 1 lecture hours plus one two-hour lab.
+
+Staff who selected the same subject co-teach it, so its hours are split
+between them (remainder hours going to whoever has the least so far)
+rather than every one of them teaching the full load. The demand vector of
+(staff, subject, hours) is built once per solve; each staff member's total
+is the difficulty the solver uses to place the most loaded staff first.
+"""
+from collections import namedtuple
+from typing import Dict, List
+
+SUBJECT_TYPES = ('theory', 'lab', 'theory_lab')
+DEFAULT_SUBJECT_TYPE = 'theory'
+
+Demand = namedtuple('Demand', 'staff_id subject_id hours')
+
+def weekly_hours(credits, subject_type: str = DEFAULT_SUBJECT_TYPE) -> Dict[str, int]:
+    """Lecture, tutorial and lab hours per week for one subject"""
+    credits = max(int(credits or 0), 0)
+    if subject_type == 'lab':
+        return {'lecture': 0, 'tutorial': 0, 'lab': 2 * credits}
+    if subject_type == 'theory_lab':
+        return {'lecture': max(credits - 1, 0), 'tutorial': 0, 'lab': 2 if credits else 0}
+    tutorial = 1 if credits >= 4 else 0
+    return {'lecture': credits - tutorial, 'tutorial': tutorial, 'lab': 0}
+
+def subject_hours(subject: Dict) -> int:
+    return sum(weekly_hours(subject.get('credits'), subject.get('subject_type') or DEFAULT_SUBJECT_TYPE).values())
+
+def demand_vector(staff_subjects: Dict, subjects_dict: Dict) -> List[Demand]:
+    """Weekly slots per staff member and subject, co-taught subjects split between their staff
+
+    staff_subjects is the solver's {staff_id: {'subjects': [...]}}; subjects_dict
+    maps subject id to a dict with 'credits' and 'subject_type'. Subjects
+    missing from subjects_dict are skipped.
+    """
+    teachers = {}
+    for staff_id in sorted(staff_subjects):
+        for subject_id in staff_subjects[staff_id]['subjects']:
+            if subject_id in subjects_dict:
+                teachers.setdefault(subject_id, [])
+                if staff_id not in teachers[subject_id]:
+                    teachers[subject_id].append(staff_id)
+
+    load = {}
+    vector = []
+    for subject_id in sorted(teachers):
+        staff_ids = teachers[subject_id]
+        share, extra = divmod(subject_hours(subjects_dict[subject_id]), len(staff_ids))
+        # Remainder hours go to the co-teachers with the least demand so far
+        by_load = sorted(staff_ids, key=lambda staff_id: (load.get(staff_id, 0), staff_id))
+        for rank, staff_id in enumerate(by_load):
+            hours = share + (1 if rank < extra else 0)
+            if hours:
+                vector.append(Demand(staff_id, subject_id, hours))
+                load[staff_id] = load.get(staff_id, 0) + hours
+    return vector
+
+def staff_totals(vector: List[Demand]) -> Dict[int, int]:
+    totals = {}
+    for item in vector:
+        totals[item.staff_id] = totals.get(item.staff_id, 0) + item.hours
+    return totals
@@ -0,0 +1,164 @@
+"""Resident cache of per-department reference data.
+
+A DepartmentModel is an immutable snapshot of a department's staff, subjects
+and classrooms, shared by the solver and the list routes. Snapshots are keyed
+by department id and departments.data_version: every route that writes one of
+those tables bumps the version, so any worker notices the change with a
+single primary-key lookup and reloads on its next read.
+
+The cache is LRU and bounded by the estimated size of the snapshots it holds
+(MODEL_CACHE_MAX_BYTES, default 64 MiB).
+"""
+import os
+import sys
+import threading
+from collections import OrderedDict, namedtuple
+from types import MappingProxyType
+from typing import Dict, Optional, Tuple
+
+MAX_BYTES = int(os.getenv('MODEL_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+Staff = namedtuple('Staff', 'id name email staff_role subjects_selected subjects_locked')
+Subject = namedtuple('Subject', 'id name code credits enrollment cohort subject_type')
+Classroom = namedtuple('Classroom', 'id name capacity')
+
+_models = OrderedDict()  # department id -> DepartmentModel
+_models_lock = threading.Lock()
+_total_bytes = 0
+stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+class DepartmentModel:
+    """Read-only snapshot of one department at one data_version"""
+
+    __slots__ = ('department_id', 'name', 'version', 'staff', 'subjects', 'classrooms',
+                 'subjects_by_id', 'classrooms_by_id', 'staff_payload', 'subjects_payload',
+                 'classrooms_payload', 'size')
+
+    def __init__(self, department_id: int, name: str, version: int, staff: Tuple[Staff, ...],
+                 subjects: Tuple[Subject, ...], classrooms: Tuple[Classroom, ...]):
+        set_attr = object.__setattr__
+        set_attr(self, 'department_id', department_id)
+        set_attr(self, 'name', name)
+        set_attr(self, 'version', version)
+        set_attr(self, 'staff', staff)
+        set_attr(self, 'subjects', subjects)
+        set_attr(self, 'classrooms', classrooms)
+        set_attr(self, 'subjects_by_id', MappingProxyType({s.id: s for s in subjects}))
+        set_attr(self, 'classrooms_by_id', MappingProxyType({c.id: c for c in classrooms}))
+        # Response bodies of the list routes, built once per version
+        set_attr(self, 'staff_payload', tuple({
+            'id': str(s.id),
+            'name': s.name,
+            'email': s.email,
+            'staff_role': s.staff_role,
+            'subjects_selected': [str(i) for i in s.subjects_selected],
+            'subjects_locked': s.subjects_locked
+        } for s in staff))
+        set_attr(self, 'subjects_payload', tuple({
+            'id': str(s.id),
+            'name': s.name,
+            'code': s.code,
+            'credits': s.credits,
+            'enrollment': s.enrollment,
+            'cohort': s.cohort,
+            'subject_type': s.subject_type
+        } for s in subjects))
+        set_attr(self, 'classrooms_payload', tuple({
+            'id': str(c.id),
+            'name': c.name,
+            'capacity': c.capacity
+        } for c in classrooms))
+        set_attr(self, 'size', _estimate_size((staff, subjects, classrooms, self.staff_payload,
+                                               self.subjects_payload, self.classrooms_payload)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('DepartmentModel is immutable')
+
+    def locked_staff(self) -> Dict[int, Dict]:
+        """Staff who locked their subject choice, in the solver's staff_subjects shape"""
+        return {s.id: {'name': s.name, 'role': s.staff_role, 'subjects': list(s.subjects_selected)}
+                for s in self.staff if s.subjects_locked and s.subjects_selected}
+
+def _estimate_size(obj) -> int:
+    """Approximate deep size of nested tuples, lists, dicts and scalars"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (tuple, list)):
+        size += sum(_estimate_size(item) for item in obj)
+    elif isinstance(obj, dict):
+        size += sum(_estimate_size(k) + _estimate_size(v) for k, v in obj.items())
+    return size
+
+def _load(cursor, department_id: int, name: str, version: int) -> DepartmentModel:
+    cursor.execute('''
+        SELECT id, name, email, staff_role, subjects_selected, subjects_locked
+        FROM users
+        WHERE department_id = ? AND role = 'staff'
+        ORDER BY name
+    ''', (department_id,))
+    staff = tuple(Staff(row[0], row[1], row[2], row[3],
+                        tuple(int(s) for s in row[4].split(',')) if row[4] else (), bool(row[5]))
+                  for row in cursor.fetchall())
+    cursor.execute('''
+        SELECT id, name, code, credits, enrollment, cohort, subject_type
+        FROM subjects WHERE department_id = ? ORDER BY name
+    ''', (department_id,))
+    subjects = tuple(Subject(*row) for row in cursor.fetchall())
+    cursor.execute('SELECT id, name, capacity FROM classrooms WHERE department_id = ? ORDER BY name',
+                   (department_id,))
+    classrooms = tuple(Classroom(*row) for row in cursor.fetchall())
+    return DepartmentModel(department_id, name, version, staff, subjects, classrooms)
+
+def _store(model: DepartmentModel):
+    global _total_bytes
+    with _models_lock:
+        previous = _models.pop(model.department_id, None)
+        if previous is not None:
+            _total_bytes -= previous.size
+        _models[model.department_id] = model
+        _total_bytes += model.size
+        # Always keep the newest snapshot, even if it alone exceeds the bound
+        while _total_bytes > MAX_BYTES and len(_models) > 1:
+            _, evicted = _models.popitem(last=False)
+            _total_bytes -= evicted.size
+            stats['evictions'] += 1
+
+def get_model(cursor, department_id: int, name: Optional[str] = None,
+              version: Optional[int] = None) -> Optional[DepartmentModel]:
+    """Current snapshot of a department, or None if it does not exist
+
+    Callers that already selected departments.name and data_version (e.g.
+    joined onto the user lookup) pass them to skip the version query.
+    """
+    if version is None:
+        cursor.execute('SELECT name, data_version FROM departments WHERE id = ?', (department_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        name, version = row
+
+    with _models_lock:
+        model = _models.get(department_id)
+        if model is not None and model.version == version:
+            _models.move_to_end(department_id)
+            stats['hits'] += 1
+            return model
+        stats['misses'] += 1
+
+    model = _load(cursor, department_id, name, version)
+    _store(model)
+    return model
+
+def bump_data_version(cursor, department_id: Optional[int]):
+    """Mark a department's staff, subjects or classrooms as changed"""
+    if department_id is not None:
+        cursor.execute('UPDATE departments SET data_version = data_version + 1 WHERE id = ?', (department_id,))
+
+def clear():
+    global _total_bytes
+    with _models_lock:
+        _models.clear()
+        _total_bytes = 0
+
+def cache_info() -> Dict:
+    with _models_lock:
+        return {'departments': len(_models), 'bytes': _total_bytes, 'max_bytes': MAX_BYTES, **stats}
@@ -0,0 +1,171 @@
+"""Exam timetabling by graph colouring.
+
+Each subject sits one exam. Two exams conflict when the subjects share a
+staff member (subjects_selected) or a student cohort (subjects.cohort), and
+conflicting exams must not share a slot. Exam slots are colours: DSATUR
+colours the most constrained exam first (most distinct slots already taken
+by its neighbours, then most neighbours), giving it the lowest slot that is
+free of conflicts and still has enough room capacity left.
+
+Rooms are packed per slot from a capacity-sorted free list: an exam takes
+the smallest room that seats all its students, or else the largest free
+rooms until everyone is seated.
+"""
+import heapq
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+class _Slot:
+    """Free rooms of one exam slot, sorted by capacity"""
+
+    __slots__ = ('free', 'free_seats')
+
+    def __init__(self, rooms):
+        self.free = sorted(rooms)
+        self.free_seats = sum(capacity for capacity, _ in rooms)
+
+    def allocate(self, seats: int) -> Optional[List]:
+        """Take rooms seating at least `seats`, or None if the slot is too full"""
+        if seats > self.free_seats:
+            return None
+        free = self.free
+        position = bisect_left(free, (seats, -1))
+        if position < len(free):
+            taken = [free.pop(position)]
+        else:
+            # No single room is big enough: split across the largest ones
+            taken = []
+            while seats > 0:
+                room = free.pop()
+                taken.append(room)
+                seats -= room[0]
+        self.free_seats -= sum(capacity for capacity, _ in taken)
+        return taken
+
+def conflict_graph(subject_ids: List[int], groups: List[List[int]]) -> List[set]:
+    """Adjacency sets over subject positions; every group is a clique"""
+    position = {subject_id: i for i, subject_id in enumerate(subject_ids)}
+    adjacency = [set() for _ in subject_ids]
+    for group in groups:
+        members = [position[s] for s in set(group) if s in position]
+        for i in members:
+            neighbours = adjacency[i]
+            neighbours.update(members)
+            neighbours.discard(i)
+    return adjacency
+
+def schedule_exams(subjects: List[Dict], groups: List[List[int]], classrooms: List[Dict],
+                   max_slots: Optional[int] = None) -> Dict:
+    """Assign every subject an exam slot and rooms
+
+    subjects are dicts with id, name, code and enrollment; groups are lists of
+    subject ids that must all sit in different slots (one per staff member and
+    per cohort); classrooms are dicts with id, name and capacity.
+    """
+    if not classrooms:
+        raise ValueError('No classrooms available for exams')
+    start = time.perf_counter()
+    subject_ids = [s['id'] for s in subjects]
+    adjacency = conflict_graph(subject_ids, groups)
+    seats = [max(s.get('enrollment') or 1, 1) for s in subjects]
+    rooms = [(c['capacity'], c['id']) for c in classrooms]
+    room_by_id = {c['id']: c for c in classrooms}
+
+    colour = [-1] * len(subjects)
+    # Distinct slots used by each exam's neighbours
+    neighbour_slots = [set() for _ in subjects]
+    degree = [len(n) for n in adjacency]
+    heap = [(0, -degree[i], i) for i in range(len(subjects))]
+    heapq.heapify(heap)
+    slots: List[_Slot] = []
+    allocations = {}
+    unscheduled = []
+
+    while heap:
+        negative_saturation, _, i = heapq.heappop(heap)
+        if colour[i] != -1 or -negative_saturation != len(neighbour_slots[i]):
+            continue  # already placed, or a stale entry superseded by a newer push
+
+        blocked = neighbour_slots[i]
+        chosen = None
+        for slot_index, slot in enumerate(slots):
+            if slot_index not in blocked:
+                taken = slot.allocate(seats[i])
+                if taken is not None:
+                    chosen = slot_index
+                    break
+        if chosen is None and (max_slots is None or len(slots) < max_slots):
+            slot = _Slot(rooms)
+            taken = slot.allocate(seats[i])
+            if taken is not None:
+                slots.append(slot)
+                chosen = len(slots) - 1
+        if chosen is None:
+            colour[i] = -2
+            reason = ('Enrollment exceeds total room capacity' if seats[i] > sum(c for c, _ in rooms)
+                      else 'No conflict-free slot with enough room capacity')
+            unscheduled.append({'subject_id': subject_ids[i], 'reason': reason})
+            continue
+
+        colour[i] = chosen
+        allocations[i] = taken
+        for j in adjacency[i]:
+            if colour[j] == -1 and chosen not in neighbour_slots[j]:
+                neighbour_slots[j].add(chosen)
+                heapq.heappush(heap, (-len(neighbour_slots[j]), -degree[j], j))
+
+    exams = []
+    for i, subject in enumerate(subjects):
+        if colour[i] < 0:
+            continue
+        exams.append({
+            'subject_id': subject['id'],
+            'subject_name': subject.get('name'),
+            'subject_code': subject.get('code'),
+            'enrollment': subject.get('enrollment'),
+            'slot': colour[i] + 1,
+            'classrooms': [{'id': room_id, 'name': room_by_id[room_id]['name'], 'capacity': capacity}
+                           for capacity, room_id in allocations[i]]
+        })
+    exams.sort(key=lambda exam: (exam['slot'], exam['subject_id']))
+
+    return {
+        'slot_count': len(slots),
+        # Any group is a clique, so the largest one bounds the slot count from below
+        'lower_bound': max((len(set(group)) for group in groups), default=1 if subjects else 0),
+        'exams': exams,
+        'unscheduled': unscheduled,
+        'stats': {
+            'subjects': len(subjects),
+            'conflicts': sum(degree) // 2,
+            'classrooms': len(classrooms),
+            'solve_ms': round((time.perf_counter() - start) * 1000, 2)
+        }
+    }
+
+def load_exam_data(cursor, department_id: Optional[int] = None) -> Dict:
+    """Subjects, conflict groups and classrooms for one department or the campus"""
+    where = '' if department_id is None else ' WHERE department_id = ?'
+    params = () if department_id is None else (department_id,)
+
+    cursor.execute('SELECT id, name, code, enrollment, cohort FROM subjects' + where + ' ORDER BY id', params)
+    subjects, cohorts = [], defaultdict(list)
+    for subject_id, name, code, enrollment, cohort in cursor.fetchall():
+        subjects.append({'id': subject_id, 'name': name, 'code': code, 'enrollment': enrollment})
+        if cohort:
+            cohorts[cohort].append(subject_id)
+
+    cursor.execute("SELECT subjects_selected FROM users WHERE role = 'staff' AND subjects_selected IS NOT NULL"
+                   + ('' if department_id is None else ' AND department_id = ?'), params)
+    groups = [[int(s) for s in row[0].split(',')] for row in cursor.fetchall() if row[0]]
+    groups.extend(cohorts.values())
+
+    cursor.execute('SELECT id, name, capacity FROM classrooms' + where, params)
+    classrooms = [{'id': row[0], 'name': row[1], 'capacity': row[2]} for row in cursor.fetchall() if row[2]]
+    return {'subjects': subjects, 'groups': groups, 'classrooms': classrooms}
+
+def schedule_saved_subjects(cursor, department_id: Optional[int] = None, max_slots: Optional[int] = None) -> Dict:
+    data = load_exam_data(cursor, department_id)
+    return schedule_exams(data['subjects'], data['groups'], data['classrooms'], max_slots)
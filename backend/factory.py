@@ -0,0 +1,133 @@
+"""Application factory serving the basic and enhanced feature sets.
+
+Production runs under a pre-forking server (see gunicorn.conf.py): the
+schema is initialised once in the master (create_app also creates it when
+the database file does not exist yet), and init_worker() resets the
+per-process state each worker must not inherit from it.
+"""
+import logging
+import os
+import random
+import secrets
+import tempfile
+from datetime import timedelta
+
+from dotenv import load_dotenv
+from flask import Flask
+from flask_cors import CORS
+from flask_jwt_extended import JWTManager
+
+import admission
+import db
+import http_encoding
+import metrics
+
+FEATURE_SETS = ('basic', 'enhanced')
+
+logger = logging.getLogger(__name__)
+
+def default_config(feature_set=None):
+    """Configuration read from the environment (and .env)"""
+    load_dotenv()
+    feature_set = feature_set or os.getenv('FEATURE_SET', 'basic')
+    enhanced = feature_set == 'enhanced'
+    origins = ["http://localhost:5173", "http://localhost:3000"]
+    if enhanced:
+        origins.append("http://localhost:8080")
+
+    secret = os.getenv('JWT_SECRET_KEY')
+    if not secret:
+        if enhanced:
+            # Only shared between workers when the app is preloaded in the master
+            logger.warning('JWT_SECRET_KEY is not set; using a random key')
+            secret = secrets.token_urlsafe(32)
+        else:
+            secret = 'your-secret-key-change-in-production'
+
+    return {
+        'FEATURE_SET': feature_set,
+        'DATABASE': os.getenv('DATABASE_PATH', 'timetable_enhanced.db' if enhanced else 'timetable.db'),
+        'JWT_SECRET_KEY': secret,
+        'JWT_ACCESS_TOKEN_EXPIRES': timedelta(hours=24),
+        'CORS_ORIGINS': origins,
+        'DEBUG': os.getenv('FLASK_DEBUG', 'false').lower() in ('1', 'true'),
+        'JSON_ENCODER': os.getenv('JSON_ENCODER', 'auto'),
+        'COMPRESS_MIN_SIZE': int(os.getenv('COMPRESS_MIN_SIZE', '1024')),
+        'COMPRESS_LEVEL': int(os.getenv('COMPRESS_LEVEL', '1')),
+        'PROFILING_ENABLED': os.getenv('PROFILING_ENABLED', 'false').lower() in ('1', 'true'),
+        'ADMISSION_ENABLED': os.getenv('ADMISSION_ENABLED', 'true').lower() in ('1', 'true'),
+        # Interrupted solves resume from here; an empty CHECKPOINT_DIR turns checkpoints off
+        'CHECKPOINT_DIR': os.getenv('CHECKPOINT_DIR', os.path.join(tempfile.gettempdir(), 'srm-checkpoints')),
+        'CHECKPOINT_INTERVAL': float(os.getenv('CHECKPOINT_INTERVAL', '5'))
+    }
+
+def create_app(config=None) -> Flask:
+    """Build an app for the configured feature set
+
+    config may be a dict of overrides; anything missing comes from
+    default_config(). Route modules are imported here, and the solver and
+    openpyxl only on first use, so importing this module stays cheap.
+    """
+    config = dict(config or {})
+    settings = default_config(config.get('FEATURE_SET'))
+    settings.update(config)
+    if settings['FEATURE_SET'] not in FEATURE_SETS:
+        raise ValueError(f"Unknown feature set: {settings['FEATURE_SET']}")
+
+    app = Flask(__name__)
+    app.config.update(settings)
+
+    JWTManager(app)
+    CORS(app, origins=app.config['CORS_ORIGINS'])
+    metrics.init_app(app)
+    db.init_app(app)
+    http_encoding.init_app(app)
+    admission.init_app(app)
+    if app.config['PROFILING_ENABLED']:
+        # Imported only when enabled; a disabled app has no profiling hooks at all
+        import profiling
+        profiling.init_app(app)
+
+    from api_routes import api
+    app.register_blueprint(api)
+
+    if app.config['FEATURE_SET'] == 'enhanced':
+        from app_enhanced import enhanced
+        app.register_blueprint(enhanced)
+    else:
+        from app import core
+        app.register_blueprint(core)
+
+    # A new database file (flask run, a test client) gets its schema here;
+    # existing ones are migrated by init_schema before workers fork
+    if not os.path.exists(app.config['DATABASE']):
+        init_schema(app)
+
+    return app
+
+def init_schema(app_or_config=None):
+    """Create or migrate the schema; run once before workers fork"""
+    config = getattr(app_or_config, 'config', app_or_config) or default_config()
+    database = config['DATABASE']
+
+    if config['FEATURE_SET'] == 'enhanced':
+        from app_enhanced import init_enhanced_db
+        init_enhanced_db(database)
+    else:
+        from app import init_db
+        init_db(database)
+
+    # WAL lets worker processes read while another one writes; the mode is stored in the file
+    conn = db.connect(database)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.close()
+
+def init_worker():
+    """Reset per-process state after fork
+
+    Forked workers would otherwise share the master's RNG state (identical
+    solver shuffles) and report the master's start-up queries as their own.
+    Thread pools and connections are created lazily per process.
+    """
+    random.seed()
+    metrics.reset_all()
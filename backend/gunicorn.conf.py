@@ -0,0 +1,17 @@
+# Pre-forking production server: gunicorn -c gunicorn.conf.py wsgi:app
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', '4'))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+# Load the app once in the master so workers share its memory pages
+preload_app = True
+
+def on_starting(server):
+    # Schema creation and migrations run once, before any worker forks
+    from factory import init_schema
+    init_schema()
+
+def post_fork(server, worker):
+    from factory import init_worker
+    init_worker()
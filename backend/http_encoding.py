@@ -0,0 +1,100 @@
+"""Response encoding: a fast JSON provider and negotiated compression.
+
+FastJSONProvider serializes with orjson when it is installed and falls back
+to the standard library otherwise (JSON_ENCODER = 'auto' | 'orjson' |
+'stdlib'). Output matches Flask's default provider: sorted keys, and the
+same fallbacks for dates, decimals and UUIDs.
+
+Responses of at least COMPRESS_MIN_SIZE bytes are gzip- or
+deflate-compressed when the client accepts it. Streamed responses (SSE,
+file downloads) are left alone.
+"""
+import gzip
+import zlib
+
+from flask import current_app, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/plain', 'text/html', 'text/csv', 'text/calendar')
+ENCODINGS = ('gzip', 'deflate')
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson when available"""
+
+    def __init__(self, app):
+        super().__init__(app)
+        choice = app.config.get('JSON_ENCODER', 'auto')
+        if choice == 'orjson' and orjson is None:
+            raise RuntimeError('JSON_ENCODER is orjson but orjson is not installed')
+        self.use_orjson = orjson is not None and choice != 'stdlib'
+
+    def _orjson_options(self):
+        # Dates and dataclasses go through self.default like on the stdlib path
+        # (HTTP dates, asdict) instead of orjson's native ISO/dict encoding
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps(self, obj, **kwargs) -> str:
+        if self.use_orjson and not kwargs.get('indent'):
+            return orjson.dumps(obj, default=self.default, option=self._orjson_options()).decode()
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if self.use_orjson and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        # Pretty-printed debug output keeps the stdlib path
+        if not self.use_orjson or (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self._orjson_options())
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+def _choose_encoding(accept_encodings):
+    """Best of gzip/deflate by client preference, gzip on ties"""
+    best, best_quality = None, 0
+    for encoding in ENCODINGS:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def compress(data: bytes, encoding: str, level: int = 1) -> bytes:
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    return zlib.compress(data, level)
+
+def _compress_response(response):
+    config = current_app.config
+    if not config.get('COMPRESS_ENABLED', True):
+        return response
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or response.status_code >= 300 or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < config.get('COMPRESS_MIN_SIZE', 1024):
+        return response
+    encoding = _choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    response.set_data(compress(data, encoding, config.get('COMPRESS_LEVEL', 1)))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+def init_app(app):
+    """Install the JSON provider and the compression hook on a Flask app"""
+    app.json = FastJSONProvider(app)
+    app.after_request(_compress_response)
@@ -0,0 +1,245 @@
+"""Optional LLM refinement of a draft timetable.
+
+Lectures the solver could not place are sent, with a compact encoding of
+the free rooms and the busy slots of their staff, to an OpenAI-compatible
+chat completions endpoint (Groq by default). Suggested moves are checked
+against the local conflict sets and only conflict-free ones are applied.
+
+Prompts are bounded by LLM_MAX_PROMPT_CHARS, responses are cached by
+prompt hash, and batches run concurrently over one pooled HTTP session with
+per-request timeouts. Point GROQ_API_URL at a local stub server to test.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = 'https://api.groq.com/openai/v1/chat/completions'
+DEFAULT_MODEL = 'llama-3.1-8b-instant'
+CACHE_SIZE = 256
+
+SYSTEM_PROMPT = (
+    'You repair university timetables. Days are numbered 0-4, slots 0-6, rooms by index. '
+    'FREE lines list the free rooms per day.slot. Each lecture line gives its staff and the '
+    'day.slot pairs that staff is already busy. Place as many lectures as possible in free '
+    'rooms at slots where their staff is not busy, at most one lecture per room and slot. '
+    'Reply with JSON only: {"moves": [{"lecture": <id>, "day": <d>, "slot": <s>, "room": <r>}]}'
+)
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+def _get_session(pool_size: int):
+    """One pooled session per process, shared by all refinements"""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session, _session_pid = session, os.getpid()
+    return _session
+
+def _cache_get(key: str) -> Optional[str]:
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    return None
+
+def _cache_put(key: str, value: str):
+    with _cache_lock:
+        _cache[key] = value
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+class LLMRefiner:
+    def __init__(self, api_key: Optional[str] = None, api_url: Optional[str] = None,
+                 model: Optional[str] = None, timeout: Optional[float] = None,
+                 max_concurrency: Optional[int] = None, max_prompt_chars: Optional[int] = None,
+                 batch_size: Optional[int] = None):
+        self.api_key = api_key or os.getenv('GROQ_API_KEY')
+        self.api_url = api_url or os.getenv('GROQ_API_URL', DEFAULT_API_URL)
+        self.model = model or os.getenv('GROQ_MODEL', DEFAULT_MODEL)
+        self.timeout = timeout or float(os.getenv('LLM_TIMEOUT', '10'))
+        self.max_concurrency = max_concurrency or int(os.getenv('LLM_MAX_CONCURRENCY', '4'))
+        self.max_prompt_chars = max_prompt_chars or int(os.getenv('LLM_MAX_PROMPT_CHARS', '6000'))
+        self.batch_size = batch_size or int(os.getenv('LLM_BATCH_SIZE', '20'))
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.api_key)
+
+    def refine(self, timetable: List, unplaced: List, days: List, time_slots: List,
+               classrooms_dict: Dict) -> Tuple[List, List, Dict]:
+        """Try to place unplaced lectures; returns (timetable, still unplaced, stats)"""
+        stats = {'requests': 0, 'cached': 0, 'failed': 0, 'suggested': 0, 'applied': 0, 'rejected': 0,
+                 'skipped': 0}
+        if not unplaced or not self.enabled:
+            return timetable, unplaced, stats
+
+        room_ids = sorted(classrooms_dict)
+        used_slots = {(e['day'], e['time_slot'], e['classroom_id']) for e in timetable}
+        staff_slots = {(e['staff_id'], e['day'], e['time_slot']) for e in timetable}
+
+        batches, skipped = self._batch_lectures(unplaced, days, time_slots, staff_slots)
+        stats['skipped'] = skipped
+        prompts = [self._build_prompt(batch, days, time_slots, room_ids, used_slots) for batch in batches]
+        if not prompts:
+            return timetable, unplaced, stats
+
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(prompts))) as executor:
+            replies = list(executor.map(self._complete, prompts))
+
+        # Validate every suggestion against the live conflict sets before applying it
+        placed_lectures = set()
+        timetable = list(timetable)
+        for reply, status in replies:
+            stats[status] += 1
+            for move in self._parse_moves(reply):
+                stats['suggested'] += 1
+                try:
+                    lecture, d, s, r = (int(move[key]) for key in ('lecture', 'day', 'slot', 'room'))
+                except (KeyError, TypeError, ValueError):
+                    stats['rejected'] += 1
+                    continue
+                # Negative indices would silently wrap around to the last day, slot or room
+                if not (0 <= lecture < len(unplaced) and 0 <= d < len(days) and 0 <= s < len(time_slots)
+                        and 0 <= r < len(room_ids)) or lecture in placed_lectures:
+                    stats['rejected'] += 1
+                    continue
+                day, time_slot, classroom_id = days[d], time_slots[s], room_ids[r]
+                assignment = unplaced[lecture]
+                slot_key = (day, time_slot, classroom_id)
+                staff_slot_key = (assignment['staff_id'], day, time_slot)
+                if slot_key in used_slots or staff_slot_key in staff_slots:
+                    stats['rejected'] += 1
+                    continue
+
+                timetable.append({
+                    'day': day,
+                    'time_slot': time_slot,
+                    'subject_id': assignment['subject_id'],
+                    'subject_name': assignment['subject_name'],
+                    'subject_code': assignment['subject_code'],
+                    'staff_id': assignment['staff_id'],
+                    'staff_name': assignment['staff_name'],
+                    'classroom_id': classroom_id,
+                    'classroom_name': classrooms_dict[classroom_id]['name']
+                })
+                used_slots.add(slot_key)
+                staff_slots.add(staff_slot_key)
+                placed_lectures.add(lecture)
+                stats['applied'] += 1
+
+        remaining = [a for i, a in enumerate(unplaced) if i not in placed_lectures]
+        return timetable, remaining, stats
+
+    def _batch_lectures(self, unplaced: List, days: List, time_slots: List,
+                        staff_slots: set) -> Tuple[List[List[Tuple[int, str]]], int]:
+        """Group lecture lines into batches whose lines fit half the prompt budget
+
+        Returns the batches of (lecture, line) and the number of lectures left
+        out because their line alone is over that half.
+        """
+        budget = self.max_prompt_chars // 2 - len('LECTURES\n')
+        batches, batch, used, skipped = [], [], 0, 0
+        for lecture, assignment in enumerate(unplaced):
+            staff_id = assignment['staff_id']
+            busy = [f'{d}.{s}' for d, day in enumerate(days) for s, slot in enumerate(time_slots)
+                    if (staff_id, day, slot) in staff_slots]
+            line = f'L{lecture} staff={staff_id} busy={",".join(busy)}'
+            if len(line) + 1 > budget:
+                skipped += 1
+                continue
+            if batch and (len(batch) >= self.batch_size or used + len(line) + 1 > budget):
+                batches.append(batch)
+                batch, used = [], 0
+            batch.append((lecture, line))
+            used += len(line) + 1
+        if batch:
+            batches.append(batch)
+        return batches, skipped
+
+    def _build_prompt(self, batch: List[Tuple[int, str]], days: List, time_slots: List,
+                      room_ids: List, used_slots: set) -> str:
+        room_index = {room_id: i for i, room_id in enumerate(room_ids)}
+        lecture_lines = [line for _, line in batch]
+
+        free_lines = []
+        for d, day in enumerate(days):
+            for s, slot in enumerate(time_slots):
+                free = [str(room_index[r]) for r in room_ids if (day, slot, r) not in used_slots]
+                if free:
+                    free_lines.append(f'FREE {d}.{s}:{",".join(free)}')
+
+        # Lecture lines were batched to fit; free-room lines fill what is left of the budget
+        budget = (self.max_prompt_chars - len('LECTURES\n') - sum(len(line) + 1 for line in lecture_lines)
+                  - len('ROOMS'))
+        kept = []
+        for line in free_lines:
+            budget -= len(line) + 1
+            if budget < 0:
+                break
+            kept.append(line)
+        return '\n'.join(['LECTURES'] + lecture_lines + ['ROOMS'] + kept)
+
+    def _complete(self, prompt: str) -> Tuple[str, str]:
+        """Send one prompt; returns (reply text, stats key)"""
+        key = hashlib.sha256(f'{self.model}\n{prompt}'.encode()).hexdigest()
+        cached = _cache_get(key)
+        if cached is not None:
+            return cached, 'cached'
+
+        try:
+            response = _get_session(self.max_concurrency).post(
+                self.api_url,
+                headers={'Authorization': f'Bearer {self.api_key}'},
+                json={
+                    'model': self.model,
+                    'temperature': 0,
+                    'response_format': {'type': 'json_object'},
+                    'messages': [
+                        {'role': 'system', 'content': SYSTEM_PROMPT},
+                        {'role': 'user', 'content': prompt}
+                    ]
+                },
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            reply = response.json()['choices'][0]['message']['content']
+        except Exception as e:
+            logger.warning('LLM refinement request failed: %s', e)
+            return '', 'failed'
+
+        _cache_put(key, reply)
+        return reply, 'requests'
+
+    @staticmethod
+    def _parse_moves(reply: str) -> List[Dict]:
+        if not reply:
+            return []
+        try:
+            moves = json.loads(reply).get('moves', [])
+        except (ValueError, AttributeError):
+            return []
+        return [m for m in moves if isinstance(m, dict)] if isinstance(moves, list) else []
@@ -0,0 +1,200 @@
+"""HTTP load test for the Flask backend.
+
+Seeds a synthetic campus in a temp directory, serves the app on a local
+threaded server and replays a traffic mix with a pool of virtual users:
+
+- login_storm: every virtual user logs in at the same moment
+- steady: dashboard polling (/api/staff, /api/subjects, /api/classrooms),
+  timetable views, logins, and concurrent generate and export calls
+
+Throughput and p50/p95/p99 latency per route and phase are printed and
+written to a JSON file for regression tracking.
+
+Run from the backend directory:
+    python loadtest.py --feature-set both --users 20 --duration 30 --output loadtest.json
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+from bench_support import campus_app, percentiles, serve
+
+# Action weights of the steady phase
+TRAFFIC_MIX = (
+    ('dashboard', 60),
+    ('timetable', 15),
+    ('login', 15),
+    ('generate', 5),
+    ('export', 5)
+)
+DASHBOARD_ROUTES = ('/api/staff', '/api/subjects', '/api/classrooms')
+
+class Recorder:
+    """Latency samples and status codes per route label"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, route: str, elapsed: float, status):
+        with self._lock:
+            self._samples.setdefault(route, []).append((elapsed, status))
+
+    def summary(self, duration: float):
+        with self._lock:
+            samples = {route: list(values) for route, values in self._samples.items()}
+        routes = {}
+        for route, values in sorted(samples.items()):
+            statuses = {}
+            for _, status in values:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            errors = sum(1 for _, status in values if status == 'error' or status >= 400)
+            routes[route] = {
+                **percentiles([elapsed for elapsed, _ in values]),
+                'throughput_rps': round(len(values) / duration, 2),
+                'errors': errors,
+                'status_codes': statuses
+            }
+        total = sum(len(values) for values in samples.values())
+        return {'duration_s': round(duration, 2), 'requests': total,
+                'throughput_rps': round(total / duration, 2) if duration else 0.0, 'routes': routes}
+
+class VirtualUser:
+    def __init__(self, index: int, base_url: str, email: str, department_ids, recorder: Recorder,
+                 think_time: float, generate_budget: float):
+        import requests
+
+        self.rng = random.Random(index)
+        self.session = requests.Session()
+        self.base_url = base_url
+        self.email = email
+        self.department_ids = department_ids
+        self.recorder = recorder
+        self.think_time = think_time
+        self.generate_budget = generate_budget
+        self.headers = {}
+        self.actions = [name for name, weight in TRAFFIC_MIX for _ in range(weight)]
+
+    def request(self, method: str, path: str, route: str = None, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, headers=self.headers, **kwargs)
+            status = response.status_code
+        except Exception:
+            response, status = None, 'error'
+        self.recorder.record(route or f'{method} {path}', time.perf_counter() - start, status)
+        return response
+
+    def login(self):
+        response = self.request('POST', '/api/auth/login', json={'email': self.email, 'password': 'staff123'})
+        if response is not None and response.ok:
+            body = response.json()
+            token = body.get('token') or body.get('data', {}).get('token')
+            self.headers = {'Authorization': f'Bearer {token}'}
+
+    def dashboard(self):
+        for path in DASHBOARD_ROUTES:
+            self.request('GET', path)
+
+    def timetable(self):
+        self.request('GET', f'/api/timetable?department_id={self.rng.choice(self.department_ids)}',
+                     route='GET /api/timetable')
+
+    def generate(self):
+        self.request('POST', '/api/timetable/generate', json={
+            'department_id': self.rng.choice(self.department_ids), 'time_budget': self.generate_budget})
+
+    def export(self):
+        self.request('POST', '/api/timetable/export', json={'department_id': self.rng.choice(self.department_ids)})
+
+    def run(self, stop: threading.Event):
+        while not stop.is_set():
+            getattr(self, self.rng.choice(self.actions))()
+            if self.think_time:
+                stop.wait(self.rng.uniform(0, 2 * self.think_time))
+
+def _run_phase(users, target, stop_after: float = None):
+    """Run target(user) on every user concurrently; returns the wall-clock duration"""
+    stop = threading.Event()
+    threads = [threading.Thread(target=target, args=(user, stop)) for user in users]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    if stop_after is not None:
+        time.sleep(stop_after)
+        stop.set()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+def run_load_test(feature_set: str = 'basic', users: int = 20, duration: float = 30.0, departments: int = 4,
+                  staff_per_department: int = 40, think_time: float = 0.2, generate_budget: float = 2.0):
+    """Seed, serve and load one feature set; returns per-phase summaries"""
+    flask_app, campus = campus_app(feature_set, departments=departments,
+                                    staff_per_department=staff_per_department)
+    # Exports are written to the working directory; keep them with the throwaway database
+    previous_cwd = os.getcwd()
+    os.chdir(os.path.dirname(flask_app.config['DATABASE']))
+    server, base_url = serve(flask_app)
+    try:
+        emails = campus['staff_emails']
+        storm = Recorder()
+        virtual_users = [VirtualUser(i, base_url, emails[i % len(emails)], campus['department_ids'], storm,
+                                     think_time, generate_budget) for i in range(users)]
+        storm_duration = _run_phase(virtual_users, lambda user, stop: user.login())
+
+        steady = Recorder()
+        for user in virtual_users:
+            user.recorder = steady
+        steady_duration = _run_phase(virtual_users, lambda user, stop: user.run(stop), stop_after=duration)
+    finally:
+        server.shutdown()
+        os.chdir(previous_cwd)
+
+    return {'login_storm': storm.summary(storm_duration), 'steady': steady.summary(steady_duration)}
+
+def _print_summary(feature_set: str, results):
+    for phase, summary in results.items():
+        print(f"\n[{feature_set}] {phase}: {summary['requests']} requests, {summary['throughput_rps']} req/s")
+        print(f"  {'route':<34} {'count':>6} {'rps':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}")
+        for route, stats in summary['routes'].items():
+            print(f"  {route:<34} {stats['count']:>6} {stats['throughput_rps']:>7} {stats['p50_ms']:>8} "
+                  f"{stats['p95_ms']:>8} {stats['p99_ms']:>8} {stats['errors']:>6}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the backend against a synthetic campus')
+    parser.add_argument('--feature-set', choices=('basic', 'enhanced', 'both'), default='both')
+    parser.add_argument('--users', type=int, default=20, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds of steady traffic')
+    parser.add_argument('--departments', type=int, default=4)
+    parser.add_argument('--staff-per-department', type=int, default=40)
+    parser.add_argument('--think-time', type=float, default=0.2, help='mean pause between actions, seconds')
+    parser.add_argument('--generate-budget', type=float, default=2.0, help='time_budget of generate calls')
+    parser.add_argument('--output', default='loadtest-results.json')
+    args = parser.parse_args(argv)
+
+    logging.getLogger('app_enhanced').setLevel(logging.WARNING)
+    feature_sets = ('basic', 'enhanced') if args.feature_set == 'both' else (args.feature_set,)
+    report = {
+        'generated_at': datetime.now().isoformat(),
+        'config': {key: value for key, value in vars(args).items() if key != 'output'},
+        'traffic_mix': dict(TRAFFIC_MIX),
+        'results': {}
+    }
+    for feature_set in feature_sets:
+        results = run_load_test(feature_set, args.users, args.duration, args.departments,
+                                args.staff_per_department, args.think_time, args.generate_budget)
+        report['results'][feature_set] = results
+        _print_summary(feature_set, results)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nWrote {args.output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""In-process metrics with a Prometheus text exposition endpoint.
+
+Metrics are module-level objects so any module can record into them. An
+observation takes one lock and a dict lookup.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import List, Tuple
+
+from flask import Response, g, request
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_enabled = os.getenv('METRICS_ENABLED', 'true').lower() != 'false'
+_registry = []
+
+def enabled() -> bool:
+    return _enabled
+
+def set_enabled(value: bool):
+    global _enabled
+    _enabled = value
+
+def _format_labels(names: Tuple, values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+class Counter:
+    """Monotonically increasing value per label set"""
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        if not _enabled:
+            return
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels[name] for name in self.labelnames), 0)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {value}' for key, value in items]
+
+class Gauge(Counter):
+    """Value that can go up and down, e.g. the last run's unplaced count"""
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        if not _enabled:
+            return
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram:
+    """Cumulative bucketed distribution per label set"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple = (), buckets: Tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values: [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        if not _enabled:
+            return
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(labels[name] for name in self.labelnames))
+        return sum(series[:-1]) if series else 0
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, series):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {series[-1]}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+def render_latest() -> str:
+    """Render every registered metric in the Prometheus text format"""
+    lines = []
+    for metric in _registry:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+def reset_all():
+    for metric in _registry:
+        metric.reset()
+
+# HTTP
+HTTP_REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'HTTP request latency by route',
+                                 ('method', 'route', 'status'))
+
+# Database
+DB_QUERIES = Counter('db_queries_total', 'SQLite statements executed', ('operation',))
+DB_QUERY_SECONDS = Histogram('db_query_duration_seconds', 'SQLite statement latency', ('operation',),
+                             buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1, 0.5, 1.0))
+
+# Solver
+SOLVER_PHASE_SECONDS = Histogram('solver_phase_duration_seconds', 'Timetable solver phase durations', ('phase',))
+SOLVER_PLACEMENT_ATTEMPTS = Counter('solver_placement_attempts_total', 'Slot probes made while placing lectures')
+SOLVER_UNPLACED = Counter('solver_unplaced_assignments_total', 'Lectures left unplaced by finished solves')
+SOLVER_LAST_UNPLACED = Gauge('solver_last_unplaced_assignments', 'Lectures left unplaced by the last solve',
+                             ('department_id',))
+
+# Export
+EXPORT_SECONDS = Histogram('export_duration_seconds', 'Excel export durations', ('status',))
+
+# Admission control
+ADMISSION_WAIT_SECONDS = Histogram('admission_wait_seconds', 'Time admitted requests spent queued', ('endpoint',))
+ADMISSION_REJECTED = Counter('admission_rejected_total', 'Requests turned away by admission control',
+                             ('endpoint', 'reason'))
+ADMISSION_IN_FLIGHT = Gauge('admission_in_flight', 'Admitted requests currently running', ('endpoint',))
+ADMISSION_QUEUED = Gauge('admission_queued', 'Requests waiting for admission', ('endpoint',))
+
+def observe_query(sql: str, duration: float):
+    """Record one SQLite statement; the operation label is its leading keyword"""
+    operation = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else 'UNKNOWN'
+    DB_QUERIES.inc(operation=operation)
+    DB_QUERY_SECONDS.observe(duration, operation=operation)
+
+def _start_timer():
+    g._metrics_start = time.perf_counter()
+
+def _record_request(response):
+    start = g.pop('_metrics_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method,
+                                     route=route, status=response.status_code)
+    return response
+
+def metrics_endpoint():
+    return Response(render_latest(), mimetype='text/plain; version=0.0.4')
+
+def init_app(app):
+    """Install request timing hooks and the /metrics route on a Flask app"""
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_endpoint, methods=['GET'])
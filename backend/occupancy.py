@@ -0,0 +1,241 @@
+"""Per-department occupancy index for conflict-checked manual edits.
+
+The index maps (staff, day, slot) and (room, day, slot) to the entries holding
+them, so checking a move or swap is a couple of dict lookups. Keys map to
+sets because saved data may already contain a clash, which an edit must
+not hide or add to. Each index
+remembers the department's timetable_version. Every write to a department's
+timetable bumps that version, so a worker holding an older index rebuilds it
+from the database on the next edit and stays hot otherwise.
+"""
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+import schedules
+import substitutes
+
+_indexes: Dict[int, 'OccupancyIndex'] = {}
+_indexes_lock = threading.Lock()
+# Serializes edit transactions within a process. SQLite's busy handler backs
+# off in coarse sleeps, so queueing here keeps concurrent edits sub-millisecond;
+# other processes still wait on the database lock.
+_write_lock = threading.Lock()
+
+class EditError(Exception):
+    """An edit that would break a constraint or targets a missing entry"""
+
+    def __init__(self, message: str, status: int = 409, details: Optional[Dict] = None):
+        super().__init__(message)
+        self.status = status
+        self.details = details or {}
+
+class OccupancyIndex:
+    def __init__(self, department_id: int, version: int, rows, classroom_ids):
+        self.department_id = department_id
+        self.version = version
+        self.classroom_ids = set(classroom_ids)
+        self.lock = threading.Lock()
+        # entry id: [day, time_slot, subject_id, staff_id, classroom_id, locked]
+        self.entries = {}
+        self.staff_at = {}
+        self.room_at = {}
+        for entry_id, day, time_slot, subject_id, staff_id, classroom_id, locked in rows:
+            self.entries[entry_id] = [day, time_slot, subject_id, staff_id, classroom_id, bool(locked)]
+            self.staff_at.setdefault((staff_id, day, time_slot), set()).add(entry_id)
+            self.room_at.setdefault((classroom_id, day, time_slot), set()).add(entry_id)
+
+    @staticmethod
+    def _holder(index: Dict, key: Tuple, exclude) -> Optional[int]:
+        """An entry other than those in exclude holding key, if any"""
+        others = index.get(key, set()).difference(exclude)
+        return min(others) if others else None
+
+    @staticmethod
+    def _release(index: Dict, key: Tuple, entry_id: int):
+        holders = index.get(key)
+        if holders is not None:
+            holders.discard(entry_id)
+            if not holders:
+                del index[key]
+
+    def get(self, entry_id: int):
+        entry = self.entries.get(entry_id)
+        if entry is None:
+            raise EditError('Timetable entry not found', 404)
+        return entry
+
+    def check_move(self, entry_id: int, day: str, time_slot: str, classroom_id: int):
+        """Raise EditError if moving the entry there would clash"""
+        entry = self.get(entry_id)
+        if entry[5]:
+            raise EditError('Entry is locked; unlock it before editing', 423)
+        if classroom_id not in self.classroom_ids:
+            raise EditError('Classroom does not belong to this department', 400)
+        holder = self._holder(self.room_at, (classroom_id, day, time_slot), (entry_id,))
+        if holder is not None:
+            raise EditError('Classroom is already booked at that time', details={'conflicting_entry_id': holder})
+        holder = self._holder(self.staff_at, (entry[3], day, time_slot), (entry_id,))
+        if holder is not None:
+            raise EditError('Staff member is already teaching at that time', details={'conflicting_entry_id': holder})
+
+    def check_swap(self, first_id: int, second_id: int):
+        """Raise EditError if exchanging the two entries' slots would clash"""
+        first, second = self.get(first_id), self.get(second_id)
+        if first[5] or second[5]:
+            raise EditError('Entry is locked; unlock it before editing', 423)
+        # Rooms are exchanged too, but the saved data may already double-book a target room
+        swapped = (first_id, second_id)
+        for entry, target in ((first, second), (second, first)):
+            holder = self._holder(self.room_at, (target[4], target[0], target[1]), swapped)
+            if holder is not None:
+                raise EditError('Classroom is already booked at that time',
+                                details={'conflicting_entry_id': holder})
+            holder = self._holder(self.staff_at, (entry[3], target[0], target[1]), swapped)
+            if holder is not None:
+                raise EditError('Staff member is already teaching at that time',
+                                details={'conflicting_entry_id': holder})
+
+    def apply_move(self, entry_id: int, day: str, time_slot: str, classroom_id: int):
+        entry = self.entries[entry_id]
+        self._release(self.staff_at, (entry[3], entry[0], entry[1]), entry_id)
+        self._release(self.room_at, (entry[4], entry[0], entry[1]), entry_id)
+        entry[0], entry[1], entry[4] = day, time_slot, classroom_id
+        self.staff_at.setdefault((entry[3], day, time_slot), set()).add(entry_id)
+        self.room_at.setdefault((classroom_id, day, time_slot), set()).add(entry_id)
+
+    def apply_swap(self, first_id: int, second_id: int) -> Tuple[Tuple, Tuple]:
+        """Exchange day, slot and room; returns the new (day, slot, room) of each"""
+        first, second = self.entries[first_id], self.entries[second_id]
+        first_target = (second[0], second[1], second[4])
+        second_target = (first[0], first[1], first[4])
+        for entry_id, entry in ((first_id, first), (second_id, second)):
+            self._release(self.staff_at, (entry[3], entry[0], entry[1]), entry_id)
+            self._release(self.room_at, (entry[4], entry[0], entry[1]), entry_id)
+        for entry_id, entry, target in ((first_id, first, first_target), (second_id, second, second_target)):
+            entry[0], entry[1], entry[4] = target
+            self.staff_at.setdefault((entry[3], entry[0], entry[1]), set()).add(entry_id)
+            self.room_at.setdefault((entry[4], entry[0], entry[1]), set()).add(entry_id)
+        return first_target, second_target
+
+def bump_version(cursor, department_id: int) -> int:
+    """Mark the department's timetable as changed; returns the new version"""
+    cursor.execute('UPDATE departments SET timetable_version = timetable_version + 1 WHERE id = ?',
+                   (department_id,))
+    cursor.execute('SELECT timetable_version FROM departments WHERE id = ?', (department_id,))
+    return cursor.fetchone()[0]
+
+def current_version(cursor, department_id: int) -> Optional[int]:
+    cursor.execute('SELECT timetable_version FROM departments WHERE id = ?', (department_id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def get_index(cursor, department_id: int, version: int) -> OccupancyIndex:
+    """Cached index for the department, rebuilt when its version is stale"""
+    with _indexes_lock:
+        index = _indexes.get(department_id)
+    if index is not None and index.version == version:
+        return index
+
+    cursor.execute('''
+        SELECT id, day, time_slot, subject_id, staff_id, classroom_id, locked
+        FROM timetables WHERE department_id = ?
+    ''', (department_id,))
+    rows = cursor.fetchall()
+    cursor.execute('SELECT id FROM classrooms WHERE department_id = ?', (department_id,))
+    classroom_ids = [row[0] for row in cursor.fetchall()]
+    index = OccupancyIndex(department_id, version, rows, classroom_ids)
+    with _indexes_lock:
+        _indexes[department_id] = index
+    return index
+
+def invalidate(department_id: int):
+    with _indexes_lock:
+        _indexes.pop(department_id, None)
+
+def entry_department(cursor, entry_id: int) -> int:
+    cursor.execute('SELECT department_id FROM timetables WHERE id = ?', (entry_id,))
+    row = cursor.fetchone()
+    if row is None:
+        raise EditError('Timetable entry not found', 404)
+    return row[0]
+
+@contextmanager
+def _edit_transaction(conn, entry_id: int):
+    """Yield (department_id, index, cursor) for an entry inside a write transaction
+
+    The version is read after taking the write lock, so no other writer can
+    change the timetable between the conflict check and the update. Anything
+    raised rolls the transaction back.
+    """
+    with _write_lock:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            department_id = entry_department(cursor, entry_id)
+            version = current_version(cursor, department_id)
+            index = get_index(cursor, department_id, version)
+            with index.lock:
+                yield department_id, index, cursor
+        except BaseException:
+            conn.rollback()
+            raise
+
+def move_entry(conn, entry_id: int, day: str, time_slot: str, classroom_id: int) -> Dict:
+    with _edit_transaction(conn, entry_id) as (department_id, index, cursor):
+        if classroom_id not in index.classroom_ids:
+            # Classrooms created since the index was built
+            cursor.execute('SELECT 1 FROM classrooms WHERE id = ? AND department_id = ?',
+                           (classroom_id, department_id))
+            if cursor.fetchone():
+                index.classroom_ids.add(classroom_id)
+        index.check_move(entry_id, day, time_slot, classroom_id)
+        cursor.execute('UPDATE timetables SET day = ?, time_slot = ?, classroom_id = ? WHERE id = ?',
+                       (day, time_slot, classroom_id, entry_id))
+        entry = index.entries[entry_id]
+        schedules.refresh(cursor, department_id, [entry[3]], {entry[4], classroom_id})
+        version = bump_version(cursor, department_id)
+        conn.commit()
+        substitutes.entries_moved(department_id, index.version, version,
+                                  [(entry[3], (entry[0], entry[1]), (day, time_slot))])
+        index.apply_move(entry_id, day, time_slot, classroom_id)
+        index.version = version
+    return {'id': entry_id, 'department_id': department_id, 'day': day, 'time_slot': time_slot,
+            'classroom_id': classroom_id}
+
+def swap_entries(conn, first_id: int, second_id: int) -> Dict:
+    with _edit_transaction(conn, first_id) as (department_id, index, cursor):
+        if entry_department(cursor, second_id) != department_id:
+            raise EditError('Entries belong to different departments', 400)
+        index.check_swap(first_id, second_id)
+        first, second = index.entries[first_id], index.entries[second_id]
+        cursor.executemany('UPDATE timetables SET day = ?, time_slot = ?, classroom_id = ? WHERE id = ?', [
+            (second[0], second[1], second[4], first_id),
+            (first[0], first[1], first[4], second_id)
+        ])
+        schedules.refresh(cursor, department_id, {first[3], second[3]}, {first[4], second[4]})
+        version = bump_version(cursor, department_id)
+        conn.commit()
+        substitutes.entries_moved(department_id, index.version, version, [
+            (first[3], (first[0], first[1]), (second[0], second[1])),
+            (second[3], (second[0], second[1]), (first[0], first[1]))
+        ])
+        first_target, second_target = index.apply_swap(first_id, second_id)
+        index.version = version
+    return {'department_id': department_id, 'entries': [
+        {'id': first_id, 'day': first_target[0], 'time_slot': first_target[1], 'classroom_id': first_target[2]},
+        {'id': second_id, 'day': second_target[0], 'time_slot': second_target[1], 'classroom_id': second_target[2]}
+    ]}
+
+def lock_entry(conn, entry_id: int, locked: bool) -> Dict:
+    with _edit_transaction(conn, entry_id) as (department_id, index, cursor):
+        index.get(entry_id)
+        cursor.execute('UPDATE timetables SET locked = ? WHERE id = ?', (1 if locked else 0, entry_id))
+        entry = index.entries[entry_id]
+        schedules.refresh(cursor, department_id, [entry[3]], [entry[4]])
+        version = bump_version(cursor, department_id)
+        conn.commit()
+        substitutes.entries_moved(department_id, index.version, version, [])
+        entry[5] = locked
+        index.version = version
+    return {'id': entry_id, 'department_id': department_id, 'locked': locked}
@@ -0,0 +1,105 @@
+"""Password hashing with bounded off-thread verification and hash upgrades.
+
+Key derivation dominates login CPU. Verification runs on a small worker
+pool (hashlib releases the GIL while deriving) so a login storm can only
+use PASSWORD_WORKERS cores, and requests beyond PASSWORD_QUEUE_SIZE waiting
+logins are turned away instead of piling up.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Hash parameters, e.g. 'pbkdf2:sha256:600000' or 'scrypt:32768:8:1'
+HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+# 0 verifies inline on the request thread
+WORKERS = int(os.getenv('PASSWORD_WORKERS', str(max(1, min(4, (os.cpu_count() or 2) // 2)))))
+QUEUE_SIZE = int(os.getenv('PASSWORD_QUEUE_SIZE', '64'))
+QUEUE_TIMEOUT = float(os.getenv('PASSWORD_QUEUE_TIMEOUT', '5'))
+
+_executor = None
+_executor_pid = None
+_slots = None
+_lock = threading.Lock()
+
+class PasswordPoolBusy(Exception):
+    """Raised when the verification queue is full"""
+
+def normalize_method(method: str) -> str:
+    """Expand a method to the full parameter string Werkzeug stores in hashes"""
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        return 'scrypt:' + ':'.join(args or ['32768', '8', '1'])
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = args[1] if len(args) > 1 else '600000'
+        return f'pbkdf2:{hash_name}:{iterations}'
+    return method
+
+def configure(method: Optional[str] = None, workers: Optional[int] = None, queue_size: Optional[int] = None):
+    """Override the hash parameters or pool size, e.g. from app config"""
+    global HASH_METHOD, WORKERS, QUEUE_SIZE
+    with _lock:
+        if method is not None:
+            HASH_METHOD = method
+        if workers is not None:
+            WORKERS = workers
+        if queue_size is not None:
+            QUEUE_SIZE = queue_size
+        _reset()
+
+def _reset():
+    global _executor, _executor_pid, _slots
+    if _executor is not None and _executor_pid == os.getpid():
+        _executor.shutdown(wait=False)
+    _executor = None
+    _executor_pid = None
+    _slots = None
+
+def _get_executor():
+    global _executor, _executor_pid, _slots
+    # Worker threads do not survive fork, so each process builds its own pool
+    if _executor is None or _executor_pid != os.getpid():
+        with _lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='password')
+                _slots = threading.BoundedSemaphore(WORKERS + QUEUE_SIZE)
+                _executor_pid = os.getpid()
+    return _executor, _slots
+
+def _run(func, *args):
+    if WORKERS <= 0:
+        return func(*args)
+    executor, slots = _get_executor()
+    if not slots.acquire(timeout=QUEUE_TIMEOUT):
+        raise PasswordPoolBusy('Too many logins in progress')
+    try:
+        future = executor.submit(func, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future.result()
+
+def hash_password(password: str) -> str:
+    return generate_password_hash(password, method=HASH_METHOD)
+
+def verify_password(password_hash: str, password: str) -> bool:
+    """Check a password on the worker pool"""
+    return _run(check_password_hash, password_hash, password)
+
+def needs_rehash(password_hash: str) -> bool:
+    """Whether a stored hash was made with parameters other than HASH_METHOD"""
+    method = password_hash.split('$', 1)[0]
+    return method != normalize_method(HASH_METHOD)
+
+def upgraded_hash(password_hash: str, password: str) -> Optional[str]:
+    """Return a fresh hash when the stored one uses outdated parameters
+
+    Call only after the password has been verified.
+    """
+    if not needs_rehash(password_hash):
+        return None
+    return _run(hash_password, password)
@@ -0,0 +1,240 @@
+"""Opt-in request profiling with cProfile and tracemalloc.
+
+Nothing is installed unless PROFILING_ENABLED is set, so a disabled app
+pays nothing. When enabled, a request is profiled if an admin sends an
+X-Profile header (cpu, memory or both), or if its endpoint is listed in
+PROFILE_ROUTES (e.g. api.generate_timetable,api.export_timetable), which
+covers the solver and the Excel export end to end.
+
+Each profile is stored under PROFILE_DIR as <id>.prof (loadable with pstats
+or snakeviz) and <id>.json (top-N hot functions and, for memory profiles,
+the largest allocation sites). The id is returned in X-Profile-Id and the
+artifacts are served to admins under /api/profiles.
+"""
+import cProfile
+import json
+import os
+import pstats
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+from typing import Dict, Optional
+
+from flask import Blueprint, current_app, g, jsonify, request, send_file
+from flask_jwt_extended import get_jwt_identity, jwt_required, verify_jwt_in_request
+
+import db
+
+ADMIN_ROLES = ('main_admin', 'dept_admin')
+MODES = ('cpu', 'memory', 'both')
+
+profiles = Blueprint('profiles', __name__)
+
+# tracemalloc is process-wide, so only one request at a time traces memory
+_memory_lock = threading.Lock()
+
+def _is_admin() -> bool:
+    try:
+        verify_jwt_in_request(optional=True)
+        user_id = get_jwt_identity()
+    except Exception:
+        return False
+    if user_id is None:
+        return False
+    conn = db.connect()
+    try:
+        row = conn.execute('SELECT role FROM users WHERE id = ?', (user_id,)).fetchone()
+    finally:
+        conn.close()
+    return bool(row) and row[0] in ADMIN_ROLES
+
+def _requested_mode() -> Optional[str]:
+    """Profiling mode for this request, or None to leave it alone"""
+    header = request.headers.get('X-Profile')
+    if header:
+        mode = header.lower() if header.lower() in MODES else 'cpu'
+        return mode if _is_admin() else None
+    if request.endpoint in current_app.config['PROFILE_ROUTES']:
+        return current_app.config['PROFILE_MODE']
+    return None
+
+def _start_profile():
+    mode = _requested_mode()
+    if mode is None:
+        return
+    state = {'id': uuid.uuid4().hex, 'mode': mode, 'started': time.perf_counter(), 'profiler': None,
+             'memory': False}
+    if mode in ('memory', 'both') and _memory_lock.acquire(blocking=False):
+        state['memory'] = True
+        tracemalloc.start(10)
+    if mode in ('cpu', 'both'):
+        state['profiler'] = cProfile.Profile()
+        state['profiler'].enable()
+    g._profile = state
+
+def _stop(state) -> float:
+    if state['profiler'] is not None:
+        state['profiler'].disable()
+    return time.perf_counter() - state['started']
+
+def _hot_functions(profiler: cProfile.Profile, top_n: int):
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:top_n]
+    return [{
+        'function': f'{os.path.basename(filename)}:{line}({name})',
+        'calls': calls,
+        'primitive_calls': primitive_calls,
+        'own_ms': round(own * 1000, 3),
+        'cumulative_ms': round(cumulative * 1000, 3)
+    } for (filename, line, name), (primitive_calls, calls, own, cumulative, _) in rows]
+
+def _finish_profile(response):
+    state = g.pop('_profile', None)
+    if state is None:
+        return response
+    elapsed = _stop(state)
+    config = current_app.config
+    directory = config['PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+
+    summary = {
+        'id': state['id'],
+        'created_at': datetime.now().isoformat(),
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'mode': state['mode'],
+        'duration_ms': round(elapsed * 1000, 3)
+    }
+    if state['profiler'] is not None:
+        state['profiler'].dump_stats(os.path.join(directory, f"{state['id']}.prof"))
+        summary['hot_functions'] = _hot_functions(state['profiler'], config['PROFILE_TOP_N'])
+    if state['memory']:
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        _memory_lock.release()
+        summary['memory'] = {
+            'peak_kb': round(peak / 1024, 1),
+            'retained_kb': round(current / 1024, 1),
+            'top_allocations': [{
+                'location': f'{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}',
+                'size_kb': round(stat.size / 1024, 1),
+                'count': stat.count
+            } for stat in snapshot.statistics('lineno')[:config['PROFILE_TOP_N']]]
+        }
+    elif state['mode'] in ('memory', 'both'):
+        summary['memory'] = {'skipped': 'another request was tracing memory'}
+
+    with open(os.path.join(directory, f"{state['id']}.json"), 'w') as f:
+        json.dump(summary, f, indent=2)
+    _prune(directory, config['PROFILE_KEEP'])
+    response.headers['X-Profile-Id'] = state['id']
+    return response
+
+def _abandon_profile(exc=None):
+    """Stop a profile whose request failed before after_request ran"""
+    state = g.pop('_profile', None)
+    if state is not None:
+        _stop(state)
+        if state['memory']:
+            tracemalloc.stop()
+            _memory_lock.release()
+
+def _prune(directory: str, keep: int):
+    summaries = sorted((entry for entry in os.scandir(directory) if entry.name.endswith('.json')),
+                       key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in summaries[keep:]:
+        for suffix in ('.json', '.prof'):
+            path = os.path.join(directory, entry.name[:-len('.json')] + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+
+def _artifact(profile_id: str, suffix: str) -> Optional[str]:
+    if not profile_id.isalnum():
+        return None
+    path = os.path.join(current_app.config['PROFILE_DIR'], profile_id + suffix)
+    return path if os.path.exists(path) else None
+
+@profiles.route('/api/profiles', methods=['GET'])
+@jwt_required()
+def list_profiles():
+    try:
+        if not _is_admin():
+            return jsonify({'error': 'Permission denied'}), 403
+
+        directory = current_app.config['PROFILE_DIR']
+        items = []
+        if os.path.isdir(directory):
+            for entry in os.scandir(directory):
+                if entry.name.endswith('.json'):
+                    with open(entry.path) as f:
+                        summary = json.load(f)
+                    summary.pop('hot_functions', None)
+                    summary.pop('memory', None)
+                    items.append(summary)
+        items.sort(key=lambda item: item['created_at'], reverse=True)
+        return jsonify(items), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@profiles.route('/api/profiles/<profile_id>', methods=['GET'])
+@jwt_required()
+def get_profile(profile_id):
+    """Summary with the top-N hot functions of one profile"""
+    try:
+        if not _is_admin():
+            return jsonify({'error': 'Permission denied'}), 403
+
+        path = _artifact(profile_id, '.json')
+        if path is None:
+            return jsonify({'error': 'Profile not found'}), 404
+
+        with open(path) as f:
+            return jsonify(json.load(f)), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@profiles.route('/api/profiles/<profile_id>/download', methods=['GET'])
+@jwt_required()
+def download_profile(profile_id):
+    """Raw cProfile stats, for pstats or snakeviz"""
+    try:
+        if not _is_admin():
+            return jsonify({'error': 'Permission denied'}), 403
+
+        path = _artifact(profile_id, '.prof')
+        if path is None:
+            return jsonify({'error': 'Profile not found'}), 404
+
+        return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                         download_name=f'{profile_id}.prof')
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def default_settings(environ=os.environ) -> Dict:
+    return {
+        'PROFILE_DIR': environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'srm-profiles')),
+        'PROFILE_ROUTES': [r for r in environ.get('PROFILE_ROUTES', '').split(',') if r],
+        'PROFILE_MODE': environ.get('PROFILE_MODE', 'cpu'),
+        'PROFILE_TOP_N': int(environ.get('PROFILE_TOP_N', '25')),
+        'PROFILE_KEEP': int(environ.get('PROFILE_KEEP', '50'))
+    }
+
+def init_app(app):
+    """Install the profiling hooks and routes, only when PROFILING_ENABLED"""
+    if not app.config.get('PROFILING_ENABLED'):
+        return
+    for key, value in default_settings().items():
+        app.config.setdefault(key, value)
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.teardown_request(_abandon_profile)
+    app.register_blueprint(profiles)
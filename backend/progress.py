@@ -0,0 +1,302 @@
+"""Live progress of timetable generation, fanned out to Server-Sent Events viewers.
+
+Each department has one channel per run. The solver publishes into it through
+a ProgressReporter, which drops progress ticks closer together than its
+interval so streaming never slows the solver. Every viewer of a department
+reads the same channel, so a run is observed once however many pages watch
+it.
+
+Channels live in the process that runs the solve. Given a database, their
+events are also handed to a background writer, which stores them in the
+generation_progress table in one transaction every FLUSH_SECONDS (terminal
+events at once), keeping only the latest pending progress and best event of
+a run; the solver thread never touches the database. A worker whose viewers
+ask for a run stored by another worker starts one relay thread that copies
+the stored events into a local channel, so all of its viewers again share a
+single reader. Only the department's latest run is kept in the table.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import db
+
+logger = logging.getLogger(__name__)
+
+# Seconds between progress events sent to viewers
+DEFAULT_INTERVAL = 0.1
+KEEPALIVE_SECONDS = 15
+# Seconds between batched writes of stored events, and between reads of a relayed run
+FLUSH_SECONDS = 0.5
+# A relayed run that publishes nothing for this long is assumed dead
+STALE_SECONDS = 120
+
+# Only the latest pending event of these types is worth storing
+COALESCED_EVENTS = ('progress', 'best')
+TERMINAL_EVENTS = ('done', 'failed')
+
+_channels: Dict[int, 'ProgressChannel'] = {}
+_relays: Dict[Tuple[int, str], 'ProgressChannel'] = {}
+_latest_runs: Dict[Tuple[str, int], Tuple[float, Optional[str]]] = {}
+_channels_lock = threading.Lock()
+
+class ProgressChannel:
+    """Bounded event history for one run, shared by all its viewers"""
+
+    def __init__(self, department_id: int, history: int = 256, database: Optional[str] = None,
+                 run_id: Optional[str] = None):
+        self.department_id = department_id
+        self.database = database
+        self.run_id = run_id or uuid.uuid4().hex
+        self.finished = False
+        self._events = deque(maxlen=history)  # (seq, event, data)
+        self._seq = 0
+        self._cond = threading.Condition()
+
+    def publish(self, event: str, data: Dict):
+        with self._cond:
+            self._seq += 1
+            self._events.append((self._seq, event, data))
+            if event in TERMINAL_EVENTS:
+                self.finished = True
+            self._cond.notify_all()
+        if self.database:
+            _writer.enqueue(self, event, data)
+
+    def events_after(self, seq: int, timeout: float) -> List[Tuple[int, str, Dict]]:
+        """Events newer than seq, waiting up to timeout for one to arrive"""
+        with self._cond:
+            if self._seq <= seq and not self.finished:
+                self._cond.wait(timeout)
+            return [e for e in self._events if e[0] > seq]
+
+class _StoreWriter:
+    """Background thread storing channel events in batches, one transaction per database and flush"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending = []  # (channel, event, data, replace)
+        self._urgent = False
+        self._writing = False
+        self._pid = None
+
+    def enqueue(self, channel: ProgressChannel, event: str, data: Dict, replace: bool = False):
+        with self._cond:
+            if event in COALESCED_EVENTS:
+                self._pending = [item for item in self._pending if item[0] is not channel or item[1] != event]
+            self._pending.append((channel, event, data, replace))
+            if self._pid != os.getpid():
+                # Started lazily, and again in a forked worker, which does not inherit the thread
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name='progress-writer', daemon=True).start()
+            if event in TERMINAL_EVENTS:
+                self._urgent = True
+                self._cond.notify_all()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Write everything pending now; False if it did not finish within timeout"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._urgent = True
+            self._cond.notify_all()
+            while self._pending or self._writing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _run(self):
+        connections = {}
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # Gather a batch; a terminal event or flush() cuts the wait short
+                if not self._urgent:
+                    self._cond.wait(FLUSH_SECONDS)
+                batch, self._pending, self._urgent = self._pending, [], False
+                self._writing = True
+            try:
+                self._write(batch, connections)
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
+
+    @staticmethod
+    def _write(batch: List, connections: Dict):
+        by_database = {}
+        for item in batch:
+            by_database.setdefault(item[0].database, []).append(item)
+        for database, items in by_database.items():
+            try:
+                conn = connections.get(database)
+                if conn is None:
+                    conn = connections[database] = db.connect(database)
+                cursor = conn.cursor()
+                for channel, event, data, replace in items:
+                    if replace:
+                        cursor.execute('DELETE FROM generation_progress WHERE department_id = ?',
+                                       (channel.department_id,))
+                    cursor.execute('''
+                        INSERT INTO generation_progress (department_id, run_id, event, data)
+                        VALUES (?, ?, ?, ?)
+                    ''', (channel.department_id, channel.run_id, event, json.dumps(data)))
+                conn.commit()
+            except sqlite3.Error as e:
+                # Stored progress is best effort; the local channel already has the events
+                logger.warning('Could not store %d progress events: %s', len(items), e)
+                conn = connections.pop(database, None)
+                if conn is not None:
+                    conn.close()
+
+_writer = _StoreWriter()
+
+def flush(timeout: float = 5.0) -> bool:
+    """Store all pending events now instead of at the next batch"""
+    return _writer.flush(timeout)
+
+class ProgressReporter:
+    """Callable handed to the solver: reporter(event, **data)"""
+
+    def __init__(self, channel: ProgressChannel, interval: float = DEFAULT_INTERVAL):
+        self.channel = channel
+        self.interval = interval
+        self._last_progress = 0.0
+
+    def __call__(self, event: str, **data):
+        if event == 'progress':
+            now = time.monotonic()
+            if now - self._last_progress < self.interval:
+                return
+            self._last_progress = now
+        self.channel.publish(event, data)
+
+def start_run(department_id: int, interval: float = DEFAULT_INTERVAL,
+              database: Optional[str] = None) -> ProgressReporter:
+    """Open a fresh channel for a department's run, replacing the previous one
+
+    With a database the run is announced there by a 'queued' event, which
+    also replaces the department's previous run in the table.
+    """
+    channel = ProgressChannel(department_id, database=database)
+    with _channels_lock:
+        _channels[department_id] = channel
+    if database:
+        _writer.enqueue(channel, 'queued', {'department_id': department_id}, replace=True)
+    return ProgressReporter(channel, interval)
+
+def get_channel(department_id: int) -> Optional[ProgressChannel]:
+    with _channels_lock:
+        return _channels.get(department_id)
+
+def format_sse(seq: int, event: str, data: Dict) -> str:
+    return f'id: {seq}\nevent: {event}\ndata: {json.dumps(data)}\n\n'
+
+def _latest_stored_run(database: str, department_id: int) -> Optional[str]:
+    """Run id of the department's stored run, read at most once per FLUSH_SECONDS by this worker"""
+    key = (database, department_id)
+    now = time.monotonic()
+    with _channels_lock:
+        cached = _latest_runs.get(key)
+        if cached is not None and now - cached[0] < FLUSH_SECONDS:
+            return cached[1]
+    conn = db.connect(database)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT run_id FROM generation_progress WHERE department_id = ? ORDER BY id DESC LIMIT 1',
+                       (department_id,))
+        row = cursor.fetchone()
+    finally:
+        conn.close()
+    run_id = row[0] if row else None
+    with _channels_lock:
+        _latest_runs[key] = (now, run_id)
+    return run_id
+
+def _relay(database: str, department_id: int, run_id: str) -> ProgressChannel:
+    """This worker's copy of a run stored by another worker, shared by all of its viewers here"""
+    key = (department_id, run_id)
+    with _channels_lock:
+        channel = _relays.get(key)
+        if channel is None:
+            channel = _relays[key] = ProgressChannel(department_id, run_id=run_id)
+            threading.Thread(target=_follow_stored, args=(database, channel), name='progress-relay',
+                             daemon=True).start()
+    return channel
+
+def _follow_stored(database: str, channel: ProgressChannel):
+    """Copy a stored run into channel until it ends, reading new rows every FLUSH_SECONDS"""
+    last_id = 0
+    last_row = time.monotonic()
+    try:
+        conn = db.connect(database)
+        try:
+            cursor = conn.cursor()
+            while not channel.finished:
+                cursor.execute('''
+                    SELECT id, event, data FROM generation_progress
+                    WHERE department_id = ? AND run_id = ? AND id > ?
+                    ORDER BY id
+                ''', (channel.department_id, channel.run_id, last_id))
+                rows = cursor.fetchall()
+                for last_id, event, data in rows:
+                    channel.publish(event, json.loads(data))
+                if rows:
+                    last_row = time.monotonic()
+                    continue
+                cursor.execute('SELECT 1 FROM generation_progress WHERE run_id = ? LIMIT 1', (channel.run_id,))
+                if cursor.fetchone() is None:
+                    channel.publish('failed', {'error': 'The generation run was replaced by a newer one'})
+                elif time.monotonic() - last_row >= STALE_SECONDS:
+                    channel.publish('failed', {'error': 'The generation run stopped reporting progress'})
+                else:
+                    time.sleep(FLUSH_SECONDS)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        channel.publish('failed', {'error': f'Could not read generation progress: {e}'})
+    finally:
+        with _channels_lock:
+            _relays.pop((channel.department_id, channel.run_id), None)
+
+def stream(department_id: int, wait_for_run: float = 30.0, database: Optional[str] = None):
+    """Yield SSE frames for the department's latest run until it finishes
+
+    A finished run is replayed (ending with its 'done' event); when no run
+    exists yet the stream waits up to wait_for_run seconds for one to start.
+    A run in this process is followed through its channel; with a database,
+    a run on another worker is followed through this worker's relay of it.
+    """
+    deadline = time.monotonic() + wait_for_run
+    while True:
+        channel = get_channel(department_id)
+        if database:
+            run_id = _latest_stored_run(database, department_id)
+            # A run stored by another worker, or newer than this worker's finished one
+            if run_id is not None and (channel is None or (channel.finished and run_id != channel.run_id)):
+                channel = _relay(database, department_id, run_id)
+        if channel is not None:
+            break
+        if time.monotonic() >= deadline:
+            yield format_sse(0, 'idle', {'department_id': department_id})
+            return
+        yield ': waiting\n\n'
+        time.sleep(0.5)
+
+    seq = 0
+    while True:
+        events = channel.events_after(seq, KEEPALIVE_SECONDS)
+        if not events:
+            yield ': keepalive\n\n'
+        for seq, event, data in events:
+            yield format_sse(seq, event, data)
+            if event in TERMINAL_EVENTS:
+                return
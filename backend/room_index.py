@@ -0,0 +1,98 @@
+"""Free-classroom lookups from a slot occupancy bitmap.
+
+Rooms are sorted by capacity and numbered in that order, so bit i of a mask
+is the i-th smallest room. occupied maps (day, slot) to the rooms booked
+then; the rooms free for a run of slots are the complement of the OR of
+their masks, and clearing the bits below the first room with enough seats
+(found by bisecting the capacity list) leaves the candidates in best-fit
+order. One index is kept per department plus one for the whole campus, each
+rebuilt when its versions change.
+"""
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+import timetable_slots
+
+CAMPUS = None  # scope key of the campus-wide index
+
+_indexes: Dict[Optional[int], 'RoomIndex'] = {}
+_indexes_lock = threading.Lock()
+
+class RoomIndex:
+    def __init__(self, version: Tuple, rooms, bookings):
+        self.version = version
+        # (id, name, capacity, department_id), smallest first
+        self.rooms = sorted(rooms, key=lambda room: (room[2], room[0]))
+        self.capacities = [room[2] for room in self.rooms]
+        self.all_rooms = (1 << len(self.rooms)) - 1
+        bit_of = {room[0]: bit for bit, room in enumerate(self.rooms)}
+        self.occupied = {}
+        for classroom_id, day, time_slot in bookings:
+            bit = bit_of.get(classroom_id)
+            if bit is not None:
+                self.occupied[(day, time_slot)] = self.occupied.get((day, time_slot), 0) | (1 << bit)
+
+    def free(self, day: str, time_slots: List[str], min_capacity: int = 0) -> List[Dict]:
+        """Rooms free in every one of the slots with at least min_capacity seats, best fit first"""
+        mask = self.all_rooms
+        for time_slot in time_slots:
+            mask &= ~self.occupied.get((day, time_slot), 0)
+        mask &= ~((1 << bisect_left(self.capacities, min_capacity)) - 1)
+
+        rooms = []
+        while mask:
+            low = mask & -mask
+            classroom_id, name, capacity, department_id = self.rooms[low.bit_length() - 1]
+            rooms.append({'id': classroom_id, 'name': name, 'capacity': capacity, 'department_id': department_id})
+            mask ^= low
+        return rooms
+
+def scope_version(cursor, department_id: Optional[int]) -> Optional[Tuple]:
+    """Version key of a department's (or the campus's) timetable and reference data, None if missing"""
+    if department_id is CAMPUS:
+        # Versions only grow, so the sums change on any write; the count covers deletions
+        cursor.execute('SELECT COUNT(*), SUM(timetable_version), SUM(data_version) FROM departments')
+        return cursor.fetchone()
+    cursor.execute('SELECT timetable_version, data_version FROM departments WHERE id = ?', (department_id,))
+    return cursor.fetchone()
+
+def get_index(cursor, department_id: Optional[int]) -> Optional[RoomIndex]:
+    """Cached index for a department (or CAMPUS), or None if the department does not exist"""
+    version = scope_version(cursor, department_id)
+    if version is None:
+        return None
+    with _indexes_lock:
+        index = _indexes.get(department_id)
+    if index is not None and index.version == version:
+        return index
+
+    where = '' if department_id is CAMPUS else ' WHERE department_id = ?'
+    params = () if department_id is CAMPUS else (department_id,)
+    cursor.execute('SELECT id, name, capacity, department_id FROM classrooms' + where, params)
+    rooms = [row for row in cursor.fetchall() if row[2] is not None]
+    cursor.execute('SELECT classroom_id, day, time_slot FROM timetables' + where, params)
+    index = RoomIndex(version, rooms, cursor.fetchall())
+    with _indexes_lock:
+        _indexes[department_id] = index
+    return index
+
+def slot_range(time_slot: str, length: int = 1) -> List[str]:
+    """time_slot and the length - 1 slots after it"""
+    if time_slot not in timetable_slots.TIME_SLOTS:
+        raise ValueError(f'Unknown time slot: {time_slot}')
+    if length < 1:
+        raise ValueError('length must be at least 1')
+    start = timetable_slots.TIME_SLOTS.index(time_slot)
+    time_slots = timetable_slots.TIME_SLOTS[start:start + length]
+    if len(time_slots) < length:
+        raise ValueError(f'Only {len(time_slots)} slot(s) remain after {time_slot}')
+    return time_slots
+
+def find_free_rooms(cursor, department_id: Optional[int], day: str, time_slot: str, length: int = 1,
+                    min_capacity: int = 0) -> Optional[List[Dict]]:
+    if day not in timetable_slots.DAYS:
+        raise ValueError(f'Unknown day: {day}')
+    time_slots = slot_range(time_slot, length)
+    index = get_index(cursor, department_id)
+    return None if index is None else index.free(day, time_slots, min_capacity)
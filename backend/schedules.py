@@ -0,0 +1,139 @@
+"""Materialized weekly schedules per staff member and per room.
+
+staff_schedules and room_schedules hold one ready-to-send JSON document per
+staff member or classroom of a department. They are rewritten inside the
+transaction that writes the timetable (generation saves and manual edits),
+so a dashboard read is a primary-key lookup returning the stored text.
+
+Documents carry names, so each row remembers the department's data_version;
+a read that finds it behind (e.g. a staff member was renamed) rebuilds that
+one document first.
+"""
+import json
+from typing import Dict, Iterable, Optional
+
+import timetable_slots
+
+def _dumps(document: Dict) -> str:
+    return json.dumps(document, separators=(',', ':'))
+
+def _lectures(cursor, department_id: int, column: str, ids) -> Dict[int, list]:
+    """Lectures of the given staff or classroom ids in a department's timetable, in week order"""
+    day_index = {day: i for i, day in enumerate(timetable_slots.DAYS)}
+    slot_index = {slot: i for i, slot in enumerate(timetable_slots.TIME_SLOTS)}
+    by_owner = {owner_id: [] for owner_id in ids}
+    if not by_owner:
+        return by_owner
+    cursor.execute(f'''
+        SELECT t.id, t.{column}, t.day, t.time_slot, t.locked, t.subject_id, s.name, s.code,
+               t.staff_id, u.name, t.classroom_id, c.name
+        FROM timetables t
+        JOIN subjects s ON t.subject_id = s.id
+        JOIN users u ON t.staff_id = u.id
+        JOIN classrooms c ON t.classroom_id = c.id
+        WHERE t.department_id = ? AND t.{column} IN ({', '.join('?' for _ in by_owner)})
+    ''', (department_id, *by_owner))
+    for row in cursor.fetchall():
+        by_owner[row[1]].append({
+            'id': row[0],
+            'day': row[2],
+            'time_slot': row[3],
+            'locked': bool(row[4]),
+            'subject_id': row[5],
+            'subject_name': row[6],
+            'subject_code': row[7],
+            'staff_id': row[8],
+            'staff_name': row[9],
+            'classroom_id': row[10],
+            'classroom_name': row[11]
+        })
+    for lectures in by_owner.values():
+        lectures.sort(key=lambda lecture: (day_index.get(lecture['day'], 99),
+                                           slot_index.get(lecture['time_slot'], 99)))
+    return by_owner
+
+def _chunks(ids, size=500):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+def refresh(cursor, department_id: int, staff_ids: Optional[Iterable[int]] = None,
+            classroom_ids: Optional[Iterable[int]] = None):
+    """Rewrite schedule documents of a department in the caller's transaction
+
+    With no ids every staff member and classroom of the department is
+    rewritten (and rows of ones that left it are dropped); otherwise only
+    the given ones.
+    """
+    cursor.execute('SELECT data_version FROM departments WHERE id = ?', (department_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return
+    data_version = row[0]
+
+    if staff_ids is None and classroom_ids is None:
+        cursor.execute('DELETE FROM staff_schedules WHERE department_id = ?', (department_id,))
+        cursor.execute('DELETE FROM room_schedules WHERE department_id = ?', (department_id,))
+        cursor.execute("SELECT id, name FROM users WHERE department_id = ? AND role = 'staff'", (department_id,))
+        staff = cursor.fetchall()
+        cursor.execute('SELECT id, name, capacity FROM classrooms WHERE department_id = ?', (department_id,))
+        rooms = cursor.fetchall()
+    else:
+        staff, rooms = [], []
+        for chunk in _chunks(set(staff_ids or ())):
+            cursor.execute(f"SELECT id, name FROM users WHERE id IN ({', '.join('?' for _ in chunk)})", chunk)
+            staff.extend(cursor.fetchall())
+        for chunk in _chunks(set(classroom_ids or ())):
+            cursor.execute(f"SELECT id, name, capacity FROM classrooms WHERE id IN ({', '.join('?' for _ in chunk)})",
+                           chunk)
+            rooms.extend(cursor.fetchall())
+
+    for chunk in _chunks(staff):
+        lectures = _lectures(cursor, department_id, 'staff_id', [staff_id for staff_id, _ in chunk])
+        cursor.executemany('INSERT OR REPLACE INTO staff_schedules VALUES (?, ?, ?, ?)', [
+            (staff_id, department_id, data_version, _dumps({
+                'staff_id': staff_id, 'name': name, 'department_id': department_id,
+                'lectures': lectures[staff_id]
+            })) for staff_id, name in chunk
+        ])
+    for chunk in _chunks(rooms):
+        lectures = _lectures(cursor, department_id, 'classroom_id', [classroom_id for classroom_id, _, _ in chunk])
+        cursor.executemany('INSERT OR REPLACE INTO room_schedules VALUES (?, ?, ?, ?)', [
+            (classroom_id, department_id, data_version, _dumps({
+                'classroom_id': classroom_id, 'name': name, 'capacity': capacity, 'department_id': department_id,
+                'lectures': lectures[classroom_id]
+            })) for classroom_id, name, capacity in chunk
+        ])
+
+def _read(conn, table: str, key: str, owner_id: int) -> Optional[str]:
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT m.document, m.department_id, m.data_version = d.data_version
+        FROM {table} m
+        JOIN departments d ON m.department_id = d.id
+        WHERE m.{key} = ?
+    ''', (owner_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    document, department_id, current = row
+    if current:
+        return document
+
+    # Names may have changed since the document was written
+    if table == 'staff_schedules':
+        refresh(cursor, department_id, staff_ids=[owner_id], classroom_ids=[])
+    else:
+        refresh(cursor, department_id, staff_ids=[], classroom_ids=[owner_id])
+    conn.commit()
+    cursor.execute(f'SELECT document FROM {table} WHERE {key} = ?', (owner_id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def staff_schedule(conn, staff_id: int) -> Optional[str]:
+    """Stored weekly schedule JSON of a staff member, or None if none was written"""
+    return _read(conn, 'staff_schedules', 'staff_id', staff_id)
+
+def room_schedule(conn, classroom_id: int) -> Optional[str]:
+    """Stored weekly schedule JSON of a classroom, or None if none was written"""
+    return _read(conn, 'room_schedules', 'classroom_id', classroom_id)
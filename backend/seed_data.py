@@ -1,10 +1,11 @@
 
+import random
 import sqlite3
-from werkzeug.security import generate_password_hash
+from passwords import hash_password
 
-def seed_database():
+def seed_database(database='timetable.db'):
     """Seed database with sample data"""
-    conn = sqlite3.connect('timetable.db')
+    conn = sqlite3.connect(database)
     cursor = conn.cursor()
     
     # Sample departments
@@ -49,14 +50,14 @@ def seed_database():
     # Sample users
     users = [
         # Main Admin
-        ('Main Admin', 'admin@srmist.edu.in', generate_password_hash('admin123'), 'main_admin', None, None, None, False),
+        ('Main Admin', 'admin@srmist.edu.in', hash_password('admin123'), 'main_admin', None, None, None, False),
         # Department Admin for CSE
-        ('CSE Admin', 'cse.admin@srmist.edu.in', generate_password_hash('cseadmin123'), 'dept_admin', 1, None, None, False),
+        ('CSE Admin', 'cse.admin@srmist.edu.in', hash_password('cseadmin123'), 'dept_admin', 1, None, None, False),
         # Staff members for CSE
-        ('Dr. John Smith', 'john.smith@srmist.edu.in', generate_password_hash('staff123'), 'staff', 1, 'professor', '1,2', True),
-        ('Prof. Jane Doe', 'jane.doe@srmist.edu.in', generate_password_hash('staff123'), 'staff', 1, 'hod', '3', True),
-        ('Dr. Mike Johnson', 'mike.johnson@srmist.edu.in', generate_password_hash('staff123'), 'staff', 1, 'assistant_professor', '4,5', True),
-        ('Dr. Sarah Wilson', 'sarah.wilson@srmist.edu.in', generate_password_hash('staff123'), 'staff', 1, 'assistant_professor', '6,7', True)
+        ('Dr. John Smith', 'john.smith@srmist.edu.in', hash_password('staff123'), 'staff', 1, 'professor', '1,2', True),
+        ('Prof. Jane Doe', 'jane.doe@srmist.edu.in', hash_password('staff123'), 'staff', 1, 'hod', '3', True),
+        ('Dr. Mike Johnson', 'mike.johnson@srmist.edu.in', hash_password('staff123'), 'staff', 1, 'assistant_professor', '4,5', True),
+        ('Dr. Sarah Wilson', 'sarah.wilson@srmist.edu.in', hash_password('staff123'), 'staff', 1, 'assistant_professor', '6,7', True)
     ]
     
     for user in users:
@@ -70,5 +71,73 @@ def seed_database():
     conn.close()
     print("Database seeded successfully!")
 
+def seed_synthetic_campus(database, departments=10, staff_per_department=40, subjects_per_department=30,
+                          classrooms_per_department=10, seed=42):
+    """Seed a synthetic campus for benchmarks and load tests
+
+    Every account shares the password 'staff123' (hashed once). Staff have
+    their subjects selected and locked, so each department is ready to
+    generate. Works on both schemas; on the enhanced one usernames and
+    employee ids are derived from the emails. Returns the ids and emails
+    that were created.
+    """
+    rng = random.Random(seed)
+    password_hash = hash_password('staff123')
+    conn = sqlite3.connect(database)
+    cursor = conn.cursor()
+    
+    cursor.execute('PRAGMA table_info(users)')
+    enhanced = 'username' in {row[1] for row in cursor.fetchall()}
+    
+    def insert_users(columns, rows, verb='INSERT'):
+        if enhanced:
+            columns = columns + ('username', 'employee_id')
+            rows = [row + (row[1].split('@')[0], 'EMP-' + row[1].split('@')[0]) for row in rows]
+        cursor.executemany(f'''
+            {verb} INTO users ({', '.join(columns)})
+            VALUES ({', '.join('?' for _ in columns)})
+        ''', rows)
+    
+    insert_users(('name', 'email', 'password_hash', 'role'),
+                 [('Campus Admin', 'campus.admin@srmist.edu.in', password_hash, 'main_admin')], 'INSERT OR IGNORE')
+    
+    department_ids = []
+    staff_emails = []
+    for d in range(departments):
+        cursor.execute('INSERT INTO departments (name, code) VALUES (?, ?)',
+                       (f'Synthetic Department {d}', f'SYN{d:03d}'))
+        department_id = cursor.lastrowid
+        department_ids.append(department_id)
+        
+        subject_ids = []
+        for s in range(subjects_per_department):
+            cursor.execute('INSERT INTO subjects (name, code, department_id, credits) VALUES (?, ?, ?, ?)',
+                           (f'Subject {d}-{s}', f'S{d:03d}{s:03d}', department_id, rng.choice([2, 3, 4])))
+            subject_ids.append(cursor.lastrowid)
+        
+        cursor.executemany('INSERT INTO classrooms (name, capacity, department_id) VALUES (?, ?, ?)', [
+            (f'Room {d}-{r}', rng.choice([30, 40, 60, 100]), department_id)
+            for r in range(classrooms_per_department)
+        ])
+        
+        insert_users(('name', 'email', 'password_hash', 'role', 'department_id'),
+                     [(f'Admin {d}', f'admin{d}@srmist.edu.in', password_hash, 'dept_admin', department_id)])
+        
+        staff_rows = []
+        for i in range(staff_per_department):
+            staff_role = rng.choice(['assistant_professor', 'assistant_professor', 'professor', 'hod'])
+            count = 2 if staff_role == 'assistant_professor' else 1
+            selected = ','.join(str(sid) for sid in rng.sample(subject_ids, count))
+            email = f'staff{d}.{i}@srmist.edu.in'
+            staff_emails.append(email)
+            staff_rows.append((f'Staff {d}-{i}', email, password_hash, 'staff', department_id,
+                               staff_role, selected, True))
+        insert_users(('name', 'email', 'password_hash', 'role', 'department_id', 'staff_role',
+                      'subjects_selected', 'subjects_locked'), staff_rows)
+    
+    conn.commit()
+    conn.close()
+    return {'department_ids': department_ids, 'staff_emails': staff_emails}
+
 if __name__ == '__main__':
     seed_database()
@@ -0,0 +1,240 @@
+"""Dated lecture occurrences for a semester.
+
+The saved timetable is one abstract week. A semester (start and end date)
+turns it into dated sessions: every teaching date in the range repeats the
+timetable rows of its weekday, minus calendar exceptions - holidays and exam
+weeks (campus-wide or for one department) and one-off cancellations of a
+single timetable entry.
+
+Occurrences are generated lazily, date by date and slot by slot, each slot
+read through its own cursor on the (day, time_slot) index, so a range query
+or ICS feed streams in chronological order while holding at most one row
+and the (small) exception list in memory, however many weeks it spans.
+"""
+import json
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import db
+import timetable_slots
+
+EXCEPTION_KINDS = ('holiday', 'exam_week', 'cancellation')
+
+# Occurrences per chunk written to the response
+CHUNK_SIZE = 256
+
+def parse_date(value, field: str) -> date:
+    if not value:
+        raise ValueError(f'{field} is required')
+    try:
+        return date.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError(f'{field} must be a date in YYYY-MM-DD format')
+
+def slot_times(time_slot: str) -> Tuple[time, time]:
+    """Start and end of a slot such as '2:15-3:15'; hours before 8 are afternoon"""
+    def parse(value):
+        hour, minute = (int(part) for part in value.split(':'))
+        return time(hour + 12 if hour < 8 else hour, minute)
+
+    start, end = time_slot.split('-')
+    return parse(start), parse(end)
+
+def get_semester(cursor, semester_id: int) -> Optional[Dict]:
+    cursor.execute('SELECT id, name, start_date, end_date FROM semesters WHERE id = ?', (semester_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return {'id': row[0], 'name': row[1], 'start_date': row[2], 'end_date': row[3]}
+
+def validate_exception(data: Dict, semester: Dict) -> Tuple:
+    """(kind, start_date, end_date, department_id, timetable_entry_id, reason) for a new exception
+
+    end_date defaults to start_date; cancellations need a timetable_entry_id
+    and holidays / exam weeks must not have one.
+    """
+    kind = data.get('kind')
+    if kind not in EXCEPTION_KINDS:
+        raise ValueError(f"kind must be one of {', '.join(EXCEPTION_KINDS)}")
+    start = parse_date(data.get('start_date'), 'start_date')
+    end = parse_date(data.get('end_date') or data.get('start_date'), 'end_date')
+    if end < start:
+        raise ValueError('end_date must not be before start_date')
+    if start < date.fromisoformat(semester['start_date']) or end > date.fromisoformat(semester['end_date']):
+        raise ValueError('The exception must fall within the semester')
+
+    department_id = data.get('department_id')
+    entry_id = data.get('timetable_entry_id')
+    if kind == 'cancellation' and not entry_id:
+        raise ValueError('timetable_entry_id is required for a cancellation')
+    if kind != 'cancellation' and entry_id:
+        raise ValueError('timetable_entry_id is only allowed for a cancellation')
+    return (kind, start.isoformat(), end.isoformat(), int(department_id) if department_id else None,
+            int(entry_id) if entry_id else None, data.get('reason'))
+
+class _Exceptions:
+    """Calendar exceptions of a semester, answering per-date questions"""
+
+    def __init__(self, rows):
+        # (kind, start, end, department_id, timetable_entry_id)
+        self.rows = [(kind, date.fromisoformat(start), date.fromisoformat(end), department_id, entry_id)
+                     for kind, start, end, department_id, entry_id in rows]
+
+    def on(self, day: date) -> Tuple[bool, set, set]:
+        """(whole campus closed, closed department ids, cancelled entry ids) on a date"""
+        campus_closed = False
+        departments, entries = set(), set()
+        for kind, start, end, department_id, entry_id in self.rows:
+            if not start <= day <= end:
+                continue
+            if kind == 'cancellation':
+                entries.add(entry_id)
+            elif department_id is None:
+                campus_closed = True
+            else:
+                departments.add(department_id)
+        return campus_closed, departments, entries
+
+def _filters(department_id: Optional[int], staff_id: Optional[int], classroom_id: Optional[int]):
+    clauses, params = [], []
+    for column, value in (('t.department_id', department_id), ('t.staff_id', staff_id),
+                          ('t.classroom_id', classroom_id)):
+        if value is not None:
+            clauses.append(f'{column} = ?')
+            params.append(value)
+    return ''.join(' AND ' + clause for clause in clauses), params
+
+def occurrences(database: str, semester: Dict, start: Optional[date] = None, end: Optional[date] = None,
+                department_id: Optional[int] = None, staff_id: Optional[int] = None,
+                classroom_id: Optional[int] = None) -> Iterator[Dict]:
+    """Lazily yield dated occurrences between start and end (inclusive), in time order
+
+    The range is clipped to the semester. The generator owns its connection
+    and reads inside one transaction, so the whole expansion sees a single
+    snapshot of the timetable even if it is saved meanwhile.
+    """
+    first = max(start or date.min, date.fromisoformat(semester['start_date']))
+    last = min(end or date.max, date.fromisoformat(semester['end_date']))
+    where, params = _filters(department_id, staff_id, classroom_id)
+    times = {time_slot: slot_times(time_slot) for time_slot in timetable_slots.TIME_SLOTS}
+
+    conn = db.connect(database)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN')
+        cursor.execute('''
+            SELECT kind, start_date, end_date, department_id, timetable_entry_id
+            FROM calendar_exceptions
+            WHERE semester_id = ? AND start_date <= ? AND end_date >= ?
+        ''', (semester['id'], last.isoformat(), first.isoformat()))
+        exceptions = _Exceptions(cursor.fetchall())
+
+        current = first
+        while current <= last:
+            weekday = current.weekday()
+            campus_closed, closed_departments, cancelled = exceptions.on(current)
+            if weekday < len(timetable_slots.DAYS) and not campus_closed:
+                day = timetable_slots.DAYS[weekday]
+                for time_slot in timetable_slots.TIME_SLOTS:
+                    slot_start, slot_end = times[time_slot]
+                    cursor.execute(f'''
+                        SELECT t.id, t.department_id, t.subject_id, s.code, s.name,
+                               t.staff_id, u.name, t.classroom_id, c.name
+                        FROM timetables t
+                        JOIN subjects s ON t.subject_id = s.id
+                        JOIN users u ON t.staff_id = u.id
+                        JOIN classrooms c ON t.classroom_id = c.id
+                        WHERE t.day = ? AND t.time_slot = ?{where}
+                        ORDER BY t.id
+                    ''', (day, time_slot, *params))
+                    for row in cursor:
+                        if row[1] in closed_departments or row[0] in cancelled:
+                            continue
+                        yield {
+                            'entry_id': row[0],
+                            'date': current.isoformat(),
+                            'day': day,
+                            'time_slot': time_slot,
+                            'start': datetime.combine(current, slot_start).isoformat(),
+                            'end': datetime.combine(current, slot_end).isoformat(),
+                            'department_id': row[1],
+                            'subject_id': row[2],
+                            'subject_code': row[3],
+                            'subject_name': row[4],
+                            'staff_id': row[5],
+                            'staff_name': row[6],
+                            'classroom_id': row[7],
+                            'classroom_name': row[8]
+                        }
+            current += timedelta(days=1)
+    finally:
+        conn.rollback()
+        conn.close()
+
+def _chunked(pieces: Iterable[str]) -> Iterator[str]:
+    """Join pieces into CHUNK_SIZE batches so the server writes fewer, larger chunks"""
+    batch: List[str] = []
+    for piece in pieces:
+        batch.append(piece)
+        if len(batch) >= CHUNK_SIZE:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+def json_array(items: Iterable[Dict]) -> Iterator[str]:
+    """Stream items as one JSON array"""
+    def pieces():
+        yield '['
+        separator = ''
+        for item in items:
+            yield separator + json.dumps(item, separators=(',', ':'))
+            separator = ','
+        yield ']'
+
+    return _chunked(pieces())
+
+def _ics_text(value) -> str:
+    return (str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\n', '\\n'))
+
+def _fold(line: str) -> str:
+    """Fold a content line to 75 octets as RFC 5545 requires"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts, start, limit = [], 0, 75
+    while start < len(encoded):
+        stop = min(start + limit, len(encoded))
+        # Do not split a multi-byte character
+        while stop < len(encoded) and encoded[stop] & 0xC0 == 0x80:
+            stop -= 1
+        parts.append(encoded[start:stop].decode('utf-8'))
+        start, limit = stop, 74  # continuation lines start with a space
+    return '\r\n '.join(parts) + '\r\n'
+
+def _ics_stamp(value: datetime) -> str:
+    return value.strftime('%Y%m%dT%H%M%S')
+
+def ics_feed(semester: Dict, items: Iterable[Dict]) -> Iterator[str]:
+    """Stream occurrences as an iCalendar document with floating (campus local) times"""
+    stamp = _ics_stamp(datetime.now(timezone.utc)) + 'Z'
+
+    def pieces():
+        yield ''.join(_fold(line) for line in (
+            'BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//SRM Timetable//Semester Calendar//EN',
+            'CALSCALE:GREGORIAN', f"X-WR-CALNAME:{_ics_text(semester['name'])}"))
+        for item in items:
+            yield ''.join(_fold(line) for line in (
+                'BEGIN:VEVENT',
+                f"UID:{item['entry_id']}-{item['date'].replace('-', '')}@srm-timetable",
+                f'DTSTAMP:{stamp}',
+                f"DTSTART:{_ics_stamp(datetime.fromisoformat(item['start']))}",
+                f"DTEND:{_ics_stamp(datetime.fromisoformat(item['end']))}",
+                f"SUMMARY:{_ics_text(item['subject_code'] + ' ' + item['subject_name'])}",
+                f"LOCATION:{_ics_text(item['classroom_name'])}",
+                f"DESCRIPTION:{_ics_text(item['staff_name'])}",
+                'END:VEVENT'))
+        yield 'END:VCALENDAR\r\n'
+
+    return _chunked(pieces())
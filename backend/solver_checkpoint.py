@@ -0,0 +1,131 @@
+"""On-disk checkpoints of long timetable solves.
+
+While a solve runs, its state (RNG state, pass counter, best placement so
+far and the position reached in the current pass, with placements stored
+as flat integer lists) is written as zlib-compressed JSON at most every
+`interval` seconds. Each write goes to a temporary file that is fsynced and
+renamed over the previous checkpoint, so a crash leaves the old or the new
+checkpoint, never a torn one.
+
+The file is named after the department, a hash of the database path and
+the fingerprint of the solve's inputs (assignments, classrooms, locked
+entries), so solves of other databases or of different inputs never share
+a file. The next solve with the same fingerprint resumes from it; two
+concurrent solves with the same inputs write the same file, and either
+state is a valid one to resume. A solve that returns normally removes its
+checkpoint, so only interrupted runs leave one behind.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+import zlib
+from typing import Dict, List, Optional
+
+FORMAT_VERSION = 1
+DEFAULT_INTERVAL = 5.0
+
+def fingerprint(assignments: List[Dict], classroom_ids: List[int], locked_entries: List[Dict],
+                scope: str = '') -> str:
+    """Hash of everything a saved solver state refers to by position"""
+    digest = hashlib.sha1(scope.encode())
+    digest.update(json.dumps([[a['staff_id'], a['subject_id']] for a in assignments]).encode())
+    digest.update(json.dumps(classroom_ids).encode())
+    digest.update(json.dumps(sorted([e['day'], e['time_slot'], e['classroom_id'], e['staff_id']]
+                                    for e in locked_entries)).encode())
+    return digest.hexdigest()
+
+def rng_state(state) -> List:
+    """random.Random.getstate() as JSON-friendly lists"""
+    version, internal, gauss_next = state
+    return [version, list(internal), gauss_next]
+
+def restore_rng_state(state: List):
+    version, internal, gauss_next = state
+    return version, tuple(internal), gauss_next
+
+class Checkpointer:
+    """Periodic, atomic checkpoint file of one department's solve
+
+    The path is only known once load() is given the fingerprint.
+    """
+
+    def __init__(self, directory: str, prefix: str, interval: float = DEFAULT_INTERVAL):
+        self.directory = directory
+        self.prefix = prefix
+        self.interval = interval
+        self.path = None
+        self.fingerprint = None
+        self.writes = 0
+        self.write_seconds = 0.0
+        self.last_size = 0
+        self._last_write = time.monotonic()
+
+    @classmethod
+    def for_department(cls, directory: str, department_id: int, database: str,
+                       interval: float = DEFAULT_INTERVAL):
+        database_hash = hashlib.sha1(os.path.abspath(database).encode()).hexdigest()[:12]
+        return cls(directory, f'department-{department_id}-{database_hash}', interval)
+
+    def load(self, fingerprint: str) -> Optional[Dict]:
+        """Saved state for these inputs, or None if there is none (or it is unreadable or stale)"""
+        self.fingerprint = fingerprint
+        self.path = os.path.join(self.directory, f'{self.prefix}-{fingerprint[:16]}.ckpt')
+        try:
+            with open(self.path, 'rb') as f:
+                state = json.loads(zlib.decompress(f.read()))
+        except (OSError, ValueError, zlib.error):
+            return None
+        if state.get('version') != FORMAT_VERSION or state.get('fingerprint') != fingerprint:
+            return None
+        return state
+
+    def due(self) -> bool:
+        return time.monotonic() - self._last_write >= self.interval
+
+    def save(self, state: Dict):
+        """Atomically replace the checkpoint with state"""
+        started = time.perf_counter()
+        payload = zlib.compress(json.dumps({'version': FORMAT_VERSION, 'fingerprint': self.fingerprint, **state},
+                                           separators=(',', ':')).encode(), 1)
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=self.directory, prefix='.' + os.path.basename(self.path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, self.path)
+        except BaseException:
+            try:
+                os.unlink(temporary)
+            except OSError:
+                pass
+            raise
+        self._last_write = time.monotonic()
+        self.writes += 1
+        self.write_seconds += time.perf_counter() - started
+        self.last_size = len(payload)
+
+    def discard(self):
+        """Remove this solve's checkpoint"""
+        if self.path is None:
+            return
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def discard_all(self):
+        """Remove every checkpoint of the department in this database, whatever its inputs"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.startswith(self.prefix + '-') and name.endswith('.ckpt'):
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,138 @@
+"""Bitset indexes for finding substitute staff.
+
+Every staff member of a department gets a bit. can_teach maps a subject to
+the staff who selected it and busy maps (day, slot) to the staff teaching
+then, so the qualified and free staff for a lecture are one AND-NOT of two
+integers. Indexes are keyed by the department's timetable_version and
+data_version; occupancy edits move bits in place, anything else rebuilds the
+index on its next query.
+"""
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import department_cache
+import timetable_slots
+
+_indexes: Dict[int, 'SubstituteIndex'] = {}
+_indexes_lock = threading.Lock()
+
+def _bits(mask: int):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+class SubstituteIndex:
+    def __init__(self, department_id: int, timetable_version: int, data_version: int, staff, rows):
+        self.department_id = department_id
+        self.timetable_version = timetable_version
+        self.data_version = data_version
+        self.staff = staff
+        self.bit_of = {member.id: bit for bit, member in enumerate(staff)}
+        self.can_teach = {}
+        for bit, member in enumerate(staff):
+            for subject_id in member.subjects_selected:
+                self.can_teach[subject_id] = self.can_teach.get(subject_id, 0) | (1 << bit)
+        self.busy = {}
+        self.load = [0] * len(staff)
+        # Lectures per (bit, day, slot); above 1 only in a clashing timetable
+        self.lectures = {}
+        for staff_id, day, time_slot in rows:
+            bit = self.bit_of.get(staff_id)
+            if bit is not None:
+                self.busy[(day, time_slot)] = self.busy.get((day, time_slot), 0) | (1 << bit)
+                self.load[bit] += 1
+                self.lectures[(bit, day, time_slot)] = self.lectures.get((bit, day, time_slot), 0) + 1
+
+    def apply_moves(self, moves: List[Tuple[int, Tuple[str, str], Tuple[str, str]]]):
+        """Move lectures given as (staff_id, (day, slot) before, (day, slot) after)
+
+        All cells are vacated before any is filled, so a swap between two
+        lectures of the same staff member keeps both cells busy.
+        """
+        known = [(self.bit_of[staff_id], source, target) for staff_id, source, target in moves
+                 if staff_id in self.bit_of]
+        for bit, source, _ in known:
+            remaining = self.lectures.get((bit, *source), 1) - 1
+            if remaining > 0:
+                self.lectures[(bit, *source)] = remaining
+            else:
+                self.lectures.pop((bit, *source), None)
+                self.busy[source] = self.busy.get(source, 0) & ~(1 << bit)
+        for bit, _, target in known:
+            self.lectures[(bit, *target)] = self.lectures.get((bit, *target), 0) + 1
+            self.busy[target] = self.busy.get(target, 0) | (1 << bit)
+
+    def find(self, subject_id: int, day: str, time_slot: str, absent_staff_id: Optional[int] = None) -> List[Dict]:
+        """Staff who can teach the subject and are free then, least loaded first"""
+        candidates = self.can_teach.get(subject_id, 0) & ~self.busy.get((day, time_slot), 0)
+        absent = self.bit_of.get(absent_staff_id)
+        if absent is not None:
+            candidates &= ~(1 << absent)
+
+        day_masks = [self.busy.get((day, slot), 0) for slot in timetable_slots.TIME_SLOTS]
+        ranked = []
+        for bit in _bits(candidates):
+            day_load = sum((mask >> bit) & 1 for mask in day_masks)
+            ranked.append((self.load[bit], day_load, self.staff[bit].name, bit))
+        ranked.sort()
+        return [{
+            'staff_id': self.staff[bit].id,
+            'name': name,
+            'staff_role': self.staff[bit].staff_role,
+            'load': load,
+            'day_load': day_load
+        } for load, day_load, name, bit in ranked]
+
+def get_index(cursor, department_id: int, name: str, timetable_version: int, data_version: int) -> SubstituteIndex:
+    """Cached index for the department, rebuilt when either version is stale"""
+    with _indexes_lock:
+        index = _indexes.get(department_id)
+    if index is not None and (index.timetable_version, index.data_version) == (timetable_version, data_version):
+        return index
+
+    model = department_cache.get_model(cursor, department_id, name, data_version)
+    cursor.execute('SELECT staff_id, day, time_slot FROM timetables WHERE department_id = ?', (department_id,))
+    index = SubstituteIndex(department_id, timetable_version, data_version, model.staff, cursor.fetchall())
+    with _indexes_lock:
+        _indexes[department_id] = index
+    return index
+
+def entries_moved(department_id: int, previous_version: int, version: int, moves):
+    """Apply committed (staff_id, (day, slot) before, (day, slot) after) moves
+
+    Only an index at previous_version is updated; any other one is dropped
+    and rebuilt on demand.
+    """
+    with _indexes_lock:
+        index = _indexes.get(department_id)
+        if index is None:
+            return
+        if index.timetable_version != previous_version:
+            del _indexes[department_id]
+            return
+        index.apply_moves(moves)
+        index.timetable_version = version
+
+def find_substitutes(cursor, entry_id: int) -> Optional[Dict]:
+    """Ranked substitutes for a timetable entry, or None if it does not exist"""
+    cursor.execute('''
+        SELECT t.department_id, t.day, t.time_slot, t.subject_id, t.staff_id,
+               d.name, d.timetable_version, d.data_version
+        FROM timetables t
+        JOIN departments d ON t.department_id = d.id
+        WHERE t.id = ?
+    ''', (entry_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    department_id, day, time_slot, subject_id, staff_id, name, timetable_version, data_version = row
+    index = get_index(cursor, department_id, name, timetable_version, data_version)
+    with _indexes_lock:
+        substitutes = index.find(subject_id, day, time_slot, staff_id)
+    return {'entry_id': entry_id, 'department_id': department_id, 'day': day, 'time_slot': time_slot,
+            'subject_id': subject_id, 'staff_id': staff_id, 'substitutes': substitutes}
+
+def invalidate(department_id: int):
+    with _indexes_lock:
+        _indexes.pop(department_id, None)
@@ -0,0 +1,93 @@
+"""Linear-time diff between a saved and a proposed timetable.
+
+A lecture is identified by (staff, subject) and placed at (day, slot,
+classroom). Entries whose full key appears in both timetables are unchanged;
+the rest are paired up by (staff, subject) as moves, and whatever is left
+over is added or removed. Every step is a dict lookup per entry, so
+campus-size timetables diff in one pass over each side.
+"""
+from typing import Dict, Iterable, List
+
+def _placement(entry: Dict) -> Dict:
+    placement = {'day': entry['day'], 'time_slot': entry['time_slot'], 'classroom_id': entry['classroom_id']}
+    if entry.get('id') is not None:
+        placement['id'] = entry['id']
+    return placement
+
+def diff_timetables(saved: Iterable[Dict], proposed: Iterable[Dict]) -> Dict:
+    """Report added, removed and moved lectures plus per-staff change counts
+
+    Both sides are dicts with staff_id, subject_id, day, time_slot and
+    classroom_id (an id is carried through when present).
+    """
+    # Saved entries by full key; identical proposed entries cancel them out
+    remaining_saved = {}
+    for entry in saved:
+        key = (entry['staff_id'], entry['subject_id'], entry['day'], entry['time_slot'], entry['classroom_id'])
+        matches = remaining_saved.get(key)
+        if matches is None:
+            remaining_saved[key] = [entry]
+        else:
+            matches.append(entry)
+
+    unchanged = 0
+    new_entries = []
+    for entry in proposed:
+        matches = remaining_saved.get(
+            (entry['staff_id'], entry['subject_id'], entry['day'], entry['time_slot'], entry['classroom_id']))
+        if matches:
+            matches.pop()
+            unchanged += 1
+        else:
+            new_entries.append(entry)
+
+    # Leftover saved entries of the same staff and subject become moves
+    old_by_lecture = {}
+    for key, entries in remaining_saved.items():
+        if entries:
+            old_by_lecture.setdefault(key[:2], []).extend(entries)
+
+    added, moved = [], []
+    per_staff = {}
+
+    def count(staff_id, change):
+        counts = per_staff.get(staff_id)
+        if counts is None:
+            counts = per_staff[staff_id] = {'added': 0, 'removed': 0, 'moved': 0}
+        counts[change] += 1
+
+    for entry in new_entries:
+        lecture = (entry['staff_id'], entry['subject_id'])
+        candidates = old_by_lecture.get(lecture)
+        if candidates:
+            previous = candidates.pop()
+            moved.append({'staff_id': lecture[0], 'subject_id': lecture[1],
+                          'from': _placement(previous), 'to': _placement(entry)})
+            count(lecture[0], 'moved')
+        else:
+            added.append({'staff_id': lecture[0], 'subject_id': lecture[1], **_placement(entry)})
+            count(lecture[0], 'added')
+
+    removed = []
+    for (staff_id, subject_id), entries in old_by_lecture.items():
+        for entry in entries:
+            removed.append({'staff_id': staff_id, 'subject_id': subject_id, **_placement(entry)})
+            count(staff_id, 'removed')
+
+    return {
+        'summary': {'unchanged': unchanged, 'added': len(added), 'removed': len(removed), 'moved': len(moved),
+                    'staff_affected': len(per_staff)},
+        'added': added,
+        'removed': removed,
+        'moved': moved,
+        'per_staff': [{'staff_id': staff_id, **counts} for staff_id, counts in per_staff.items()]
+    }
+
+def saved_entries(cursor, department_id: int) -> List[Dict]:
+    """A department's saved timetable in the shape diff_timetables expects"""
+    cursor.execute('''
+        SELECT id, day, time_slot, subject_id, staff_id, classroom_id
+        FROM timetables WHERE department_id = ?
+    ''', (department_id,))
+    return [{'id': row[0], 'day': row[1], 'time_slot': row[2], 'subject_id': row[3], 'staff_id': row[4],
+             'classroom_id': row[5]} for row in cursor.fetchall()]
@@ -0,0 +1,79 @@
+"""Compact columnar encoding of timetable entries.
+
+Row-format entries repeat staff, subject and classroom names and the day and
+slot strings on every lecture. The columnar form stores each distinct staff
+member, subject and classroom once in a dictionary table and the entries as
+parallel integer arrays indexing into them (and into days / time_slots).
+decodeColumnarTimetable in src/services/backendApi.ts reverses it.
+"""
+from typing import Dict, List
+
+from timetable_slots import DAYS, TIME_SLOTS
+
+FORMATS = ('rows', 'columnar')
+
+def to_columnar(entries: List[Dict]) -> Dict:
+    """Encode row-format timetable entries as dictionary tables plus index columns"""
+    day_index = {day: i for i, day in enumerate(DAYS)}
+    slot_index = {slot: i for i, slot in enumerate(TIME_SLOTS)}
+    staff, subjects, classrooms = {}, {}, {}
+    staff_table = {'id': [], 'name': []}
+    subject_table = {'id': [], 'name': [], 'code': []}
+    classroom_table = {'id': [], 'name': []}
+    columns = {'day': [], 'slot': [], 'staff': [], 'subject': [], 'classroom': []}
+    with_ids = any('id' in entry for entry in entries)
+    with_locks = any('locked' in entry for entry in entries)
+    if with_ids:
+        columns['id'] = []
+    if with_locks:
+        columns['locked'] = []
+
+    for entry in entries:
+        staff_id = entry['staff_id']
+        position = staff.get(staff_id)
+        if position is None:
+            position = staff[staff_id] = len(staff)
+            staff_table['id'].append(staff_id)
+            staff_table['name'].append(entry.get('staff_name'))
+        columns['staff'].append(position)
+
+        subject_id = entry['subject_id']
+        position = subjects.get(subject_id)
+        if position is None:
+            position = subjects[subject_id] = len(subjects)
+            subject_table['id'].append(subject_id)
+            subject_table['name'].append(entry.get('subject_name'))
+            subject_table['code'].append(entry.get('subject_code'))
+        columns['subject'].append(position)
+
+        classroom_id = entry['classroom_id']
+        position = classrooms.get(classroom_id)
+        if position is None:
+            position = classrooms[classroom_id] = len(classrooms)
+            classroom_table['id'].append(classroom_id)
+            classroom_table['name'].append(entry.get('classroom_name'))
+        columns['classroom'].append(position)
+
+        columns['day'].append(day_index[entry['day']])
+        columns['slot'].append(slot_index[entry['time_slot']])
+        if with_ids:
+            columns['id'].append(entry.get('id'))
+        if with_locks:
+            columns['locked'].append(1 if entry.get('locked') else 0)
+
+    return {
+        'format': 'columnar',
+        'count': len(entries),
+        'days': DAYS,
+        'time_slots': TIME_SLOTS,
+        'staff': staff_table,
+        'subjects': subject_table,
+        'classrooms': classroom_table,
+        'entries': columns
+    }
+
+def encode(entries: List[Dict], fmt: str):
+    """Timetable in the requested response format ('rows' returns entries unchanged)"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}; expected one of {', '.join(FORMATS)}")
+    return to_columnar(entries) if fmt == 'columnar' else entries
@@ -0,0 +1,10 @@
+"""Days and time slots of the teaching week.
+
+Kept apart from the solver so routes and indexes can use them without
+importing ai_timetable, which is only loaded when a solve or export runs.
+"""
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+TIME_SLOTS = [
+    '9:00-10:00', '10:00-11:00', '11:15-12:15', 
+    '12:15-1:15', '2:15-3:15', '3:15-4:15', '4:30-5:30'
+]
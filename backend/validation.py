@@ -0,0 +1,132 @@
+"""Single-pass validation of a timetable.
+
+Entries are grouped by hashed constraint keys in one pass, so validating a
+campus-wide timetable costs one scan plus a dict insert per key.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import demand
+from timetable_slots import DAYS, TIME_SLOTS
+
+# Entry tuple layout shared by the loader and validate_entries
+ENTRY_FIELDS = ('id', 'department_id', 'day', 'time_slot', 'subject_id', 'staff_id', 'classroom_id')
+
+def load_entries(cursor, department_id: Optional[int] = None) -> List[Tuple]:
+    """Saved timetable rows as ENTRY_FIELDS tuples, for one department or the campus"""
+    query = 'SELECT id, department_id, day, time_slot, subject_id, staff_id, classroom_id FROM timetables'
+    if department_id is None:
+        cursor.execute(query)
+    else:
+        cursor.execute(query + ' WHERE department_id = ?', (department_id,))
+    return cursor.fetchall()
+
+def load_reference_data(cursor, department_id: Optional[int] = None) -> Dict:
+    """Room capacities, subject enrollments and expected lectures per staff-subject"""
+    where = '' if department_id is None else ' WHERE department_id = ?'
+    params = () if department_id is None else (department_id,)
+
+    cursor.execute('SELECT id, capacity FROM classrooms' + where, params)
+    capacities = dict(cursor.fetchall())
+    cursor.execute('SELECT id, enrollment, credits, subject_type FROM subjects' + where, params)
+    subjects = cursor.fetchall()
+    enrollments = {subject_id: enrollment for subject_id, enrollment, _, _ in subjects if enrollment}
+
+    # Expected lectures follow the solver's demand model, co-taught subjects split
+    cursor.execute("SELECT id, subjects_selected FROM users WHERE role = 'staff' AND subjects_locked = 1"
+                   + ('' if department_id is None else ' AND department_id = ?'), params)
+    staff_subjects = {staff_id: {'subjects': [int(s) for s in subjects_selected.split(',')]}
+                      for staff_id, subjects_selected in cursor.fetchall() if subjects_selected}
+    vector = demand.demand_vector(staff_subjects, {
+        subject_id: {'credits': credits, 'subject_type': subject_type}
+        for subject_id, _, credits, subject_type in subjects
+    })
+    expected = {(item.staff_id, item.subject_id): item.hours for item in vector}
+
+    return {'capacities': capacities, 'enrollments': enrollments, 'expected': expected}
+
+def entries_from_dicts(entries: Iterable[Dict]) -> List[Tuple]:
+    """Convert API-shaped entries (e.g. a proposed timetable) to ENTRY_FIELDS tuples"""
+    return [(
+        entry.get('id', index),
+        entry.get('department_id'),
+        entry.get('day'),
+        entry.get('time_slot'),
+        int(entry['subject_id']),
+        int(entry['staff_id']),
+        int(entry['classroom_id'])
+    ) for index, entry in enumerate(entries)]
+
+def validate_entries(entries: List[Tuple], capacities: Dict, enrollments: Dict, expected: Dict) -> Dict:
+    """Report clashes, over-capacity rooms and missing lectures in one pass
+
+    entries are ENTRY_FIELDS tuples. capacities maps classroom id to seats,
+    enrollments maps subject id to class size, expected maps
+    (staff_id, subject_id) to the lectures that should be scheduled.
+    """
+    # First entry seen per key; clashing keys collect every entry id
+    staff_first = {}
+    room_first = {}
+    staff_clashes = {}
+    room_clashes = {}
+    scheduled = defaultdict(int)
+    valid_days = set(DAYS)
+    valid_slots = set(TIME_SLOTS)
+    over_capacity = []
+    invalid = []
+
+    for entry_id, department_id, day, time_slot, subject_id, staff_id, classroom_id in entries:
+        if day not in valid_days or time_slot not in valid_slots:
+            invalid.append({'entry_id': entry_id, 'reason': 'unknown day or time slot',
+                            'day': day, 'time_slot': time_slot})
+            continue
+
+        key = (staff_id, day, time_slot)
+        first = staff_first.setdefault(key, entry_id)
+        if first != entry_id:
+            staff_clashes.setdefault(key, [first]).append(entry_id)
+        key = (classroom_id, day, time_slot)
+        first = room_first.setdefault(key, entry_id)
+        if first != entry_id:
+            room_clashes.setdefault(key, [first]).append(entry_id)
+        scheduled[(staff_id, subject_id)] += 1
+
+        capacity = capacities.get(classroom_id)
+        if capacity is None:
+            invalid.append({'entry_id': entry_id, 'reason': 'unknown classroom', 'classroom_id': classroom_id})
+            continue
+        enrollment = enrollments.get(subject_id)
+        if enrollment and enrollment > capacity:
+            over_capacity.append({'entry_id': entry_id, 'classroom_id': classroom_id, 'subject_id': subject_id,
+                                  'capacity': capacity, 'enrollment': enrollment})
+
+    conflicts = []
+    for (staff_id, day, time_slot), ids in staff_clashes.items():
+        conflicts.append({'type': 'staff_clash', 'staff_id': staff_id, 'day': day,
+                          'time_slot': time_slot, 'entry_ids': ids})
+    for (classroom_id, day, time_slot), ids in room_clashes.items():
+        conflicts.append({'type': 'room_clash', 'classroom_id': classroom_id, 'day': day,
+                          'time_slot': time_slot, 'entry_ids': ids})
+
+    missing_lectures = []
+    for (staff_id, subject_id), needed in expected.items():
+        count = scheduled.get((staff_id, subject_id), 0)
+        if count < needed:
+            missing_lectures.append({'staff_id': staff_id, 'subject_id': subject_id,
+                                     'expected': needed, 'scheduled': count, 'missing': needed - count})
+
+    return {
+        'valid': not (conflicts or over_capacity or missing_lectures or invalid),
+        'entry_count': len(entries),
+        'conflicts': conflicts,
+        'over_capacity': over_capacity,
+        'missing_lectures': missing_lectures,
+        'invalid_entries': invalid
+    }
+
+def validate_saved_timetable(conn, department_id: Optional[int] = None) -> Dict:
+    """Validate the saved timetable of a department, or the whole campus when None"""
+    cursor = conn.cursor()
+    reference = load_reference_data(cursor, department_id)
+    entries = load_entries(cursor, department_id)
+    return validate_entries(entries, reference['capacities'], reference['enrollments'], reference['expected'])
@@ -18,6 +18,74 @@ export interface User {
   subjects_locked?: boolean;
 }
 
+export type GenerationEventType = 'queued' | 'resumed' | 'phase' | 'progress' | 'best' | 'done' | 'failed' | 'idle';
+
+export interface GenerationEvent {
+  type: GenerationEventType;
+  data: Record<string, unknown>;
+}
+
+export interface TimetableEntry {
+  id?: number;
+  day: string;
+  time_slot: string;
+  subject_id: number;
+  subject_name: string;
+  subject_code: string;
+  staff_id: number;
+  staff_name: string;
+  classroom_id: number;
+  classroom_name: string;
+  locked?: boolean;
+}
+
+// Compact timetable payload (format=columnar): dictionary tables plus parallel index arrays
+export interface ColumnarTimetable {
+  format: 'columnar';
+  count: number;
+  days: string[];
+  time_slots: string[];
+  staff: { id: number[]; name: string[] };
+  subjects: { id: number[]; name: string[]; code: string[] };
+  classrooms: { id: number[]; name: string[] };
+  entries: {
+    day: number[];
+    slot: number[];
+    staff: number[];
+    subject: number[];
+    classroom: number[];
+    id?: number[];
+    locked?: number[];
+  };
+}
+
+export function decodeColumnarTimetable(payload: ColumnarTimetable): TimetableEntry[] {
+  const { days, time_slots: timeSlots, staff, subjects, classrooms, entries } = payload;
+  const rows: TimetableEntry[] = new Array(payload.count);
+  
+  for (let i = 0; i < payload.count; i++) {
+    const s = entries.staff[i];
+    const subject = entries.subject[i];
+    const room = entries.classroom[i];
+    const row: TimetableEntry = {
+      day: days[entries.day[i]],
+      time_slot: timeSlots[entries.slot[i]],
+      subject_id: subjects.id[subject],
+      subject_name: subjects.name[subject],
+      subject_code: subjects.code[subject],
+      staff_id: staff.id[s],
+      staff_name: staff.name[s],
+      classroom_id: classrooms.id[room],
+      classroom_name: classrooms.name[room],
+    };
+    if (entries.id) row.id = entries.id[i];
+    if (entries.locked) row.locked = entries.locked[i] === 1;
+    rows[i] = row;
+  }
+  
+  return rows;
+}
+
 export interface ApiResponse<T> {
   success: boolean;
   data?: T;
@@ -220,6 +288,52 @@ class BackendApiService {
       };
     }
   }
+
+  // Timetable Generation
+  // With columnar, the compact payload is requested and decoded back into rows here
+  async generateTimetable(departmentId: string, options: { timeBudget?: number; columnar?: boolean } = {}): Promise<ApiResponse<any>> {
+    try {
+      const response = await fetch(`${API_BASE_URL}/timetable/generate`, {
+        method: 'POST',
+        headers: this.getAuthHeaders(),
+        body: JSON.stringify({
+          department_id: departmentId,
+          ...(options.timeBudget !== undefined && { time_budget: options.timeBudget }),
+          ...(options.columnar && { format: 'columnar' }),
+        }),
+      });
+      
+      const result = await this.handleResponse<any>(response);
+      if (result.success && result.data?.timetable?.format === 'columnar') {
+        result.data.timetable = decodeColumnarTimetable(result.data.timetable);
+      }
+      return result;
+    } catch (error) {
+      return {
+        success: false,
+        error: error instanceof Error ? error.message : 'Network error',
+      };
+    }
+  }
+
+  // Live progress of a department's generation run; returns a function that closes the stream
+  streamGenerationProgress(departmentId: string, onEvent: (event: GenerationEvent) => void): () => void {
+    const token = localStorage.getItem('auth_token');
+    const params = new URLSearchParams({ department_id: departmentId, ...(token && { jwt: token }) });
+    const source = new EventSource(`${API_BASE_URL}/timetable/generate/stream?${params}`);
+    const types: GenerationEventType[] = ['queued', 'resumed', 'phase', 'progress', 'best', 'done', 'failed', 'idle'];
+    
+    types.forEach((type) => {
+      source.addEventListener(type, (event) => {
+        onEvent({ type, data: JSON.parse((event as MessageEvent).data) });
+        if (type === 'done' || type === 'failed' || type === 'idle') {
+          source.close();
+        }
+      });
+    });
+    
+    return () => source.close();
+  }
 }
 
 export const backendApi = new BackendApiService();